@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+"""Benchmark tracking launches during a "make -j64" launch storm
+
+Usage:
+  benchmark_launchcounter.py
+
+Simulates a build where make keeps 64 jobs running, each being a shell
+launching a compiler, and feeds a new process snapshot per second into a
+Launchcounter.
+"""
+
+import os
+import sys
+import time
+
+
+MYDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(MYDIR, ".."))
+
+from tests import testutils  # noqa: E402
+from px import px_launchcounter  # noqa: E402
+
+# Number of simulated ptop polls
+POLLS = 200
+
+# Number of parallel make jobs
+JOBS = 64
+
+# How deep below the root of the process tree make is running
+DEPTH = 10
+
+
+def create_snapshot(base, make, first_pid):
+    """
+    Returns a process snapshot with base processes and JOBS new shell + compiler
+    pairs below make.
+    """
+    snapshot = list(base)
+    pid = first_pid
+    for _ in range(JOBS):
+        shell = testutils.create_process(pid=pid, commandline="/bin/sh -c cc")
+        shell.parent = make
+        compiler = testutils.create_process(pid=pid + 1, commandline="(cc1)")
+        compiler.parent = shell
+        snapshot += [shell, compiler]
+        pid += 2
+    return snapshot
+
+
+def main():
+    base = []
+    parent = None
+    for pid in range(1, DEPTH + 1):
+        process = testutils.create_process(
+            pid=pid, commandline=f"/usr/bin/ancestor{pid}"
+        )
+        process.parent = parent
+        base.append(process)
+        parent = process
+    make = testutils.create_process(pid=DEPTH + 1, commandline="make -j64")
+    make.parent = parent
+    base.append(make)
+
+    snapshots = []
+    next_pid = 1000
+    for _ in range(POLLS):
+        snapshots.append(create_snapshot(base, make, next_pid))
+        next_pid += 2 * JOBS
+
+    launchcounter = px_launchcounter.Launchcounter()
+    launchcounter.update(base)
+
+    t0 = time.time()
+    for snapshot in snapshots:
+        launchcounter.update(snapshot)
+    t1 = time.time()
+    dt_seconds = t1 - t0
+
+    t0 = time.time()
+    for _ in range(POLLS):
+        launchcounter.get_screen_lines(max_lines=100)
+    t1 = time.time()
+    dt_render_seconds = t1 - t0
+
+    launches = POLLS * JOBS * 2
+    print(f"Registering {launches} launches in {POLLS} polls")
+    print(f"  Update: {1000 * dt_seconds / POLLS:.2f}ms per poll")
+    print(f"  Render: {1000 * dt_render_seconds / POLLS:.2f}ms per poll")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@
      https://github.com/walles/px
 
 Usage:
-  px [--debug] [--sort=cpupercent] [--no-username] [filter string]
+  px [--debug] [--sort=cpupercent] [--no-username] [--logins] [filter string]
   px [--debug] [--no-pager] [--color] <PID>
   px [--debug] --top [filter string]
   px [--debug] --tree [filter string]
@@ -20,6 +20,12 @@ If the optional filter string parameter is specified, processes will be shown if
 * The filter matches the user name of the process
 * The filter matches a substring of the command line
 
+Filters can also be made up of multiple terms, all of which must match:
+* user:NAME, cmd:TEXT, pid:PREFIX; NAME and TEXT can be /regex/es
+* rss>1G, cpu>50%, mem>10%; < and >= / <= work as well
+
+Example: px "user:postgres cmd:/worker-[0-9]+/ rss>1G"
+
 If the optional PID parameter is specified, you'll get detailed information
 about that particular PID.
 
@@ -38,6 +44,7 @@ In --tree mode, a process tree is shown. Filtering is supported, try
 --no-pager: Print PID info to stdout rather than to a pager
 --sort=cpupercent: Order processes by CPU percentage only
 --no-username: Don't show the username column in px output
+--logins: Show who was logged in when each process started
 --color: Force color output even when piping
 --help: Print this help
 --version: Print version information
@@ -51,10 +58,12 @@ import io
 import os
 
 from . import px_pager
+from . import px_filter
 from . import px_install
 from . import px_process
 from . import px_terminal
 from . import px_processinfo
+from . import px_loginhistory
 
 from typing import Optional, List
 
@@ -176,6 +185,7 @@ def _main(argv: List[str]) -> None:
     with_pager: Optional[bool] = None
     with_color: Optional[bool] = None
     with_username = True
+    with_logins = False
     top: bool = False
     tree: bool = False
     sort_cpupercent: bool = False
@@ -215,6 +225,10 @@ def _main(argv: List[str]) -> None:
         with_username = False
         argv.remove("--no-username")
 
+    while "--logins" in argv:
+        with_logins = True
+        argv.remove("--logins")
+
     if len(argv) > 2:
         sys.stderr.write("ERROR: Expected zero or one argument but got more\n\n")
         print(__doc__, file=sys.stderr)
@@ -255,7 +269,7 @@ def _main(argv: List[str]) -> None:
             return
 
         # Page it!
-        processes = px_process.get_all()
+        processes = px_process.get_snapshot()
         process = px_processinfo.find_process_by_pid(pid, processes)
         if not process:
             sys.exit(f"No such PID: {pid}")
@@ -266,7 +280,7 @@ def _main(argv: List[str]) -> None:
         # It's a search filter and not a PID, keep moving
         pass
 
-    procs = list(filter(lambda p: p.match(search), px_process.get_all()))
+    procs = list(filter(px_filter.create_matcher(search), px_process.get_all()))
 
     columns: Optional[int] = None
     try:
@@ -284,7 +298,12 @@ def _main(argv: List[str]) -> None:
         # Put exact search matches last. Useful for "px cat" or other short
         # search strings with tons of hits.
         procs = sorted(procs, key=lambda p: p.command == search)
-    lines = px_terminal.to_screen_lines(procs, None, None, with_username)
+    if with_logins:
+        # One pass over the login history for all processes
+        logins = px_loginhistory.get_users_at_many([proc.start_time for proc in procs])
+        for proc, users in zip(procs, logins):
+            proc.set_logins(users)
+    lines = px_terminal.to_screen_lines(procs, None, None, with_username, with_logins)
 
     if columns:
         for line in lines:
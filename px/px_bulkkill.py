@@ -0,0 +1,216 @@
+"""
+Signal many processes at once, then wait for all of them to exit.
+
+Where available (Linux 5.3+ with Python 3.9+) this uses pidfds. With those the
+kernel tells us when processes exit, rather than us having to check on every
+process over and over. Also, once we have verified that a pidfd refers to the
+process we want, signals sent through it can't hit some other process that got
+the same PID later.
+
+Everywhere else we poll, and check start times right before signalling.
+"""
+
+import os
+import time
+import errno
+import datetime
+import select
+import signal
+import logging
+
+from . import px_process
+
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+
+LOG = logging.getLogger(__name__)
+
+# How often to report progress while waiting, and how often to check on
+# processes without a pidfd
+POLL_SECONDS = 0.1
+
+
+def _pidfd_open(pid: int) -> Optional[int]:
+    """
+    Returns None if this system doesn't do pidfds, or if the process is gone
+    already.
+    """
+    if not hasattr(os, "pidfd_open") or not hasattr(signal, "pidfd_send_signal"):
+        return None
+
+    try:
+        return os.pidfd_open(pid)
+    except OSError as e:
+        if e.errno not in [errno.ESRCH, errno.ENOSYS, errno.EPERM, errno.EACCES]:
+            raise
+        return None
+
+
+def _get_start_times(pids: Iterable[int]) -> Dict[int, datetime.datetime]:
+    """
+    Current start times of the processes with these PIDs, if they exist.
+    """
+    return {process.pid: process.start_time for process in px_process.get_many(pids)}
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        # Signal 0 has no effect
+        os.kill(pid, 0)
+    except OSError as e:
+        if e.errno == errno.ESRCH:
+            return False
+
+    return True
+
+
+class BulkKill:
+    """
+    Call close() when done, or use this as a context manager.
+    """
+
+    def __init__(self, processes: Iterable[px_process.PxProcess]) -> None:
+        """
+        Processes can come from an old snapshot. If a process has exited and its
+        PID has been reused since, the new process won't be touched.
+        """
+        # Processes we haven't seen exit yet, by PID
+        self._alive: Dict[int, px_process.PxProcess] = {}
+
+        # Open pidfds, by PID and the other way around
+        self._pidfds: Dict[int, int] = {}
+        self._pidfd_to_pid: Dict[int, int] = {}
+
+        self._poll = select.poll()
+
+        for process in processes:
+            if process.pid <= 0:
+                # That's the kernel, and signalling PID 0 would signal our own
+                # process group
+                continue
+
+            self._alive[process.pid] = process
+
+            pidfd = _pidfd_open(process.pid)
+            if pidfd is None:
+                continue
+
+            self._pidfds[process.pid] = pidfd
+            self._pidfd_to_pid[pidfd] = process.pid
+            self._poll.register(pidfd, select.POLLIN)
+
+        # Opening the pidfds first means that if their start times are right
+        # now, they refer to the right processes
+        start_times = _get_start_times(self._pidfds.keys())
+        for pid in list(self._pidfds.keys()):
+            if start_times.get(pid) != self._alive[pid].start_time:
+                LOG.debug("PID %d has exited, and maybe been reused", pid)
+                self._exited(pid)
+
+        LOG.debug(
+            "Bulk killing %d processes, %d with pidfds",
+            len(self._alive),
+            len(self._pidfds),
+        )
+
+    def __enter__(self) -> "BulkKill":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for pid in list(self._pidfds.keys()):
+            self._forget_pidfd(pid)
+
+    def _forget_pidfd(self, pid: int) -> None:
+        pidfd = self._pidfds.pop(pid)
+        del self._pidfd_to_pid[pidfd]
+        self._poll.unregister(pidfd)
+        os.close(pidfd)
+
+    def _exited(self, pid: int) -> None:
+        del self._alive[pid]
+        if pid in self._pidfds:
+            self._forget_pidfd(pid)
+
+    def get_alive(self) -> List[px_process.PxProcess]:
+        """
+        Processes we haven't seen exit, and haven't given up on.
+        """
+        return list(self._alive.values())
+
+    def send_signal(self, signo: int) -> List[px_process.PxProcess]:
+        """
+        Signal all processes we haven't seen exit yet.
+
+        Returns the processes we weren't allowed to signal. Those are given up
+        on and won't be waited for.
+        """
+        # Without pidfds, check for PID reuse as close to signalling as we can
+        start_times = _get_start_times(
+            pid for pid in self._alive.keys() if pid not in self._pidfds
+        )
+
+        not_allowed: List[px_process.PxProcess] = []
+        for pid, process in list(self._alive.items()):
+            try:
+                pidfd = self._pidfds.get(pid)
+                if pidfd is None:
+                    if start_times.get(pid) != process.start_time:
+                        LOG.debug("PID %d has exited, and maybe been reused", pid)
+                        self._exited(pid)
+                        continue
+                    os.kill(pid, signo)
+                else:
+                    signal.pidfd_send_signal(pidfd, signo)
+            except OSError as e:
+                if e.errno == errno.ESRCH:
+                    self._exited(pid)
+                    continue
+                if e.errno not in [errno.EPERM, errno.EACCES]:
+                    raise
+
+                not_allowed.append(process)
+                self._exited(pid)
+
+        return not_allowed
+
+    def wait(
+        self,
+        timeout_seconds: float,
+        on_progress: Optional[Callable[[int, float], None]] = None,
+    ) -> None:
+        """
+        Wait for all processes to exit, or for timeout_seconds to pass,
+        whichever comes first.
+
+        While waiting, on_progress gets called with the number of processes
+        still alive and the number of seconds left.
+        """
+        deadline = time.monotonic() + timeout_seconds
+        while self._alive:
+            seconds_left = deadline - time.monotonic()
+            if seconds_left <= 0:
+                return
+
+            if on_progress is not None:
+                on_progress(len(self._alive), seconds_left)
+
+            wait_seconds = min(POLL_SECONDS, seconds_left)
+            if self._pidfds:
+                # pidfds become readable when their processes exit
+                for pidfd, _ in self._poll.poll(wait_seconds * 1000):
+                    self._exited(self._pidfd_to_pid[pidfd])
+            else:
+                time.sleep(wait_seconds)
+
+            for pid in list(self._alive.keys()):
+                if pid in self._pidfds:
+                    continue
+                if not _is_alive(pid):
+                    self._exited(pid)
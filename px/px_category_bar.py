@@ -148,3 +148,131 @@ def cpu_by_user(length: int, all_processes: List[px_process.PxProcess]) -> str:
             create_cpu_getter(all_processes),
         ),
     )
+
+
+def _sorted_by_value(names_to_values: Dict[str, float]) -> List[Tuple[str, float]]:
+    return sorted(names_to_values.items(), key=operator.itemgetter(1), reverse=True)
+
+
+def _add(names_to_values: Dict[str, float], name: str, value: float) -> None:
+    names_to_values[name] = names_to_values.get(name, 0) + value
+
+
+class CategoryAggregates:
+    """
+    RAM, PSS, CPU and IO usage by program and by user, all computed in one pass
+    over a process snapshot.
+
+    RAM and CPU usage by control group come from the control groups themselves,
+    see px_cgroup.py, so those are passed in pre-aggregated.
+
+    Rendered bars are cached per bar length, so redrawing the same snapshot
+    after a terminal resize doesn't re-aggregate anything.
+    """
+
+    def __init__(
+        self,
+        all_processes: List[px_process.PxProcess],
+        ram_by_cgroup: Optional[List[Tuple[str, float]]] = None,
+        cpu_by_cgroup: Optional[List[Tuple[str, float]]] = None,
+    ) -> None:
+        ram_by_program: Dict[str, float] = {}
+        ram_by_user: Dict[str, float] = {}
+        cpu_time_by_program: Dict[str, float] = {}
+        cpu_time_by_user: Dict[str, float] = {}
+        cpu_percent_by_program: Dict[str, float] = {}
+        cpu_percent_by_user: Dict[str, float] = {}
+        io_by_program: Dict[str, float] = {}
+        io_by_user: Dict[str, float] = {}
+        pss_by_program: Dict[str, float] = {}
+        pss_by_user: Dict[str, float] = {}
+
+        # See create_cpu_getter() for why we need this
+        has_cpu_time = False
+
+        for process in all_processes:
+            program = process.command
+            user = process.username
+
+            _add(ram_by_program, program, process.rss_kb)
+            _add(ram_by_user, user, process.rss_kb)
+
+            cpu_time = process.cpu_time_seconds
+            if cpu_time is not None:
+                if cpu_time > 0:
+                    has_cpu_time = True
+                _add(cpu_time_by_program, program, cpu_time)
+                _add(cpu_time_by_user, user, cpu_time)
+
+            cpu_percent = process.cpu_percent
+            if cpu_percent is not None:
+                _add(cpu_percent_by_program, program, cpu_percent)
+                _add(cpu_percent_by_user, user, cpu_percent)
+
+            io_bytes_per_second = process.io_bytes_per_second
+            if io_bytes_per_second is not None:
+                _add(io_by_program, program, io_bytes_per_second)
+                _add(io_by_user, user, io_bytes_per_second)
+
+            pss_kb = process.pss_kb
+            if pss_kb is not None:
+                _add(pss_by_program, program, pss_kb)
+                _add(pss_by_user, user, pss_kb)
+
+        if not has_cpu_time:
+            cpu_time_by_program = cpu_percent_by_program
+            cpu_time_by_user = cpu_percent_by_user
+
+        self._ram_by_program = _sorted_by_value(ram_by_program)
+        self._ram_by_user = _sorted_by_value(ram_by_user)
+        self._cpu_by_program = _sorted_by_value(cpu_time_by_program)
+        self._cpu_by_user = _sorted_by_value(cpu_time_by_user)
+        self._io_by_program = _sorted_by_value(io_by_program)
+        self._io_by_user = _sorted_by_value(io_by_user)
+        self._pss_by_program = _sorted_by_value(pss_by_program)
+        self._pss_by_user = _sorted_by_value(pss_by_user)
+        self._ram_by_cgroup = ram_by_cgroup or []
+        self._cpu_by_cgroup = cpu_by_cgroup or []
+
+        # Maps (category, bar length) to a rendered bar
+        self._bars: Dict[Tuple[str, int], str] = {}
+
+    def _get_bar(
+        self, category: str, length: int, names_and_numbers: List[Tuple[str, float]]
+    ) -> str:
+        key = (category, length)
+        bar = self._bars.get(key)
+        if bar is None:
+            bar = render_bar(length, names_and_numbers)
+            self._bars[key] = bar
+        return bar
+
+    def ram_by_program(self, length: int) -> str:
+        return self._get_bar("ram_by_program", length, self._ram_by_program)
+
+    def ram_by_user(self, length: int) -> str:
+        return self._get_bar("ram_by_user", length, self._ram_by_user)
+
+    def cpu_by_program(self, length: int) -> str:
+        return self._get_bar("cpu_by_program", length, self._cpu_by_program)
+
+    def cpu_by_user(self, length: int) -> str:
+        return self._get_bar("cpu_by_user", length, self._cpu_by_user)
+
+    def io_by_program(self, length: int) -> str:
+        return self._get_bar("io_by_program", length, self._io_by_program)
+
+    def io_by_user(self, length: int) -> str:
+        return self._get_bar("io_by_user", length, self._io_by_user)
+
+    def pss_by_program(self, length: int) -> str:
+        return self._get_bar("pss_by_program", length, self._pss_by_program)
+
+    def pss_by_user(self, length: int) -> str:
+        return self._get_bar("pss_by_user", length, self._pss_by_user)
+
+    def ram_by_cgroup(self, length: int) -> str:
+        return self._get_bar("ram_by_cgroup", length, self._ram_by_cgroup)
+
+    def cpu_by_cgroup(self, length: int) -> str:
+        return self._get_bar("cpu_by_cgroup", length, self._cpu_by_cgroup)
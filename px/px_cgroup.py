@@ -0,0 +1,270 @@
+"""
+Group processes by their cgroup v2 control group, and get resource usage per
+control group.
+
+On systemd machines, control groups are services, user sessions and containers,
+which is often what you want to know about rather than individual processes.
+
+Linux only. On other systems, and on systems without cgroup v2, processes just
+don't get any control groups.
+"""
+
+import os
+import time
+import errno
+import datetime
+
+from . import px_process
+from . import px_pressure
+
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Optional
+
+
+# Where cgroup v2 lives, with the hybrid setup location last
+CGROUP_ROOTS = ["/sys/fs/cgroup", "/sys/fs/cgroup/unified"]
+
+# Processes can be moved between cgroups, by systemd-run --scope or container
+# runtimes for example, so remembered process cgroups are re-read this often
+CGROUP_REREAD_SECONDS = 5.0
+
+# Don't show pressure numbers below this percentage, they are just noise
+PRESSURE_THRESHOLD_PERCENT = 1.0
+
+# Identifies a process, PIDs can be reused
+ProcessKey = Tuple[int, datetime.datetime]
+
+
+def find_cgroup_root() -> Optional[str]:
+    """
+    Returns None if there is no cgroup v2 hierarchy.
+    """
+    for cgroup_root in CGROUP_ROOTS:
+        if os.path.exists(os.path.join(cgroup_root, "cgroup.controllers")):
+            return cgroup_root
+    return None
+
+
+def parse_proc_pid_cgroup(proc_pid_cgroup_contents: str) -> Optional[str]:
+    """
+    Returns the cgroup v2 path from /proc/<pid>/cgroup contents, or None if the
+    process isn't in any cgroup v2 group.
+
+    Example input, the v2 entry has hierarchy ID 0 and no controllers:
+      4:memory:/user.slice
+      0::/user.slice/user-1000.slice/session-2.scope
+    """
+    for line in proc_pid_cgroup_contents.splitlines():
+        if line.startswith("0::"):
+            return line[3:]
+    return None
+
+
+def read_process_cgroup(pid: int, proc_root: str = "/proc") -> Optional[str]:
+    try:
+        with open(f"{proc_root}/{pid}/cgroup", encoding="utf-8") as proc_pid_cgroup:
+            return parse_proc_pid_cgroup(proc_pid_cgroup.read())
+    except (IOError, OSError) as e:
+        if e.errno in [errno.ENOENT, errno.ESRCH, errno.EACCES, errno.EPERM]:
+            return None
+        raise
+
+
+def _read_cgroup_file(directory: str, filename: str) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, filename), encoding="utf-8") as f:
+            return f.read()
+    except (IOError, OSError) as e:
+        # Not all controllers are enabled for all groups, and groups can go
+        # away at any time
+        if e.errno in [errno.ENOENT, errno.ENODEV, errno.EOPNOTSUPP, errno.EACCES]:
+            return None
+        raise
+
+
+def parse_cpu_stat_usage(cpu_stat_contents: str) -> Optional[int]:
+    """
+    Returns usage_usec from cpu.stat contents.
+    """
+    for line in cpu_stat_contents.splitlines():
+        name, _, value = line.partition(" ")
+        if name == "usage_usec":
+            return int(value)
+    return None
+
+
+class Cgroup:
+    def __init__(self, path: str) -> None:
+        # Example: "/system.slice/docker.service"
+        self.path = path
+
+        # Example: "docker.service"
+        self.name = path.rsplit("/", 1)[-1] or "/"
+
+        self.memory_bytes: Optional[int] = None
+        self.cpu_usage_usec: Optional[int] = None
+
+        # CPU usage since the previous update, 100% means one core
+        self.cpu_percent: Optional[float] = None
+
+        # Resource ("cpu", "memory" or "io") to "some" avg10 percentage
+        self.pressure: Dict[str, float] = {}
+
+    def __repr__(self):
+        return f"Cgroup({self.path})"
+
+    def read_stats(self, cgroup_root: str) -> None:
+        directory = cgroup_root + self.path
+
+        memory_current = _read_cgroup_file(directory, "memory.current")
+        if memory_current is not None:
+            self.memory_bytes = int(memory_current)
+
+        cpu_stat = _read_cgroup_file(directory, "cpu.stat")
+        if cpu_stat is not None:
+            self.cpu_usage_usec = parse_cpu_stat_usage(cpu_stat)
+
+        for resource, _ in px_pressure.RESOURCES:
+            pressure = _read_cgroup_file(directory, resource + ".pressure")
+            if pressure is None:
+                continue
+            some = px_pressure.parse_pressure(pressure).get("some")
+            if some is not None:
+                self.pressure[resource] = some[0]
+
+    def get_display_string(self) -> str:
+        """
+        Example return value: "/system.slice/docker.service [memory 12%]"
+        """
+        display_string = self.path
+        if not self.pressure:
+            return display_string
+
+        resource, percentage = max(self.pressure.items(), key=lambda rp: rp[1])
+        if percentage < PRESSURE_THRESHOLD_PERCENT:
+            return display_string
+
+        return f"{display_string} [{resource} {percentage:.0f}%]"
+
+
+class CgroupTracker:
+    """
+    Keeps track of which processes are in which cgroups, and of how much
+    resources each cgroup uses.
+    """
+
+    def __init__(
+        self, cgroup_root: Optional[str] = None, proc_root: str = "/proc"
+    ) -> None:
+        if cgroup_root is None:
+            cgroup_root = find_cgroup_root()
+        self._cgroup_root = cgroup_root
+        self._proc_root = proc_root
+
+        # Processes don't change cgroups very often, so we remember these for
+        # CGROUP_REREAD_SECONDS. Values are cgroup paths and when we read them.
+        self._process_cgroups: Dict[ProcessKey, Tuple[Optional[str], float]] = {}
+
+        self._previous_usage_usec: Dict[str, int] = {}
+        self._previous_timestamp: Optional[float] = None
+
+        # Cgroups with processes in them, by path
+        self.cgroups: Dict[str, Cgroup] = {}
+
+    def update(
+        self, processes: List[px_process.PxProcess], now: Optional[float] = None
+    ) -> None:
+        """
+        Update cgroup stats and set cgroup information on all processes.
+        """
+        if self._cgroup_root is None:
+            return
+
+        if now is None:
+            now = time.time()
+
+        process_cgroups: Dict[ProcessKey, Tuple[Optional[str], float]] = {}
+        cgroups: Dict[str, Cgroup] = {}
+        for process in processes:
+            key = (process.pid, process.start_time)
+            cached = self._process_cgroups.get(key)
+            if cached is not None and now - cached[1] < CGROUP_REREAD_SECONDS:
+                process_cgroups[key] = cached
+                path = cached[0]
+            else:
+                path = read_process_cgroup(process.pid, self._proc_root)
+                process_cgroups[key] = (path, now)
+            if path is None:
+                continue
+
+            cgroup = cgroups.get(path)
+            if cgroup is None:
+                cgroup = Cgroup(path)
+                cgroup.read_stats(self._cgroup_root)
+                cgroups[path] = cgroup
+
+            process.set_cgroup(cgroup.path, cgroup.get_display_string())
+
+        usage_usec: Dict[str, int] = {}
+        for path, cgroup in cgroups.items():
+            if cgroup.cpu_usage_usec is None:
+                continue
+            usage_usec[path] = cgroup.cpu_usage_usec
+
+            previous_usage_usec = self._previous_usage_usec.get(path)
+            if previous_usage_usec is None or self._previous_timestamp is None:
+                # Need two samples to make a metric
+                continue
+
+            elapsed_usec = (now - self._previous_timestamp) * 1_000_000
+            if elapsed_usec > 0:
+                cgroup.cpu_percent = (
+                    100.0 * (cgroup.cpu_usage_usec - previous_usage_usec) / elapsed_usec
+                )
+
+        # Replacing these dicts also forgets about dead processes and empty
+        # cgroups
+        self._process_cgroups = process_cgroups
+        self._previous_usage_usec = usage_usec
+        self._previous_timestamp = now
+        self.cgroups = cgroups
+
+    def get_ram_by_cgroup(self) -> List[Tuple[str, float]]:
+        """
+        Returns cgroup names and their memory usage, largest first.
+        """
+        ram_by_cgroup: List[Tuple[str, float]] = []
+        for cgroup in self.cgroups.values():
+            if cgroup.memory_bytes is not None:
+                ram_by_cgroup.append((cgroup.name, float(cgroup.memory_bytes)))
+        ram_by_cgroup.sort(key=lambda name_and_bytes: name_and_bytes[1], reverse=True)
+        return ram_by_cgroup
+
+    def get_cpu_by_cgroup(self) -> List[Tuple[str, float]]:
+        """
+        Returns cgroup names and their CPU usage since the previous update,
+        busiest first.
+        """
+        cpu_by_cgroup: List[Tuple[str, float]] = []
+        for cgroup in self.cgroups.values():
+            if cgroup.cpu_percent is not None:
+                cpu_by_cgroup.append((cgroup.name, cgroup.cpu_percent))
+        cpu_by_cgroup.sort(key=lambda name_and_cpu: name_and_cpu[1], reverse=True)
+        return cpu_by_cgroup
+
+    def get_cgroup_ranks(self) -> Dict[str, int]:
+        """
+        Returns cgroup paths ranked by CPU usage and then memory usage, with the
+        busiest cgroup at rank 0.
+        """
+        ranked = sorted(
+            self.cgroups.values(),
+            key=lambda cgroup: (
+                -(cgroup.cpu_percent or 0.0),
+                -(cgroup.memory_bytes or 0),
+                cgroup.path,
+            ),
+        )
+        return {cgroup.path: rank for rank, cgroup in enumerate(ranked)}
@@ -1,6 +1,9 @@
+import bisect
+
 from . import px_process
 from . import px_file
 from typing import List
+from typing import Iterable
 from typing import Dict
 from typing import Optional
 
@@ -12,21 +15,35 @@ def _strip_leading_dash(process: px_process.PxProcess) -> str:
     return key
 
 
-class PxCwdFriends:
+def _sorted_by_command(
+    processes: List[px_process.PxProcess],
+) -> List[px_process.PxProcess]:
+    # Sort primarily by command and secondarily by PID
+    processes = sorted(processes, key=lambda process: process.pid)
+    return sorted(processes, key=_strip_leading_dash)
+
+
+class CwdIndex:
+    """
+    Which processes are in which current working directories.
+
+    Build this once per process + file snapshot, then ask it about as many
+    processes or directories as you like.
+    """
+
     def __init__(
         self,
-        process: px_process.PxProcess,
-        all_processes: List[px_process.PxProcess],
+        all_processes: Iterable[px_process.PxProcess],
         all_files: List[px_file.PxFile],
     ) -> None:
-        pid_to_process: Dict[int, px_process.PxProcess] = {}
-        for p in all_processes:
-            pid_to_process[p.pid] = p
+        """
+        Pass a px_process.ProcessSnapshot as all_processes to reuse its PID
+        index.
+        """
+        snapshot = px_process.to_snapshot(all_processes)
 
-        # Cwd can be None if lsof and process listing are out of sync
-        self.cwd: Optional[str] = None
-
-        cwd_to_processes: Dict[str, List[px_process.PxProcess]] = {}
+        self._pid_to_cwd: Dict[int, str] = {}
+        self._cwd_to_processes: Dict[str, List[px_process.PxProcess]] = {}
         for current_file in all_files:
             if not current_file.name:
                 continue
@@ -34,35 +51,94 @@ class PxCwdFriends:
             if current_file.fdtype != "cwd":
                 continue
 
-            if current_file.pid == process.pid:
-                self.cwd = current_file.name
+            self._pid_to_cwd[current_file.pid] = current_file.name
 
             if current_file.name == "/":
                 # This is too common, no point in doing this one
                 continue
 
-            file_processes = cwd_to_processes.get(current_file.name)
-            if file_processes is None:
-                file_processes = []
+            file_process = snapshot.get_by_pid(current_file.pid)
+            if file_process is None:
+                # Process could be None because there's no way for us to get a
+                # process listing and a file listing that are guaranteed to be
+                # in sync
+                continue
+
+            file_processes = self._cwd_to_processes.setdefault(current_file.name, [])
+            file_processes.append(file_process)
+
+        # For finding all directories under some path, see get_processes_under()
+        self._sorted_cwds = sorted(self._cwd_to_processes.keys())
+
+    def get_cwd(self, pid: int) -> Optional[str]:
+        """
+        Returns None if we don't know the current directory of this process.
+        """
+        return self._pid_to_cwd.get(pid)
+
+    def get_processes_in(self, cwd: str) -> List[px_process.PxProcess]:
+        """
+        All processes with this exact current directory, except for "/" which
+        is too common to be interesting and will always give an empty list.
+        """
+        return list(self._cwd_to_processes.get(cwd, []))
+
+    def get_processes_under(self, path: str) -> List[px_process.PxProcess]:
+        """
+        All processes with a current directory at or below path, sorted by
+        command and PID.
 
-            file_process = pid_to_process.get(current_file.pid)
-            if file_process is not None:
-                # Process could be None because there's no way for uss to get a process listing
-                # a file listing that can be guaranteed to be in sync
-                file_processes.append(file_process)
-                cwd_to_processes[current_file.name] = file_processes
+        Processes in "/" are never included.
+        """
+        path = path.rstrip("/")
 
-        if self.cwd is None:
-            friends: List[px_process.PxProcess] = []
-        elif self.cwd in cwd_to_processes:
-            friends = cwd_to_processes[self.cwd]
-        else:
-            friends = []
+        processes: List[px_process.PxProcess] = []
 
+        # All directories below path start with path, and those are all next to
+        # each other in the sorted list. Not all of them are below path though:
+        # "/srv/app-old" is in between "/srv/app" and "/srv/app/web".
+        start = bisect.bisect_left(self._sorted_cwds, path)
+        for cwd in self._sorted_cwds[start:]:
+            if not cwd.startswith(path):
+                break
+            if len(cwd) > len(path) and cwd[len(path)] != "/":
+                continue
+            processes += self._cwd_to_processes[cwd]
+
+        return _sorted_by_command(processes)
+
+    def get_friends(self, process: px_process.PxProcess) -> List[px_process.PxProcess]:
+        """
+        Other processes in the same current directory as process, sorted by
+        command and PID.
+        """
+        cwd = self.get_cwd(process.pid)
+        if cwd is None:
+            return []
+
+        friends = self.get_processes_in(cwd)
         if process in friends:
             friends.remove(process)
 
-        # Sort primarily by command and secondarily by PID
-        friends = sorted(friends, key=lambda friend: friend.pid)
-        friends = sorted(friends, key=_strip_leading_dash)
-        self.friends: List[px_process.PxProcess] = friends
+        return _sorted_by_command(friends)
+
+
+class PxCwdFriends:
+    def __init__(
+        self,
+        process: px_process.PxProcess,
+        all_processes: Iterable[px_process.PxProcess],
+        all_files: List[px_file.PxFile],
+        cwd_index: Optional[CwdIndex] = None,
+    ) -> None:
+        """
+        Pass a cwd_index if you have one, otherwise one will be built from
+        all_processes and all_files.
+        """
+        if cwd_index is None:
+            cwd_index = CwdIndex(all_processes, all_files)
+
+        # Cwd can be None if lsof and process listing are out of sync
+        self.cwd: Optional[str] = cwd_index.get_cwd(process.pid)
+
+        self.friends: List[px_process.PxProcess] = cwd_index.get_friends(process)
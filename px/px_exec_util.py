@@ -1,8 +1,14 @@
 import os
+import time
+import codecs
+import select
+import threading
 import subprocess
 
 from typing import List
 from typing import Dict
+from typing import Iterator
+from typing import Optional
 
 
 ENV: Dict[str, str] = {}
@@ -13,14 +19,188 @@ for name, value in os.environ.items():
         continue
     ENV[name] = value
 
+# How often run() and StreamingRun check whether they have been cancelled
+CANCEL_POLL_SECONDS = 0.1
+
+# How much to read from a StreamingRun command at a time
+READ_CHUNK_BYTES = 65536
+
+
+class CancelledError(Exception):
+    """
+    Raised by run() and StreamingRun if they get cancelled before their command
+    is done.
+    """
+
+
+def run(
+    command: List[str],
+    check_exitcode: bool = False,
+    cancel: Optional[threading.Event] = None,
+) -> str:
+    """
+    If the cancel event gets set before the command is done, the command is
+    killed and CancelledError is raised.
+    """
+    if cancel is not None and cancel.is_set():
+        raise CancelledError(command)
 
-def run(command: List[str], check_exitcode: bool = False) -> str:
     with subprocess.Popen(
         command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=ENV
     ) as execution:
-        stdout = execution.communicate()[0].decode("utf-8")
+        if cancel is None:
+            stdout_bytes = execution.communicate()[0]
+        else:
+            while True:
+                try:
+                    stdout_bytes = execution.communicate(timeout=CANCEL_POLL_SECONDS)[0]
+                    break
+                except subprocess.TimeoutExpired:
+                    if cancel.is_set():
+                        execution.kill()
+                        execution.wait()
+                        raise CancelledError(command)
+
+        stdout = stdout_bytes.decode("utf-8")
 
         if check_exitcode and execution.returncode != 0:
             raise subprocess.CalledProcessError(execution.returncode, command)
 
         return stdout
+
+
+class StreamingRun:
+    """
+    Run a command and iterate over its output one record at a time, as the
+    output arrives. Records are lines by default, pass separator="\0" for NUL
+    separated output.
+
+    If the command runs for longer than timeout_seconds, or produces more than
+    max_output_bytes of output, it gets killed and iteration ends early. You
+    still get all complete records up to that point, and afterwards timed_out
+    or truncated will be True.
+
+    If the cancel event gets set, the command is killed and CancelledError is
+    raised.
+
+    Breaking out of the iteration early also kills the command.
+    """
+
+    def __init__(
+        self,
+        command: List[str],
+        separator: str = "\n",
+        timeout_seconds: Optional[float] = None,
+        max_output_bytes: Optional[int] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> None:
+        self._command = command
+        self._separator = separator
+        self._timeout_seconds = timeout_seconds
+        self._max_output_bytes = max_output_bytes
+        self._cancel = cancel
+
+        self.timed_out = False
+        self.truncated = False
+
+        # None until the command is done
+        self.returncode: Optional[int] = None
+
+    @property
+    def complete(self) -> bool:
+        """
+        False if we gave up on the command before it was done.
+        """
+        return not (self.timed_out or self.truncated)
+
+    def __iter__(self) -> Iterator[str]:
+        if self._cancel is not None and self._cancel.is_set():
+            raise CancelledError(self._command)
+
+        deadline: Optional[float] = None
+        if self._timeout_seconds is not None:
+            deadline = time.monotonic() + self._timeout_seconds
+
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        byte_count = 0
+        pending = ""
+
+        with subprocess.Popen(
+            self._command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=ENV,
+        ) as execution:
+            assert execution.stdout is not None
+            stdout_fd = execution.stdout.fileno()
+            try:
+                while True:
+                    wait_seconds = CANCEL_POLL_SECONDS
+                    if deadline is not None:
+                        remaining_seconds = deadline - time.monotonic()
+                        if remaining_seconds <= 0:
+                            self.timed_out = True
+                            break
+                        wait_seconds = min(wait_seconds, remaining_seconds)
+
+                    readable, _, _ = select.select([stdout_fd], [], [], wait_seconds)
+                    if self._cancel is not None and self._cancel.is_set():
+                        raise CancelledError(self._command)
+                    if not readable:
+                        continue
+
+                    chunk = os.read(stdout_fd, READ_CHUNK_BYTES)
+                    if not chunk:
+                        # End of output, the last record doesn't need a
+                        # separator after it
+                        pending += decoder.decode(b"", final=True)
+                        if pending:
+                            yield pending
+                        self._wait_for_exit(execution, deadline)
+                        break
+
+                    if self._max_output_bytes is not None:
+                        bytes_left = self._max_output_bytes - byte_count
+                        if len(chunk) > bytes_left:
+                            chunk = chunk[:bytes_left]
+                            self.truncated = True
+                    byte_count += len(chunk)
+
+                    records = (pending + decoder.decode(chunk)).split(self._separator)
+
+                    # The last one is incomplete, or empty if the chunk ended
+                    # with a separator
+                    pending = records.pop()
+                    yield from records
+
+                    if self.truncated:
+                        break
+            finally:
+                if execution.poll() is None:
+                    execution.kill()
+                self.returncode = execution.wait()
+
+    def _wait_for_exit(
+        self, execution: "subprocess.Popen[bytes]", deadline: Optional[float]
+    ) -> None:
+        """
+        Closing its output doesn't mean the command is done, give it until the
+        deadline to exit on its own.
+        """
+        while True:
+            wait_seconds = CANCEL_POLL_SECONDS
+            if deadline is not None:
+                remaining_seconds = deadline - time.monotonic()
+                if remaining_seconds <= 0:
+                    self.timed_out = True
+                    return
+                wait_seconds = min(wait_seconds, remaining_seconds)
+
+            try:
+                execution.wait(timeout=wait_seconds)
+                return
+            except subprocess.TimeoutExpired:
+                pass
+
+            if self._cancel is not None and self._cancel.is_set():
+                raise CancelledError(self._command)
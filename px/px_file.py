@@ -1,12 +1,25 @@
 import socket
+import logging
+import threading
 
 from . import px_exec_util
 
 from typing import Set
+from typing import Iterable
 from typing import List
 from typing import Tuple
 from typing import Optional
 
+LOG = logging.getLogger(__name__)
+
+# lsof can take tens of seconds on a big system. Taking longer than this means
+# it's probably stuck, on something like a stale NFS mount, and a partial file
+# list is more useful than making the user wait for minutes.
+LSOF_TIMEOUT_SECONDS = 30
+
+# Big systems can have millions of open files
+LSOF_MAX_OUTPUT_BYTES = 1024**3
+
 
 class PxFile:
     def __init__(self, pid: int, filetype: str) -> None:
@@ -192,26 +205,42 @@ def resolve_endpoint(endpoint: str) -> str:
     return host + ":" + port
 
 
-def call_lsof():
+def call_lsof(cancel: Optional[threading.Event] = None) -> px_exec_util.StreamingRun:
     """
-    Call lsof and return the result as one big string
+    Start lsof. Iterate over the result to get its output one NUL separated
+    field at a time, as lsof produces it.
+
+    Setting the cancel event kills lsof, see px_exec_util.StreamingRun.
     """
     # See OUTPUT FOR OTHER PROGRAMS: http://linux.die.net/man/8/lsof
     # Output lines can be in one of two formats:
     # 1. "pPID@" (with @ meaning NUL)
     # 2. "fFD@aACCESSMODE@tTYPE@nNAME@"
-    return px_exec_util.run(["lsof", "-n", "-F", "fnaptd0i"])
+    return px_exec_util.StreamingRun(
+        ["lsof", "-n", "-F", "fnaptd0i"],
+        separator="\0",
+        timeout_seconds=LSOF_TIMEOUT_SECONDS,
+        max_output_bytes=LSOF_MAX_OUTPUT_BYTES,
+        cancel=cancel,
+    )
 
 
 def lsof_to_files(lsof: str) -> List[PxFile]:
     """
     Convert lsof output into a files array.
     """
+    return lsof_fields_to_files(lsof.split("\0"))
+
+
+def lsof_fields_to_files(shards: Iterable[str]) -> List[PxFile]:
+    """
+    Convert NUL separated lsof output fields into a files array.
+    """
 
     pid = None
     file_builder: Optional[PxFileBuilder] = None
     files: List[PxFile] = []
-    for shard in lsof.split("\0"):
+    for shard in shards:
         if shard[0] == "\n":
             # Some shards start with newlines. Looks pretty when viewing the
             # lsof output in moar, but makes the parsing code have to deal with
@@ -272,11 +301,35 @@ def lsof_to_files(lsof: str) -> List[PxFile]:
     return files
 
 
-def get_all() -> Set[PxFile]:
+def get_all(cancel: Optional[threading.Event] = None) -> Set[PxFile]:
     """
     Get all files.
 
-    If a file_types array is specified, only files of the listed types will be
-    returned.
+    Setting the cancel event makes this raise px_exec_util.CancelledError.
+    """
+    return get_all_with_warning(cancel)[0]
+
+
+def get_all_with_warning(
+    cancel: Optional[threading.Event] = None,
+) -> Tuple[Set[PxFile], Optional[str]]:
+    """
+    Get all files, and a warning if that list is incomplete. The warning is None
+    if lsof completed normally.
+
+    Setting the cancel event makes this raise px_exec_util.CancelledError.
     """
-    return set(lsof_to_files(call_lsof()))
+    lsof = call_lsof(cancel)
+    files = set(lsof_fields_to_files(lsof))
+
+    warning: Optional[str] = None
+    if lsof.timed_out:
+        warning = (
+            f"lsof timed out after {LSOF_TIMEOUT_SECONDS}s, file list is incomplete"
+        )
+    elif lsof.truncated:
+        warning = "lsof output too large, file list is incomplete"
+    if warning is not None:
+        LOG.warning(warning)
+
+    return (files, warning)
@@ -0,0 +1,233 @@
+"""
+Compile px / ptop / pxtree filter strings into process matchers.
+
+A filter is a whitespace separated list of terms. A process is shown if it
+matches all terms. Example:
+
+  user:postgres cmd:/worker-\\d+/ rss>1G cpu>50%
+
+Supported terms:
+* user:NAME - Process is owned by NAME. NAME can also be a /regex/.
+* cmd:TEXT - TEXT is a substring of the command line. TEXT can also be a /regex/.
+* pid:PREFIX - The PID starts with PREFIX
+* rss>SIZE - Resident memory is larger than SIZE bytes. SIZE can have a K, M, G
+  or T suffix. Also available: <, >= and <=.
+* cpu>PERCENT - CPU usage is above PERCENT, the % suffix is optional.
+* mem>PERCENT - Memory usage is above PERCENT, the % suffix is optional.
+
+Any other term is matched using PxProcess.match().
+
+Filters without any of the above terms are matched as one single string, so
+"px Google Chrome" still works the way it always has. The same goes for filters
+that fail to parse, like half typed regexes in ptop.
+"""
+
+import re
+import functools
+import operator
+
+from . import px_process
+
+from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+
+Matcher = Callable[[px_process.PxProcess], bool]
+
+# Match + group: "user:johan"
+KEY_VALUE_TERM = re.compile(r"^(user|cmd|pid):(.*)$")
+
+# Match + group: "rss>=1.5G"
+COMPARISON_TERM = re.compile(r"^(rss|cpu|mem)(>=|<=|>|<)(.*)$")
+
+# Match + group: "1.5G"
+SIZE = re.compile(r"^([0-9]+(?:\.[0-9]+)?)([KMGT]?)B?$", re.IGNORECASE)
+
+# Match + group: "50%"
+PERCENTAGE = re.compile(r"^([0-9]+(?:\.[0-9]+)?)%?$")
+
+OPERATORS = {
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+}
+
+SIZE_MULTIPLIERS = {
+    "": 1,
+    "K": 1024**1,
+    "M": 1024**2,
+    "G": 1024**3,
+    "T": 1024**4,
+}
+
+# Predicates are evaluated cheapest first, so that numeric comparisons can rule
+# processes out before we start scanning strings.
+COST_NUMERIC = 0
+COST_STRING = 1
+COST_REGEX = 2
+
+
+class FilterError(ValueError):
+    pass
+
+
+def _match_all(search: str, require_exact_user: bool) -> Matcher:
+    return lambda process: bool(process.match(search, require_exact_user))
+
+
+def _parse_size_kb(size: str) -> float:
+    match = SIZE.match(size)
+    if not match:
+        raise FilterError(f"Unparsable size: <{size}>")
+
+    multiplier = SIZE_MULTIPLIERS[match.group(2).upper()]
+    return float(match.group(1)) * multiplier / 1024
+
+
+def _parse_percentage(percentage: str) -> float:
+    match = PERCENTAGE.match(percentage)
+    if not match:
+        raise FilterError(f"Unparsable percentage: <{percentage}>")
+
+    return float(match.group(1))
+
+
+def _compile_regex(value: str) -> Optional["re.Pattern[str]"]:
+    """
+    Returns a compiled regex if value is on the form /regex/, None otherwise.
+    """
+    if len(value) < 2 or value[0] != "/" or value[-1] != "/":
+        return None
+
+    try:
+        return re.compile(value[1:-1])
+    except re.error as e:
+        raise FilterError(f"Bad regex <{value}>: {e}") from e
+
+
+def _create_comparison(key: str, op: str, value: str) -> Tuple[int, Matcher]:
+    compare = OPERATORS[op]
+
+    if key == "rss":
+        limit_kb = _parse_size_kb(value)
+        return (COST_NUMERIC, lambda p: bool(compare(p.rss_kb, limit_kb)))
+
+    limit_percent = _parse_percentage(value)
+    if key == "cpu":
+
+        def cpu_matcher(p: px_process.PxProcess) -> bool:
+            return p.cpu_percent is not None and compare(p.cpu_percent, limit_percent)
+
+        return (COST_NUMERIC, cpu_matcher)
+
+    assert key == "mem"
+
+    def mem_matcher(p: px_process.PxProcess) -> bool:
+        return p.memory_percent is not None and compare(p.memory_percent, limit_percent)
+
+    return (COST_NUMERIC, mem_matcher)
+
+
+def _create_key_value(
+    key: str, value: str, require_exact_user: bool
+) -> Tuple[int, Matcher]:
+    if not value:
+        raise FilterError(f"No value for <{key}:>")
+
+    if key == "pid":
+        if not value.isdigit():
+            raise FilterError(f"PIDs are numeric: <{value}>")
+        return (COST_STRING, lambda p: str(p.pid).startswith(value))
+
+    regex = _compile_regex(value)
+
+    if key == "user":
+        if regex is not None:
+            search_user = regex.search
+            return (COST_REGEX, lambda p: search_user(p.username) is not None)
+        if require_exact_user:
+            return (COST_STRING, lambda p: p.username == value)
+        return (COST_STRING, lambda p: p.username.startswith(value))
+
+    assert key == "cmd"
+    if regex is not None:
+        search_cmdline = regex.search
+        return (COST_REGEX, lambda p: search_cmdline(p.cmdline) is not None)
+
+    lowercase_value = value.lower()
+    return (
+        COST_STRING,
+        lambda p: value in p.cmdline or lowercase_value in p.cmdline.lower(),
+    )
+
+
+def _create_predicates(search: str, require_exact_user: bool) -> List[Matcher]:
+    """
+    Parse search into a list of predicates, cheapest first.
+
+    Raises FilterError if search contains terms we fail to parse.
+    """
+    costs_and_predicates: List[Tuple[int, Matcher]] = []
+    for term in search.split():
+        match = COMPARISON_TERM.match(term)
+        if match:
+            costs_and_predicates.append(
+                _create_comparison(match.group(1), match.group(2), match.group(3))
+            )
+            continue
+
+        match = KEY_VALUE_TERM.match(term)
+        if match:
+            costs_and_predicates.append(
+                _create_key_value(match.group(1), match.group(2), require_exact_user)
+            )
+            continue
+
+        costs_and_predicates.append((COST_STRING, _match_all(term, require_exact_user)))
+
+    # Stable sort, predicates of the same cost stay in user order
+    costs_and_predicates.sort(key=operator.itemgetter(0))
+    return [predicate for _, predicate in costs_and_predicates]
+
+
+def _is_structured(search: str) -> bool:
+    for term in search.split():
+        if COMPARISON_TERM.match(term) or KEY_VALUE_TERM.match(term):
+            return True
+    return False
+
+
+@functools.lru_cache(maxsize=32)
+def create_matcher(search: Optional[str], require_exact_user: bool = True) -> Matcher:
+    """
+    Compile a filter string into a function telling whether or not a process
+    matches the filter.
+
+    Compiled matchers are cached, so calling this once per redraw in ptop is
+    fine.
+    """
+    if not search:
+        return lambda process: True
+
+    if not _is_structured(search):
+        return _match_all(search, require_exact_user)
+
+    try:
+        predicates = _create_predicates(search, require_exact_user)
+    except FilterError:
+        # Probably a half typed ptop search, fall back to plain matching
+        return _match_all(search, require_exact_user)
+
+    if len(predicates) == 1:
+        return predicates[0]
+
+    def matcher(process: px_process.PxProcess) -> bool:
+        for predicate in predicates:
+            if not predicate(process):
+                return False
+        return True
+
+    return matcher
@@ -3,11 +3,15 @@ Functions for visualizing where IO is bottlenecking.
 """
 
 import datetime
+import array
 import math
 import re
 import os
+import logging
 
+from . import px_load
 from . import px_units
+from . import px_procfs
 from . import px_terminal
 from . import px_exec_util
 
@@ -16,6 +20,7 @@ from typing import Dict
 from typing import Tuple
 from typing import Optional
 
+LOG = logging.getLogger(__name__)
 
 # Matches output lines in "netstat -ib" on macOS.
 #
@@ -28,26 +33,44 @@ NETSTAT_IB_LINE_RE = re.compile(
     r"^([^ ]+).*[0-9]+ +([0-9]+) +[0-9]+ +[0-9]+ +([0-9]+) +[0-9]+$"
 )
 
-# Parse a line from /proc/net/dev.
+# Field indices in /proc/net/dev lines, counting from after the "eth0:" prefix.
 #
 # Example input (includes leading whitespace):
 #   eth0: 29819439   19890    0    0    0     0          0         0   364327    6584    0    0    0     0       0          0
-PROC_NET_DEV_RE = re.compile(
-    r"^ *([^:]+): +([0-9]+) +[0-9]+ +[0-9]+ +[0-9]+ +[0-9]+ +[0-9]+ +[0-9]+ +[0-9]+ +([0-9]+)[0-9 ]+$"
-)
+PROC_NET_DEV_RECEIVE_BYTES = 0
+PROC_NET_DEV_TRANSMIT_BYTES = 8
+PROC_NET_DEV_FIELD_COUNT = 16
 
-# Parse a line from /proc/diskstats
-#
-# First group is the name. To get partitions rather than disks we require the
-# name to end in a number.
-#
-# Second and third groups are sector reads and writes respectively.
-#
-# Line format documented here:
+# Field indices in /proc/diskstats lines. Format documented here:
 # https://www.kernel.org/doc/Documentation/admin-guide/iostats.rst
-PROC_DISKSTATS_RE = re.compile(
-    r"^ *[0-9]+ +[0-9]+ ([a-z]+[0-9]+) [0-9]+ [0-9]+ ([0-9]+) [0-9]+ [0-9]+ [0-9]+ ([0-9]+) .*"
-)
+PROC_DISKSTATS_NAME = 2
+PROC_DISKSTATS_SECTORS_READ = 5
+PROC_DISKSTATS_SECTORS_WRITTEN = 9
+PROC_DISKSTATS_READS_COMPLETED = 3
+PROC_DISKSTATS_MS_READING = 6
+PROC_DISKSTATS_WRITES_COMPLETED = 7
+PROC_DISKSTATS_MS_WRITING = 10
+PROC_DISKSTATS_IN_FLIGHT = 11
+PROC_DISKSTATS_MS_DOING_IO = 12
+PROC_DISKSTATS_WEIGHTED_MS_DOING_IO = 13
+
+# Where Linux lists block devices. Partitions have a "partition" file in their
+# directories here.
+SYS_CLASS_BLOCK = "/sys/class/block"
+
+# Partition names, for when sysfs doesn't know about a device. Drives named
+# after disk controllers get numbers appended ("sda1"), drives with names ending
+# in a digit get "p" and a number appended ("nvme0n1p1", "mmcblk0p1").
+PARTITION_NAME_RE = re.compile(r"^((sd|hd|vd|xvd)[a-z]+[0-9]+|.*[0-9]p[0-9]+)$")
+
+# How many throughput samples we keep per device for the history graph. Two
+# samples per character, at one sample per second this is 15 characters showing
+# the last 30 seconds.
+HISTORY_LENGTH = 30
+
+# We sample once per second on macOS, so if netstat or iostat takes longer than
+# this something is wrong
+SAMPLE_TIMEOUT_SECONDS = 5.0
 
 
 class Sample:
@@ -117,13 +140,18 @@ def parse_proc_net_dev(proc_net_dev_contents: str) -> List[Sample]:
     """
     return_me: List[Sample] = []
     for line in proc_net_dev_contents.splitlines():
-        match = PROC_NET_DEV_RE.match(line)
-        if not match:
+        name, colon, numbers = line.partition(":")
+        if not colon:
+            # Header line
+            continue
+
+        fields = numbers.split()
+        if len(fields) != PROC_NET_DEV_FIELD_COUNT:
             continue
 
-        name = match.group(1)
-        incoming = int(match.group(2))
-        outgoing = int(match.group(3))
+        name = name.strip()
+        incoming = int(fields[PROC_NET_DEV_RECEIVE_BYTES])
+        outgoing = int(fields[PROC_NET_DEV_TRANSMIT_BYTES])
         if incoming == 0 and outgoing == 0:
             continue
 
@@ -133,28 +161,215 @@ def parse_proc_net_dev(proc_net_dev_contents: str) -> List[Sample]:
     return return_me
 
 
-def parse_proc_diskstats(proc_diskstats_contents: str) -> List[Sample]:
+# (sys_class_block, device name) to whether that device is a partition. Device
+# names don't change between being drives and partitions, so we only need to
+# look each one up once.
+_is_partition_cache: Dict[Tuple[str, str], bool] = {}
+
+
+def _is_partition(name: str, sys_class_block: str = SYS_CLASS_BLOCK) -> bool:
     """
-    Parse /proc/net/dev contents into a list of samples.
+    Ask sysfs whether a block device is a partition, or go by its name if
+    sysfs doesn't know.
     """
-    return_me: List[Sample] = []
+    cache_key = (sys_class_block, name)
+    cached = _is_partition_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    device_directory = os.path.join(sys_class_block, name)
+    if os.path.isdir(device_directory):
+        is_partition = os.path.exists(os.path.join(device_directory, "partition"))
+    else:
+        is_partition = PARTITION_NAME_RE.match(name) is not None
+
+    _is_partition_cache[cache_key] = is_partition
+    return is_partition
+
+
+class DiskStat:
+    """
+    Cumulative request counts and timings for one drive, from /proc/diskstats.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests: int,
+        request_ms: int,
+        in_flight: int,
+        io_ms: int,
+        weighted_io_ms: int,
+    ) -> None:
+        self.name = name
+
+        # Completed reads plus completed writes
+        self.requests = requests
+
+        # Total time spent by completed requests
+        self.request_ms = request_ms
+
+        # Number of requests currently in flight. Not cumulative.
+        self.in_flight = in_flight
+
+        # Time during which the drive has had requests in flight
+        self.io_ms = io_ms
+
+        # Time doing IO, multiplied by the number of requests in flight
+        self.weighted_io_ms = weighted_io_ms
+
+    def __repr__(self):
+        return f'DiskStat[name="{self.name}", requests={self.requests}]'
+
+    def __eq__(self, o):
+        return self.__dict__ == o.__dict__
+
+
+class DiskUtilization:
+    def __init__(
+        self,
+        name: str,
+        utilization_percent: float,
+        average_wait_ms: Optional[float],
+        average_queue_length: float,
+        in_flight: int,
+    ) -> None:
+        self.name = name
+
+        # How much of the time the drive had requests in flight, 0-100
+        self.utilization_percent = utilization_percent
+
+        # None if no requests completed since the last sample
+        self.average_wait_ms = average_wait_ms
+
+        self.average_queue_length = average_queue_length
+        self.in_flight = in_flight
+
+    def __repr__(self):
+        return (
+            f'DiskUtilization[name="{self.name}", '
+            + f"util={self.utilization_percent:.1f}%]"
+        )
+
+
+def parse_proc_diskstats_all(
+    proc_diskstats_contents: str, sys_class_block: str = SYS_CLASS_BLOCK
+) -> Tuple[List[Sample], List[DiskStat]]:
+    """
+    Parse /proc/diskstats contents into per partition throughput samples and
+    per drive request counts and timings.
+
+    Partitions are used for throughput and whole drives for utilization, so
+    that nothing gets counted twice. Unused devices are skipped.
+    """
+    samples: List[Sample] = []
+    disk_stats: List[DiskStat] = []
     for line in proc_diskstats_contents.splitlines():
-        match = PROC_DISKSTATS_RE.match(line)
-        if not match:
+        fields = line.split()
+        if len(fields) <= PROC_DISKSTATS_SECTORS_WRITTEN:
             continue
 
-        name = match.group(1)
-        read_sectors = int(match.group(2))
-        write_sectors = int(match.group(3))
-        if read_sectors == 0 and write_sectors == 0:
+        name = fields[PROC_DISKSTATS_NAME]
+        if _is_partition(name, sys_class_block):
+            read_sectors = int(fields[PROC_DISKSTATS_SECTORS_READ])
+            write_sectors = int(fields[PROC_DISKSTATS_SECTORS_WRITTEN])
+            if read_sectors == 0 and write_sectors == 0:
+                continue
+
+            # Multiply by 512 to get bytes from sectors:
+            # https://stackoverflow.com/a/38136179/473672
+            samples.append(Sample(name + " read", read_sectors * 512))
+            samples.append(Sample(name + " write", write_sectors * 512))
             continue
 
-        # Multiply by 512 to get bytes from sectors:
-        # https://stackoverflow.com/a/38136179/473672
-        return_me.append(Sample(name + " read", read_sectors * 512))
-        return_me.append(Sample(name + " write", write_sectors * 512))
+        if len(fields) <= PROC_DISKSTATS_WEIGHTED_MS_DOING_IO:
+            continue
 
-    return return_me
+        requests = int(fields[PROC_DISKSTATS_READS_COMPLETED]) + int(
+            fields[PROC_DISKSTATS_WRITES_COMPLETED]
+        )
+        if requests == 0:
+            continue
+
+        request_ms = int(fields[PROC_DISKSTATS_MS_READING]) + int(
+            fields[PROC_DISKSTATS_MS_WRITING]
+        )
+        disk_stats.append(
+            DiskStat(
+                name,
+                requests,
+                request_ms,
+                int(fields[PROC_DISKSTATS_IN_FLIGHT]),
+                int(fields[PROC_DISKSTATS_MS_DOING_IO]),
+                int(fields[PROC_DISKSTATS_WEIGHTED_MS_DOING_IO]),
+            )
+        )
+
+    return samples, disk_stats
+
+
+def parse_proc_diskstats(
+    proc_diskstats_contents: str, sys_class_block: str = SYS_CLASS_BLOCK
+) -> List[Sample]:
+    """
+    Parse /proc/diskstats contents into a list of per partition samples.
+    """
+    return parse_proc_diskstats_all(proc_diskstats_contents, sys_class_block)[0]
+
+
+def parse_proc_diskstats_utilization(
+    proc_diskstats_contents: str, sys_class_block: str = SYS_CLASS_BLOCK
+) -> List[DiskStat]:
+    """
+    Parse /proc/diskstats contents into per drive request counts and timings.
+
+    Partitions and drives that have never been used are skipped.
+    """
+    return parse_proc_diskstats_all(proc_diskstats_contents, sys_class_block)[1]
+
+
+def compute_disk_utilizations(
+    previous: List[DiskStat], current: List[DiskStat], seconds: float
+) -> List[DiskUtilization]:
+    """
+    Compute drive utilizations from two samples taken some seconds apart.
+    """
+    assert seconds > 0
+    elapsed_ms = seconds * 1000
+
+    previous_by_name = {disk_stat.name: disk_stat for disk_stat in previous}
+
+    utilizations: List[DiskUtilization] = []
+    for disk_stat in current:
+        previous_stat = previous_by_name.get(disk_stat.name)
+        if previous_stat is None:
+            # Need two samples to make a metric
+            continue
+
+        io_ms = disk_stat.io_ms - previous_stat.io_ms
+        utilization_percent = min(100.0, 100.0 * io_ms / elapsed_ms)
+
+        average_wait_ms: Optional[float] = None
+        requests = disk_stat.requests - previous_stat.requests
+        if requests > 0:
+            average_wait_ms = (
+                disk_stat.request_ms - previous_stat.request_ms
+            ) / requests
+
+        weighted_io_ms = disk_stat.weighted_io_ms - previous_stat.weighted_io_ms
+        average_queue_length = weighted_io_ms / elapsed_ms
+
+        utilizations.append(
+            DiskUtilization(
+                disk_stat.name,
+                utilization_percent,
+                average_wait_ms,
+                average_queue_length,
+                disk_stat.in_flight,
+            )
+        )
+
+    return utilizations
 
 
 class SubsystemStat:
@@ -168,41 +383,95 @@ class SubsystemStat:
         self.high_watermark = high_watermark
 
 
+class ThroughputHistory:
+    """
+    Ring buffer with the HISTORY_LENGTH most recent throughput values for one
+    device, in bytes per second.
+    """
+
+    def __init__(self) -> None:
+        self._values = array.array("d", [0.0] * HISTORY_LENGTH)
+
+        # Index of the next value to write
+        self._next = 0
+
+        # Number of values added, up to HISTORY_LENGTH
+        self._count = 0
+
+    def add(self, bytes_per_second: float) -> None:
+        self._values[self._next] = bytes_per_second
+        self._next = (self._next + 1) % HISTORY_LENGTH
+        if self._count < HISTORY_LENGTH:
+            self._count += 1
+
+    def get_values(self) -> List[float]:
+        """
+        Returns the values we have, oldest first.
+        """
+        start = (self._next - self._count) % HISTORY_LENGTH
+        return [self._values[(start + i) % HISTORY_LENGTH] for i in range(self._count)]
+
+    def get_graph(self, peak: float) -> str:
+        """
+        Render the history as a braille graph, scaled to peak.
+        """
+        if peak <= 0:
+            peak = 1.0
+        levels = [px_load.average_to_level(value, peak) for value in self.get_values()]
+        return str(px_load.levels_to_graph(levels))
+
+
 def sample_network_interfaces() -> List[Sample]:
     """
     Query system for network interfaces byte counts
     """
 
-    if os.path.exists("/proc/net/dev"):
+    proc_net_dev = px_procfs.read_proc_file("/proc/net/dev")
+    if proc_net_dev is not None:
         # We're on Linux
-        with open("/proc/net/dev", encoding="utf-8") as proc_net_dev:
-            return parse_proc_net_dev(proc_net_dev.read())
+        return parse_proc_net_dev(proc_net_dev)
 
     # Assuming macOS, add support for more platforms on demand
-    netstat_ib_output = px_exec_util.run(["netstat", "-ib"])
-    return parse_netstat_ib_output(netstat_ib_output)
+    netstat_ib = px_exec_util.StreamingRun(
+        ["netstat", "-ib"], timeout_seconds=SAMPLE_TIMEOUT_SECONDS
+    )
+    netstat_ib_lines = list(netstat_ib)
+    if not netstat_ib.complete:
+        LOG.warning("netstat -ib timed out, no network numbers this time")
+        return []
+    return parse_netstat_ib_output("\n".join(netstat_ib_lines))
 
 
-def sample_drives() -> List[Sample]:
+def sample_drives() -> Tuple[List[Sample], List[DiskStat]]:
     """
-    Query system for drive statistics
+    Query system for drive statistics.
+
+    Returns throughput samples, and drive request timings which are only
+    available on Linux.
     """
 
-    if os.path.exists("/proc/diskstats"):
+    proc_diskstats = px_procfs.read_proc_file("/proc/diskstats")
+    if proc_diskstats is not None:
         # We're on Linux
-        with open("/proc/diskstats", encoding="utf-8") as proc_diskstats:
-            return parse_proc_diskstats(proc_diskstats.read())
+        return parse_proc_diskstats_all(proc_diskstats)
 
     # Assuming macOS, add support for more platforms on demand
-    iostat_output = px_exec_util.run(["iostat", "-dKI", "-n 99"])
-    return parse_iostat_output(iostat_output)
+    iostat = px_exec_util.StreamingRun(
+        ["iostat", "-dKI", "-n 99"], timeout_seconds=SAMPLE_TIMEOUT_SECONDS
+    )
+    iostat_lines = list(iostat)
+    if not iostat.complete:
+        LOG.warning("iostat timed out, no drive numbers this time")
+        return [], []
+    return parse_iostat_output("\n".join(iostat_lines)), []
 
 
 class SystemState:
     def __init__(self) -> None:
         self.timestamp = datetime.datetime.now()
 
-        self.samples: List[Sample] = sample_network_interfaces() + sample_drives()
+        drive_samples, self.disk_stats = sample_drives()
+        self.samples: List[Sample] = sample_network_interfaces() + drive_samples
 
         by_name: Dict[str, Sample] = {}
         for sample in self.samples:
@@ -219,6 +488,12 @@ class PxIoLoad:
         # value and a high watermark for the same value.
         self.ios: Dict[str, SubsystemStat] = {}
 
+        # Maps a subsystem name to its recent bytes-per-second values
+        self.history: Dict[str, ThroughputHistory] = {}
+
+        # Drive utilizations since the previous update, Linux only
+        self.disk_utilizations: List[DiskUtilization] = []
+
         # Per interface, keep track of when we first saw it and its byte count
         # at that time.
         self.baseline: Dict[str, Tuple[datetime.datetime, int]] = {}
@@ -293,6 +568,12 @@ class PxIoLoad:
                 # New device
                 io_entry = SubsystemStat(throughput=0.0, high_watermark=0.0)
 
+            history = self.history.get(name)
+            if history is None:
+                history = ThroughputHistory()
+                self.history[name] = history
+            history.add(bytes_per_second_since_previous)
+
             # High watermark throughput should be measured vs the last sample...
             high_watermark = max(
                 io_entry.high_watermark, bytes_per_second_since_previous
@@ -308,9 +589,20 @@ class PxIoLoad:
 
         self.ios = updated_ios
 
+        self.disk_utilizations = compute_disk_utilizations(
+            self.previous_system_state.disk_stats,
+            self.most_recent_system_state.disk_stats,
+            seconds_since_previous,
+        )
+
+        # Garbage collect histories for removed devices
+        for name in list(self.history.keys()):
+            if name not in self.baseline:
+                del self.history[name]
+
     def get_load_string(self) -> str:
         """
-        Example return value: "[123B/s / 878B/s] eth0 outgoing"
+        Example return value: "[123B/s / 878B/s] eth0 outgoing  [history: GRAPH]"
         """
 
         # NOTE: To compute this value, we need a collection of data points, with
@@ -340,12 +632,54 @@ class PxIoLoad:
             math.trunc(bottleneck[1]), math.trunc(bottleneck[2])
         )
 
-        return "[{} / {}] {}".format(
+        load_string = "[{} / {}] {}".format(
             px_terminal.bold(current_throughput + "/s"),
             max_throughput + "/s",
             px_terminal.bold(bottleneck[0]),
         )
 
+        history = self.history.get(bottleneck[0])
+        if history is None:
+            return load_string
+
+        graph = history.get_graph(bottleneck[2])
+        return f"{load_string}  [history: {graph}]"
+
+    def get_disk_string(self) -> str:
+        """
+        Describes the most utilized drive. Empty if we know nothing about any
+        drives.
+
+        Example return value: "[87% busy | 12.3ms avg wait | 4 in flight] sda"
+        """
+        if not self.disk_utilizations:
+            return ""
+
+        busiest = max(
+            self.disk_utilizations,
+            key=lambda utilization: (
+                utilization.utilization_percent,
+                utilization.average_queue_length,
+            ),
+        )
+
+        busy_string = px_terminal.bold(f"{busiest.utilization_percent:.0f}% busy")
+        if busiest.utilization_percent >= 90:
+            busy_string = px_terminal.red(busy_string)
+        elif busiest.utilization_percent >= 60:
+            busy_string = px_terminal.yellow(busy_string)
+
+        wait_string = "-"
+        if busiest.average_wait_ms is not None:
+            wait_string = f"{busiest.average_wait_ms:.1f}ms"
+
+        return "[{} | {} avg wait | {} in flight] {}".format(
+            busy_string,
+            wait_string,
+            busiest.in_flight,
+            px_terminal.bold(busiest.name),
+        )
+
 
 _ioload = PxIoLoad()
 
@@ -70,7 +70,7 @@ class IpcMap:
         self.files = list(filter(lambda f: f.type in FILE_TYPES, files))
 
         self.process = process
-        self.processes = processes
+        self.processes = px_process.to_snapshot(processes)
         self.ipc_files_for_process = list(
             filter(lambda f: f.pid == self.process.pid, self.files)
         )
@@ -174,19 +174,33 @@ class IpcMap:
                     # Talking to ourselves, never mind
                     continue
 
-                other_end_process = self._pid2process.get(other_end_pid)
-                if not other_end_process:
-                    other_end_process = PeerProcess(pid=other_end_pid)
-                    self._pid2process[other_end_pid] = other_end_process
-                self.add_ipc_entry(other_end_process, file)
+                self.add_ipc_entry(self._get_peer_process(other_end_pid), file)
 
         self.network_connections: Set[px_file.PxFile] = network_connections
 
+    def _get_peer_process(self, pid: int) -> PeerProcess:
+        """
+        Returns the same PeerProcess every time for the same PID.
+        """
+        peer_process = self._pid2process.get(pid)
+        if peer_process is not None:
+            return peer_process
+
+        process = self.processes.get_by_pid(pid)
+        if process is None:
+            peer_process = PeerProcess(pid=pid)
+        else:
+            peer_process = PeerProcess(name=process.command, pid=pid)
+
+        self._pid2process[pid] = peer_process
+        return peer_process
+
     def _create_indices(self) -> None:
         """
         Creates indices used by _get_other_end_pids()
         """
-        self._pid2process = create_pid2process(self.processes)
+        # Only peers we actually talk to, filled in by _get_peer_process()
+        self._pid2process: MutableMapping[int, PeerProcess] = {}
 
         self._device_to_pids: MutableMapping[str, List[int]] = {}
         self._name_to_pids: MutableMapping[str, List[int]] = {}
@@ -302,19 +316,6 @@ class IpcMap:
         return self._map.__getitem__(process)
 
 
-def create_pid2process(
-    processes: Iterable[px_process.PxProcess],
-) -> MutableMapping[int, PeerProcess]:
-    pid2process: MutableMapping[int, PeerProcess] = {}
-    for process in processes:
-        # Guard against duplicate PIDs
-        assert process.pid not in pid2process
-
-        pid2process[process.pid] = PeerProcess(name=process.command, pid=process.pid)
-
-    return pid2process
-
-
 def add_arraymapping(mapping: MutableMapping[S, List[T]], key: S, value: T) -> None:
     array = mapping.setdefault(key, [])
     array.append(value)
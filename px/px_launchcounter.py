@@ -1,12 +1,43 @@
+import time
+import heapq
+import datetime
+
 from . import px_terminal
 
 from . import px_process
+from . import px_procevents
 from typing import List
+from typing import Iterable
 from typing import Tuple
 from typing import Dict
+from typing import Set
 from typing import Optional
 
 
+# A process' command, and the call chain leading up to and including it
+CachedCallchain = Tuple[str, Tuple[str, ...]]
+
+# Max number of call chain trie nodes to keep track of. Beyond this, the least
+# recently used branches are dropped.
+MAX_NODES = 10000
+
+# When pruning, prune down to this fraction of MAX_NODES. Pruning to just below
+# MAX_NODES would make us prune again after just a few more launches.
+PRUNE_TO_FRACTION = 0.75
+
+
+# For how long we keep track of launch rates
+RATE_WINDOW_SECONDS = 60
+
+# The short term launch rate is measured over this many seconds
+SHORT_RATE_SECONDS = 10
+
+# Processes we have been told about through process events are expected to show
+# up in the next poll, unless they exit before that. After this many seconds
+# without seeing them, we stop waiting.
+EVENT_LAUNCH_TTL_SECONDS = 10
+
+
 def render_launch_tuple(launch_tuple: Tuple[str, int]) -> str:
     binary = launch_tuple[0]
     count = launch_tuple[1]
@@ -16,19 +47,6 @@ def render_launch_tuple(launch_tuple: Tuple[str, int]) -> str:
     return px_terminal.bold(binary) + "(" + str(count) + ")"
 
 
-def _get_minus_max_score(tuples_list: List[Tuple[str, int]]) -> int:
-    max_score = 0
-    for current_tuple in tuples_list:
-        max_score = max(max_score, current_tuple[1])
-    return -max_score
-
-
-def sort_launchers_list(
-    launchers_list: List[List[Tuple[str, int]]]
-) -> List[List[Tuple[str, int]]]:
-    return sorted(launchers_list, key=_get_minus_max_score)
-
-
 def _strip_parentheses(s: str) -> str:
     if not s:
         return s
@@ -40,125 +58,465 @@ def _strip_parentheses(s: str) -> str:
 
 
 def _list_new_launches(
-    before: List[px_process.PxProcess],
-    after: List[px_process.PxProcess],
+    before: Iterable[px_process.PxProcess],
+    after: Iterable[px_process.PxProcess],
 ) -> List[px_process.PxProcess]:
-    pid2oldProc: Dict[int, px_process.PxProcess] = {}
-    for old_proc in before:
-        pid2oldProc[old_proc.pid] = old_proc
+    before_snapshot = px_process.to_snapshot(before)
 
     new_procs = []  # List[px_process.PxProcess]
     for new_proc in after:
-        if new_proc.pid not in pid2oldProc:
-            # This is a new process
-            new_procs.append(new_proc)
-            continue
-
-        old_proc = pid2oldProc[new_proc.pid]
-        if old_proc.start_time != new_proc.start_time:
-            # This is a new process, PID has been reused
+        # Look up by start time as well, in case the PID has been reused
+        if before_snapshot.get_by_key((new_proc.pid, new_proc.start_time)) is None:
             new_procs.append(new_proc)
-            continue
 
     return new_procs
 
 
-def _to_tuple_list(launcher_list: Tuple[str, ...], count: int) -> List[Tuple[str, int]]:
+def _callchain(
+    process: px_process.PxProcess,
+    cache: Optional[Dict[Tuple[int, datetime.datetime], CachedCallchain]] = None,
+) -> Tuple[str, ...]:
     """
-    Converts from: (("a", "b", "c"), 5)
-                to  : [("a", 0), ("b", 0), ("c", 5)]
+    Returns the names of all binaries from the root of the process tree down to
+    this process.
+
+    If a cache is passed, call chains are memoized per (pid, start time). When
+    lots of processes are launched by the same parent, this makes each new
+    chain the parent's cached chain plus one element, rather than a walk all
+    the way up to the root.
     """
-    tuple_list: List[Tuple[str, int]] = []
-    for launcher in launcher_list:
-        tuple_list.append((launcher, 0))
-    tuple_list[-1] = (launcher_list[-1], count)
-    return tuple_list
-
-
-def _merge_tuple_lists(
-    tl1: List[Tuple[str, int]],
-    tl2: List[Tuple[str, int]],
-) -> Optional[List[Tuple[str, int]]]:
-    if len(tl1) > len(tl2):
-        longer = tl1
-        shorter = tl2
+    if cache is None:
+        reverse_callchain: List[str] = []
+
+        current: Optional[px_process.PxProcess] = process
+        while current is not None:
+            reverse_callchain.append(_strip_parentheses(current.command))
+            current = current.parent
+
+        return tuple(reversed(reverse_callchain))
+
+    key = (process.pid, process.start_time)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == process.command:
+        return cached[1]
+    # If the command has changed the process has exec()ed something else, and
+    # we need to recompute
+
+    name = _strip_parentheses(process.command)
+    if process.parent is None:
+        callchain: Tuple[str, ...] = (name,)
     else:
-        longer = tl2
-        shorter = tl1
-
-    merged = longer[:]
-    for i, t1 in enumerate(shorter):
-        t2 = longer[i]
-        if t1[0] != t2[0]:
-            # Mismatch, we can't merge these
-            return None
-        merged[i] = (t1[0], t1[1] + t2[1])
+        callchain = _callchain(process.parent, cache) + (name,)
+
+    cache[key] = (process.command, callchain)
+    return callchain
+
+
+class LaunchRate:
+    """
+    Launch counts for the last RATE_WINDOW_SECONDS seconds, in one bucket per
+    second. Memory usage doesn't depend on the number of launches, so this
+    works just as well for somebody fork bombing at 500 launches per second.
+    """
+
+    def __init__(self) -> None:
+        self._buckets = [0] * RATE_WINDOW_SECONDS
+
+        # The second the most recent bucket is for
+        self._latest_second = 0
+
+    def add(self, timestamp: float) -> None:
+        second = int(timestamp)
+        if second <= self._latest_second - RATE_WINDOW_SECONDS:
+            # Too old to care about
+            return
+
+        if second > self._latest_second:
+            # Clear buckets for the seconds we have skipped over
+            skipped = min(second - self._latest_second, RATE_WINDOW_SECONDS)
+            for clear_me in range(second - skipped + 1, second + 1):
+                self._buckets[clear_me % RATE_WINDOW_SECONDS] = 0
+            self._latest_second = second
+
+        self._buckets[second % RATE_WINDOW_SECONDS] += 1
+
+    def get_count(self, now: float, seconds: int) -> int:
+        """
+        Returns the number of launches during the last seconds seconds.
+        """
+        assert seconds <= RATE_WINDOW_SECONDS
+
+        now_second = int(now)
+        count = 0
+        for second in range(now_second - seconds + 1, now_second + 1):
+            if second > self._latest_second:
+                break
+            if second <= self._latest_second - RATE_WINDOW_SECONDS:
+                continue
+            count += self._buckets[second % RATE_WINDOW_SECONDS]
+        return count
 
-    return merged
 
+def _format_rate(count: int, seconds: int) -> str:
+    rate = count / seconds
+    if rate >= 10:
+        return f"{rate:.0f}/s"
+    return f"{rate:.1f}/s"
 
-def _callchain(process: px_process.PxProcess) -> Tuple[str, ...]:
-    reverse_callchain: List[str] = []
 
-    current: Optional[px_process.PxProcess] = process
-    while current is not None:
-        reverse_callchain.append(_strip_parentheses(current.command))
-        current = current.parent
+class LaunchNode:
+    """
+    A node in the launches trie. The path from the root of the trie to this
+    node is a call chain, and count is how many times the last binary in that
+    chain has been launched.
+    """
+
+    def __init__(self, name: str, depth: int) -> None:
+        self.name = name
+        self.depth = depth
+        self.count = 0
+
+        # Highest count of this node and all its descendants
+        self.max_score = 0
+
+        # Launch serial number of the most recent launch in this subtree. Used
+        # for pruning the least recently used branches.
+        self.last_used = 0
+
+        self.children: Dict[str, "LaunchNode"] = {}
+
+        # Only created for nodes that have actually been launched
+        self.launch_rate: Optional[LaunchRate] = None
 
-    return tuple(reversed(reverse_callchain))
+    def get_heaviest_child(self) -> Optional["LaunchNode"]:
+        """
+        Returns the child with the highest max_score, with ties broken by name
+        to get stable output.
+        """
+        heaviest: Optional[LaunchNode] = None
+        for child in self.children.values():
+            if heaviest is None:
+                heaviest = child
+            elif child.max_score > heaviest.max_score:
+                heaviest = child
+            elif child.max_score == heaviest.max_score and child.name < heaviest.name:
+                heaviest = child
+        return heaviest
 
 
 class Launchcounter:
-    def __init__(self):
-        self._hierarchies: Dict[Tuple[str, ...], int] = {}
+    def __init__(self, max_nodes: int = MAX_NODES) -> None:
+        self._root = LaunchNode("", 0)
+        self._node_count = 0
+        self._max_nodes = max_nodes
+
+        # Incremented for each launch, used for LRU pruning
+        self._launch_serial = 0
+
+        # Call chains of processes we have seen, by (pid, start time)
+        self._callchain_cache: Dict[Tuple[int, datetime.datetime], CachedCallchain] = {}
+
+        # Nodes launched during the last RATE_WINDOW_SECONDS, by call chain
+        self._recently_launched: Dict[Tuple[str, ...], LaunchNode] = {}
 
         # Most recent process snapshot
-        self._last_processlist: Optional[List[px_process.PxProcess]] = None
+        self._last_snapshot: Optional[px_process.ProcessSnapshot] = None
+
+        # Processes we have counted from exec events, but not yet seen in any
+        # snapshot. PID to event timestamp.
+        self._event_launches: Dict[int, float] = {}
+
+        # Call chains of live processes in _event_launches, so that processes
+        # they launch get full call chains as well
+        self._event_callchains: Dict[int, Tuple[str, ...]] = {}
+
+        # PIDs we got exit events for since the last update(). Any other PID in
+        # _last_snapshot is still the same process, even if it exec()s again.
+        self._event_exits: Set[int] = set()
+
+    def _register_launch(self, callchain: Tuple[str, ...], now: float) -> None:
+        self._launch_serial += 1
+
+        path = [self._root]
+        node = self._root
+        for name in callchain:
+            child = node.children.get(name)
+            if child is None:
+                child = LaunchNode(name, node.depth + 1)
+                node.children[name] = child
+                self._node_count += 1
+            node = child
+            path.append(node)
+
+        node.count += 1
+        if node.launch_rate is None:
+            node.launch_rate = LaunchRate()
+        node.launch_rate.add(now)
+        self._recently_launched[callchain] = node
+
+        for path_node in path:
+            path_node.last_used = self._launch_serial
+            path_node.max_score = max(path_node.max_score, node.count)
+
+    def _register_launches(
+        self, new_processes: List[px_process.PxProcess], now: Optional[float] = None
+    ) -> None:
+        """
+        Register launches of new processes. Launch rates are computed from when
+        we see the processes, with now defaulting to the current time.
+        """
+        if now is None:
+            now = time.time()
 
-    def _register_launches(self, new_processes: List[px_process.PxProcess]) -> None:
         for new_process in new_processes:
-            callchain = _callchain(new_process)
-            if callchain in self._hierarchies:
-                self._hierarchies[callchain] += 1
-            else:
-                self._hierarchies[callchain] = 1
-
-    def update(self, procs_snapshot: List[px_process.PxProcess]) -> None:
-        if self._last_processlist is None:
-            self._last_processlist = procs_snapshot
-            return
+            callchain = _callchain(new_process, self._callchain_cache)
+            self._register_launch(callchain, now)
+
+        if self._node_count > self._max_nodes:
+            self._prune()
+
+    def _prune(self) -> None:
+        """
+        Drop the least recently used branches until we're down to
+        PRUNE_TO_FRACTION of our max node count.
+        """
+        parents_and_nodes: List[Tuple[LaunchNode, LaunchNode]] = []
+        to_visit = [self._root]
+        while to_visit:
+            parent = to_visit.pop()
+            for child in parent.children.values():
+                parents_and_nodes.append((parent, child))
+                to_visit.append(child)
+
+        # Launching something updates the whole chain leading up to it, so
+        # nodes are never more recently used than their parents. Sorting deeper
+        # nodes first among equals means we only ever remove leaves.
+        parents_and_nodes.sort(key=lambda pn: (pn[1].last_used, -pn[1].depth))
+
+        target = int(self._max_nodes * PRUNE_TO_FRACTION)
+        pruned = False
+        for parent, node in parents_and_nodes:
+            if self._node_count <= target:
+                break
+            assert not node.children
+            del parent.children[node.name]
+            self._node_count -= 1
+            pruned = True
+
+        if pruned:
+            for callchain, node in list(self._recently_launched.items()):
+                if _find_node(self._root, callchain) is not node:
+                    del self._recently_launched[callchain]
+
+        _update_max_scores(self._root)
+
+    def register_events(self, events: Iterable[px_procevents.ProcEvent]) -> None:
+        """
+        Count launches reported by process events, including the ones too
+        short lived for update() to ever see.
+
+        Call this with the events received since the last update(), before
+        calling update() again. Processes counted here will not be counted
+        again when update() sees them.
+
+        Just like update() counts each (PID, start time) once, a process that
+        exec()s more than once, like sh running cc, is counted only once.
+        """
+        for event in events:
+            if isinstance(event, px_procevents.ExitEvent):
+                # Keep the entry in _event_launches. The process may still be
+                # in a snapshot we haven't seen yet.
+                self._event_callchains.pop(event.pid, None)
+                self._event_exits.add(event.pid)
+                continue
 
-        new_processes = _list_new_launches(self._last_processlist, procs_snapshot)
-        self._register_launches(new_processes)
+            command = _strip_parentheses(event.command)
 
-        self._last_processlist = procs_snapshot
+            known_callchain = self._event_callchains.get(event.pid)
+            if known_callchain is not None:
+                # Same process as an earlier exec event, exec()ing again. Now it
+                # goes by its new name.
+                self._event_callchains[event.pid] = known_callchain[:-1] + (command,)
+                continue
 
-    def _coalesce_launchers(self) -> List[List[Tuple[str, int]]]:
-        coalesced: List[List[Tuple[str, int]]] = []
+            if (
+                self._last_snapshot is not None
+                and event.pid not in self._event_exits
+                and self._last_snapshot.get_by_pid(event.pid) is not None
+            ):
+                # Already counted by update(), and hasn't exited since
+                continue
 
-        for launcher_list in sorted(self._hierarchies.keys()):
-            count = self._hierarchies[launcher_list]
+            parent_callchain: Tuple[str, ...] = ()
+            if event.ppid in self._event_callchains:
+                parent_callchain = self._event_callchains[event.ppid]
+            elif self._last_snapshot is not None:
+                parent = self._last_snapshot.get_by_pid(event.ppid)
+                if parent is not None:
+                    parent_callchain = _callchain(parent, self._callchain_cache)
+
+            callchain = parent_callchain + (command,)
+            self._event_callchains[event.pid] = callchain
+            self._event_launches[event.pid] = event.timestamp
+            self._event_exits.discard(event.pid)
+            self._register_launch(callchain, event.timestamp)
+
+        if self._node_count > self._max_nodes:
+            self._prune()
+
+    def update(
+        self,
+        procs_snapshot: Iterable[px_process.PxProcess],
+        now: Optional[float] = None,
+    ) -> None:
+        """
+        Pass a px_process.ProcessSnapshot to reuse its indexes.
+        """
+        if now is None:
+            now = time.time()
+
+        snapshot = px_process.to_snapshot(procs_snapshot)
+        if self._last_snapshot is None:
+            self._last_snapshot = snapshot
+            return
 
-            new_tuple_list = _to_tuple_list(launcher_list, count)
-            if len(coalesced) == 0:
-                coalesced.append(new_tuple_list)
+        new_processes: List[px_process.PxProcess] = []
+        for new_process in _list_new_launches(self._last_snapshot, snapshot):
+            if self._event_launches.pop(new_process.pid, None) is not None:
+                # Already counted through a process event
                 continue
+            new_processes.append(new_process)
+        self._register_launches(new_processes, now)
+
+        self._last_snapshot = snapshot
+        self._event_exits.clear()
+
+        # Stop waiting for event launched processes that never showed up
+        for pid, timestamp in list(self._event_launches.items()):
+            if timestamp < now - EVENT_LAUNCH_TTL_SECONDS:
+                del self._event_launches[pid]
+        for pid in list(self._event_callchains.keys()):
+            if pid not in self._event_launches:
+                # Either dead or in _last_snapshot
+                del self._event_callchains[pid]
+
+        # Forget about processes that are gone
+        for key in list(self._callchain_cache.keys()):
+            if snapshot.get_by_key(key) is None:
+                del self._callchain_cache[key]
+
+    def _get_launchers_list(
+        self, max_rows: Optional[int]
+    ) -> List[List[Tuple[str, int]]]:
+        """
+        Returns one row per call chain to render, highest launch counts first.
+
+        Each row follows the highest scoring branches of the trie down to a
+        leaf. Other branches along the way get rows of their own, with the
+        binaries they share with the first row shown without counts.
+
+        Only the top max_rows rows are computed, so the cost of this doesn't
+        depend on how many launches we have seen.
+        """
+        rows: List[List[Tuple[str, int]]] = []
+
+        # Contains (-max_score, path, node) tuples. Paths are unique, so we
+        # never need to compare the nodes.
+        heap: List[Tuple[int, Tuple[str, ...], LaunchNode]] = []
+        for child in self._root.children.values():
+            heapq.heappush(heap, (-child.max_score, (child.name,), child))
+
+        while heap:
+            if max_rows is not None and len(rows) >= max_rows:
+                break
+
+            _, path, node = heapq.heappop(heap)
+
+            # Shared binaries leading up to this branch are shown without counts
+            row = [(name, 0) for name in path[:-1]]
+
+            current: Optional[LaunchNode] = node
+            current_path = path
+            while current is not None:
+                row.append((current.name, current.count))
+
+                heaviest = current.get_heaviest_child()
+                for child in current.children.values():
+                    if child is heaviest:
+                        continue
+                    heapq.heappush(
+                        heap, (-child.max_score, current_path + (child.name,), child)
+                    )
+
+                current = heaviest
+                if current is not None:
+                    current_path = current_path + (current.name,)
+
+            rows.append(row)
+
+        return rows
+
+    def get_screen_lines(self, max_lines: Optional[int] = None) -> List[str]:
+        lines: List[str] = []
+        for row in self._get_launchers_list(max_lines):
+            line = " -> ".join(map(render_launch_tuple, row))
+            lines.append(line)
 
-            merged = _merge_tuple_lists(coalesced[-1], new_tuple_list)
-            if merged:
-                coalesced[-1] = merged
-            else:
-                coalesced.append(new_tuple_list)
+        return lines
+
+    def get_rate_lines(
+        self, now: Optional[float] = None, max_lines: Optional[int] = None
+    ) -> List[str]:
+        """
+        Returns one line per call chain launched during the last minute, with
+        launches per second during the last SHORT_RATE_SECONDS and the last
+        RATE_WINDOW_SECONDS.
+
+        The highest current launch rates come first, so runaway cron jobs and
+        crash looping services end up on top.
+        """
+        if now is None:
+            now = time.time()
+
+        rates: List[Tuple[int, int, Tuple[str, ...]]] = []
+        for callchain, node in list(self._recently_launched.items()):
+            assert node.launch_rate is not None
+            long_count = node.launch_rate.get_count(now, RATE_WINDOW_SECONDS)
+            if long_count == 0:
+                # Nothing launched lately, forget about it
+                del self._recently_launched[callchain]
+                continue
 
-        return coalesced
+            short_count = node.launch_rate.get_count(now, SHORT_RATE_SECONDS)
+            rates.append((short_count, long_count, callchain))
 
-    def get_screen_lines(self) -> List[str]:
-        launchers_list = self._coalesce_launchers()
-        launchers_list = sort_launchers_list(launchers_list)
+        rates.sort(key=lambda rate: (-rate[0], -rate[1], rate[2]))
+        if max_lines is not None:
+            rates = rates[:max_lines]
 
         lines: List[str] = []
-        for row in launchers_list:
-            line = " -> ".join(map(render_launch_tuple, row))
-            lines.append(line)
+        for short_count, long_count, callchain in rates:
+            short_rate = _format_rate(short_count, SHORT_RATE_SECONDS)
+            long_rate = _format_rate(long_count, RATE_WINDOW_SECONDS)
+            chain = " -> ".join(callchain[:-1] + (px_terminal.bold(callchain[-1]),))
+            lines.append(f"{short_rate:>7} {long_rate:>7}  {chain}")
 
         return lines
+
+
+def _find_node(root: LaunchNode, callchain: Tuple[str, ...]) -> Optional[LaunchNode]:
+    node: Optional[LaunchNode] = root
+    for name in callchain:
+        assert node is not None
+        node = node.children.get(name)
+        if node is None:
+            return None
+    return node
+
+
+def _update_max_scores(node: LaunchNode) -> int:
+    max_score = node.count
+    for child in node.children.values():
+        max_score = max(max_score, _update_max_scores(child))
+    node.max_score = max_score
+    return max_score
@@ -5,17 +5,29 @@ The one you probably want to call is get_load_string().
 """
 
 import os
+import math
+import time
+import array
 
 from . import px_cpuinfo
 from . import px_terminal
 
-from typing import Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 
 
 physical, logical = px_cpuinfo.get_core_count()
 physical_string = px_terminal.bold(str(physical) + " cores")
 cores_string = f"[{physical_string} | {logical} virtual]"
 
+# Number of procs_running samples to keep. At one sample per second and two
+# samples per character, this is enough for a 120 characters wide graph. Slow
+# polling means fewer samples per second, so the graph label is computed from
+# the sample timestamps.
+HISTORY_LENGTH = 240
+
+# Per core usage, from idle to fully busy
+HEAT_CHARS = "▁▂▃▄▅▆▇█"
+
 
 def average_to_level(average, peak):
     level = 3 * (average / peak)
@@ -68,6 +80,176 @@ def levels_to_graph(levels):
     return graph
 
 
+def parse_procs_running(proc_stat_contents: str) -> Optional[int]:
+    """
+    Extract the number of currently runnable processes from /proc/stat
+    contents. Returns None if not found.
+    """
+    for line in proc_stat_contents.splitlines():
+        if line.startswith("procs_running "):
+            return int(line.split()[1])
+    return None
+
+
+class LoadHistory:
+    """
+    Ring buffer with the HISTORY_LENGTH most recent numbers of runnable
+    processes, and when they were sampled.
+    """
+
+    def __init__(self) -> None:
+        self._values = array.array("d", [0.0] * HISTORY_LENGTH)
+        self._timestamps = array.array("d", [0.0] * HISTORY_LENGTH)
+
+        # Index of the next value to write
+        self._next = 0
+
+        # Number of values added, up to HISTORY_LENGTH
+        self._count = 0
+
+    def add(self, procs_running: float, now: Optional[float] = None) -> None:
+        if now is None:
+            now = time.time()
+
+        self._values[self._next] = procs_running
+        self._timestamps[self._next] = now
+        self._next = (self._next + 1) % HISTORY_LENGTH
+        if self._count < HISTORY_LENGTH:
+            self._count += 1
+
+    def get_values(self) -> List[float]:
+        """
+        Returns the values we have, oldest first.
+        """
+        return self._get(self._values)
+
+    def get_timestamps(self) -> List[float]:
+        """
+        Returns when each of the values was sampled, oldest first.
+        """
+        return self._get(self._timestamps)
+
+    def _get(self, ring: "array.array[float]") -> List[float]:
+        start = (self._next - self._count) % HISTORY_LENGTH
+        return [ring[(start + i) % HISTORY_LENGTH] for i in range(self._count)]
+
+
+def history_to_graph(
+    history: List[float], graph_chars: int, min_peak: float = 1.0
+) -> str:
+    """
+    Render the most recent values of a load history into a graph of at most
+    graph_chars characters, scaled to the highest value shown or min_peak,
+    whichever is higher.
+
+    Older values are shown faint and the most recent ones bold.
+    """
+    history = history[-2 * graph_chars :] if graph_chars > 0 else []
+
+    peak = max(history + [min_peak])
+    levels = [average_to_level(value, peak) for value in history]
+    graph: str = levels_to_graph(levels)
+
+    third = len(graph) // 3
+    return (
+        px_terminal.faint(graph[0:third])
+        + graph[third : len(graph) - third]
+        + px_terminal.bold(graph[len(graph) - third :])
+    )
+
+
+class CoreUsage:
+    """
+    Per core CPU usage, computed from the jiffies counters in /proc/stat.
+
+    Usages live in an array that is only reallocated if the number of online
+    cores changes.
+    """
+
+    def __init__(self) -> None:
+        # Busy and total jiffies from the previous update, by CPU number. Cores
+        # can go offline and come back, so their positions in /proc/stat can't
+        # be trusted to stay the same.
+        self._counters: Dict[int, Tuple[int, int]] = {}
+
+        # Usage per online core since the previous update, 0.0-1.0, in
+        # /proc/stat order
+        self.usages = array.array("d")
+
+    def update(self, proc_stat_contents: str) -> None:
+        counters: Dict[int, Tuple[int, int]] = {}
+        core = 0
+        for line in proc_stat_contents.splitlines():
+            if not line.startswith("cpu") or not line[3:4].isdigit():
+                # Skip the all-cores "cpu" line and everything that isn't about
+                # CPUs
+                continue
+
+            # Fields are: user nice system idle iowait irq softirq steal. Guest
+            # times after that are already included in user and nice.
+            fields = line.split(None, 9)
+            total = 0
+            for field in fields[1:9]:
+                total += int(field)
+            busy = total - int(fields[4]) - int(fields[5])
+
+            cpu_number = int(fields[0][3:])
+            counters[cpu_number] = (busy, total)
+
+            # New cores get no usage until we have two samples
+            usage = 0.0
+            previous = self._counters.get(cpu_number)
+            if previous is not None:
+                previous_busy, previous_total = previous
+                total_delta = total - previous_total
+                if total_delta > 0:
+                    usage = (busy - previous_busy) / total_delta
+
+            if core < len(self.usages):
+                self.usages[core] = usage
+            else:
+                self.usages.append(usage)
+
+            core += 1
+
+        if core < len(self.usages):
+            # Cores went offline
+            del self.usages[core:]
+
+        self._counters = counters
+
+
+def render_heat_strip(usages: List[float], width: int, max_rows: int) -> List[str]:
+    """
+    Render per core usages as one character per core, in rows of at most width
+    characters.
+
+    If there are more cores than fit in max_rows rows, neighboring cores share
+    characters showing their average usage.
+    """
+    if not usages or width <= 0 or max_rows <= 0:
+        return []
+
+    cores_per_char = math.ceil(len(usages) / (width * max_rows))
+    cells: List[float] = []
+    for start in range(0, len(usages), cores_per_char):
+        chunk = usages[start : start + cores_per_char]
+        cells.append(sum(chunk) / len(chunk))
+
+    # Spread the cells evenly over the rows we need
+    row_count = math.ceil(len(cells) / width)
+    row_length = math.ceil(len(cells) / row_count)
+
+    last_char = len(HEAT_CHARS) - 1
+    rows: List[str] = []
+    for start in range(0, len(cells), row_length):
+        row = ""
+        for usage in cells[start : start + row_length]:
+            row += HEAT_CHARS[max(0, min(last_char, int(usage * len(HEAT_CHARS))))]
+        rows.append(row)
+    return rows
+
+
 def get_load_values() -> Tuple[float, float, float]:
     """
     Returns three system load numbers:
@@ -84,7 +266,12 @@ def get_load_values() -> Tuple[float, float, float]:
     return (avg0to1, avg1to5, avg5to15)
 
 
-def get_load_string(load_values: Optional[Tuple[float, float, float]] = None) -> str:
+def get_load_string(
+    load_values: Optional[Tuple[float, float, float]] = None,
+    history: Optional[List[float]] = None,
+    graph_chars: int = 8,
+    history_timestamps: Optional[List[float]] = None,
+) -> str:
     """
     Example return string, underlines indicate bold:
     "1.5  [4 cores | 8 virtual]  [15m history: GRAPH]"
@@ -94,6 +281,11 @@ def get_load_string(load_values: Optional[Tuple[float, float, float]] = None) ->
     * <= physical core count: Green
     * <= virtual core count: Yellow
     * Larger: Red
+
+    If a history of runnable process counts is passed, the graph shows the last
+    graph_chars * 2 samples of that instead of being made up from the load
+    averages. Pass history_timestamps if you have them, and the label will say
+    how many seconds the graph covers rather than how many samples.
     """
     if load_values is None:
         load_values = get_load_values()
@@ -108,6 +300,20 @@ def get_load_string(load_values: Optional[Tuple[float, float, float]] = None) ->
     else:
         load_string = px_terminal.red(load_string)
 
+    if history is not None:
+        # Scale to at least the number of cores, so that a machine that isn't
+        # overloaded doesn't look like it is
+        graph = history_to_graph(history, graph_chars, float(physical))
+        shown = min(len(history), 2 * graph_chars)
+        if history_timestamps is None:
+            label = f"last {shown} samples"
+        else:
+            seconds = 0.0
+            if shown > 0:
+                seconds = history_timestamps[-1] - history_timestamps[-shown]
+            label = f"{seconds:.0f}s history"
+        return f"{load_string}  {cores_string}  [{label}: {graph}]"
+
     recent, between, old, _ = averages_to_levels(avg0to1, avg1to5, avg5to15)
     graph = levels_to_graph([old] * 10 + [between] * 4 + [recent])
 
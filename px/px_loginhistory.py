@@ -1,14 +1,47 @@
+import os
+import mmap
+import struct
+import heapq
+import bisect
 import logging
+import threading
 import datetime
 
 import re
+from array import array
 
 from . import px_exec_util
 
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Union
+from typing import Sequence
 from typing import Optional, Set
 
 LOG = logging.getLogger(__name__)
 
+# Written by login, sshd and friends on Linux. On macOS this file isn't
+# maintained, so there we ask "last" instead.
+WTMP_PATH = "/var/log/wtmp"
+
+# struct utmp from glibc's bits/utmp.h, same layout on all 64 bit platforms:
+# type, PID, line, ID, user, host, exit status, session, timestamp seconds and
+# microseconds, IPv6 address and padding
+UTMP_RECORD = struct.Struct("=h2xi32s4s32s256s2hi2i16s20s")
+
+# Record types from bits/utmp.h
+UTMP_RUN_LVL = 1
+UTMP_BOOT_TIME = 2
+UTMP_USER_PROCESS = 7
+UTMP_DEAD_PROCESS = 8
+
+# End time for sessions that are still going on
+STILL_LOGGED_IN = float("inf")
+
+# Give up on "last" after this long, it can be slow with years of wtmp files
+LAST_TIMEOUT_SECONDS = 30
+
 TIMEZONE = datetime.datetime.now(datetime.timezone.utc).astimezone().tzinfo
 
 # last regexp parts
@@ -60,25 +93,169 @@ def get_users_at(
     timestamp: datetime.datetime,
     last_output: Optional[str] = None,
     now: Optional[datetime.datetime] = None,
+    cancel: Optional[threading.Event] = None,
 ) -> Set[str]:
     """
     Return a set of strings corresponding to which users were logged in from
     which addresses at a given timestamp.
 
     Optional argument last_output is the output of "last". Will be filled in by
-    actually executing "last" if not provided.
+    actually executing "last" if not provided, and if there's no wtmp file we
+    can read ourselves.
 
     Optional argument now is the current timestamp for parsing last_output. Will
     be taken from the system clock if not provided.
+
+    Optional argument cancel will kill "last" if set while it's running, and
+    make this function raise px_exec_util.CancelledError.
+    """
+    session_index = _get_session_index(last_output, now, cancel)
+    return session_index.get_users_at(timestamp.timestamp())
+
+
+def get_users_at_many(
+    timestamps: Sequence[datetime.datetime],
+    last_output: Optional[str] = None,
+    now: Optional[datetime.datetime] = None,
+    cancel: Optional[threading.Event] = None,
+) -> List[Set[str]]:
     """
+    Like get_users_at(), but for many timestamps at once, like the start times
+    of all processes.
+
+    Returns one set of users per timestamp, in the same order as timestamps.
+    """
+    session_index = _get_session_index(last_output, now, cancel)
+    return session_index.get_users_at_many(
+        [timestamp.timestamp() for timestamp in timestamps]
+    )
+
+
+def _get_session_index(
+    last_output: Optional[str],
+    now: Optional[datetime.datetime],
+    cancel: Optional[threading.Event] = None,
+) -> "SessionIndex":
+    if last_output is None:
+        session_index = get_session_index()
+        if session_index is not None:
+            return session_index
+
+        # No wtmp file, probably macOS
+        last_output = call_last(cancel)
 
     if now is None:
         now = datetime.datetime.now(datetime.timezone.utc).astimezone()
 
-    if last_output is None:
-        last_output = call_last()
+    return SessionIndex(parse_last_output(last_output, now))
+
+
+class Session:
+    def __init__(self, username: str, start: float, end: float) -> None:
+        # Example: "johan from 10.1.6.120"
+        self.username = username
+
+        # Seconds since the epoch, end is STILL_LOGGED_IN for ongoing sessions
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return f"Session({self.username}, {self.start}, {self.end})"
+
+
+def _decode(field: bytes) -> str:
+    return field.split(b"\0", 1)[0].decode("utf-8", "replace")
+
+
+def parse_wtmp(data: Union[bytes, mmap.mmap]) -> List[Session]:
+    """
+    Turn the contents of a wtmp file into login sessions.
+
+    Sessions end when a later record shows up for the same terminal line, or
+    at the next reboot or shutdown, whichever comes first. This is how "last"
+    does it, except it goes backwards.
+    """
+    sessions: List[Session] = []
+
+    # Terminal line to session currently open on that line
+    open_sessions: Dict[str, Session] = {}
+
+    record_count = len(data) // UTMP_RECORD.size
+    for record_index in range(record_count):
+        (
+            ut_type,
+            _,
+            ut_line,
+            _,
+            ut_user,
+            ut_host,
+            _,
+            _,
+            _,
+            tv_sec,
+            tv_usec,
+            _,
+            _,
+        ) = UTMP_RECORD.unpack_from(data, record_index * UTMP_RECORD.size)
+        timestamp = tv_sec + tv_usec / 1_000_000
+
+        if ut_type == UTMP_BOOT_TIME or (
+            ut_type == UTMP_RUN_LVL and _decode(ut_user) == "shutdown"
+        ):
+            # Everybody got logged out by this
+            for session in open_sessions.values():
+                session.end = timestamp
+            open_sessions.clear()
+            continue
+
+        if ut_type not in (UTMP_USER_PROCESS, UTMP_DEAD_PROCESS):
+            continue
+
+        line = _decode(ut_line)
+        previous = open_sessions.pop(line, None)
+        if previous is not None:
+            previous.end = timestamp
+
+        if ut_type != UTMP_USER_PROCESS:
+            continue
+
+        username = _decode(ut_user)
+        if not username:
+            continue
+        host = _decode(ut_host)
+        if host:
+            username += " from " + host
+
+        session = Session(username, timestamp, STILL_LOGGED_IN)
+        sessions.append(session)
+        open_sessions[line] = session
+
+    return sessions
+
+
+def read_wtmp(path: str = WTMP_PATH) -> Optional[List[Session]]:
+    """
+    Returns None if there is no wtmp file, or if we aren't allowed to read it.
+    """
+    try:
+        with open(path, "rb") as wtmp:
+            if os.fstat(wtmp.fileno()).st_size == 0:
+                # Can't mmap() empty files
+                return []
+            with mmap.mmap(wtmp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return parse_wtmp(data)
+    except (IOError, OSError) as e:
+        LOG.debug("Reading %s failed: %s", path, e)
+        return None
+
+
+def parse_last_output(last_output: str, now: datetime.datetime) -> List[Session]:
+    """
+    Turn the output of "last" into login sessions.
 
-    users = set()
+    now is the current timestamp, needed since "last" doesn't print any years.
+    """
+    sessions: List[Session] = []
     for line in last_output.splitlines():
         if not line:
             continue
@@ -105,35 +282,171 @@ def get_users_at(
 
         try:
             from_timestamp = _to_timestamp(from_s, now)
-            if timestamp < from_timestamp:
-                continue
         except Exception:
             LOG.error("Problematic1 last line: <%s>", line)
             continue
 
-        if duration_s is None:
-            # Still logged in
-            users.add(username)
-            continue
+        end = STILL_LOGGED_IN
+        if duration_s is not None:
+            try:
+                duration_delta = _to_timedelta(duration_s)
+                end = (from_timestamp + duration_delta).timestamp()
+            except Exception:
+                LOG.error("Problematic2 last line: <%s>", line)
 
-        try:
-            duration_delta = _to_timedelta(duration_s)
-            to_timestamp = from_timestamp + duration_delta
-            if timestamp > to_timestamp:
+        sessions.append(Session(username, from_timestamp.timestamp(), end))
+
+    return sessions
+
+
+class SessionIndex:
+    """
+    Answers "who was logged in at time T" in logarithmic time.
+
+    Sessions are sorted by start time, so the sessions started before T are a
+    prefix of the list. To find the ones in that prefix that also end after T,
+    we keep a binary tree over the list where each node knows the latest end
+    time below it. Subtrees ending before T can then be skipped entirely.
+    """
+
+    def __init__(self, sessions: List[Session]) -> None:
+        sessions = sorted(sessions, key=lambda session: session.start)
+        self._starts = array("d", [session.start for session in sessions])
+        self._usernames = [session.username for session in sessions]
+        self._ends = array("d", [session.end for session in sessions])
+
+        # Implicit binary tree, node N has children 2N and 2N+1, leaves start at
+        # self._leaf_count
+        leaf_count = 1
+        while leaf_count < len(sessions):
+            leaf_count *= 2
+        self._leaf_count = leaf_count
+
+        self._max_ends = array("d", [float("-inf")]) * (2 * leaf_count)
+        for session_index, session in enumerate(sessions):
+            self._max_ends[leaf_count + session_index] = session.end
+        for node in range(leaf_count - 1, 0, -1):
+            self._max_ends[node] = max(
+                self._max_ends[2 * node], self._max_ends[2 * node + 1]
+            )
+
+    def __len__(self) -> int:
+        return len(self._usernames)
+
+    def get_users_at(self, timestamp: float) -> Set[str]:
+        users: Set[str] = set()
+
+        # Sessions at indices below this started before timestamp
+        started_count = bisect.bisect_right(self._starts, timestamp)
+        if started_count == 0:
+            return users
+
+        # Node, the first session index covered by that node, and how many
+        # sessions the node covers
+        stack: List[Tuple[int, int, int]] = [(1, 0, self._leaf_count)]
+        while stack:
+            node, first_index, width = stack.pop()
+            if first_index >= started_count:
                 continue
-        except Exception:
-            LOG.error("Problematic2 last line: <%s>", line)
+            if self._max_ends[node] < timestamp:
+                # Everything below here ended before timestamp
+                continue
+
+            if node >= self._leaf_count:
+                users.add(self._usernames[node - self._leaf_count])
+                continue
+
+            child_width = width // 2
+            stack.append((2 * node, first_index, child_width))
+            stack.append((2 * node + 1, first_index + child_width, child_width))
+
+        return users
 
-        users.add(username)
+    def get_users_at_many(self, timestamps: Sequence[float]) -> List[Set[str]]:
+        """
+        Like get_users_at() for each timestamp, but in one sweep over the
+        sessions rather than one lookup per timestamp.
+        """
+        results: List[Set[str]] = [set() for _ in timestamps]
 
-    return users
+        # Sessions started so far, as (end, session index) with the earliest
+        # end first
+        ongoing: List[Tuple[float, int]] = []
+        next_session = 0
 
+        order = sorted(range(len(timestamps)), key=lambda i: timestamps[i])
+        for timestamp_index in order:
+            timestamp = timestamps[timestamp_index]
 
-def call_last():
+            while (
+                next_session < len(self._starts)
+                and self._starts[next_session] <= timestamp
+            ):
+                heapq.heappush(ongoing, (self._ends[next_session], next_session))
+                next_session += 1
+
+            while ongoing and ongoing[0][0] < timestamp:
+                # We go through timestamps in order, so this session is over for
+                # all remaining timestamps as well
+                heapq.heappop(ongoing)
+
+            results[timestamp_index] = {
+                self._usernames[session_index] for _, session_index in ongoing
+            }
+
+        return results
+
+
+# wtmp (path, mtime, size) and an index of its contents
+_session_index_cache: Optional[Tuple[Tuple[str, float, int], SessionIndex]] = None
+
+
+def get_session_index(path: str = WTMP_PATH) -> Optional[SessionIndex]:
+    """
+    Returns None if there is no wtmp file, or if we aren't allowed to read it.
+
+    The index is cached until wtmp changes.
+    """
+    global _session_index_cache
+
+    try:
+        stat = os.stat(path)
+    except (IOError, OSError):
+        return None
+    cache_key = (path, stat.st_mtime, stat.st_size)
+
+    cached = _session_index_cache
+    if cached is not None and cached[0] == cache_key:
+        return cached[1]
+
+    sessions = read_wtmp(path)
+    if sessions is None:
+        return None
+
+    session_index = SessionIndex(sessions)
+    _session_index_cache = (cache_key, session_index)
+    return session_index
+
+
+def call_last(cancel: Optional[threading.Event] = None) -> str:
     """
     Call last and return the result as one big string
+
+    If last takes too long we go with what we got so far. last prints the most
+    recent sessions first, so that's usually still useful.
+
+    Setting the cancel event kills last, see px_exec_util.StreamingRun.
     """
-    return px_exec_util.run(["last"])
+    last = px_exec_util.StreamingRun(
+        ["last"], timeout_seconds=LAST_TIMEOUT_SECONDS, cancel=cancel
+    )
+    lines = list(last)
+    if not last.complete:
+        LOG.warning(
+            "last timed out after %ds, login history is incomplete",
+            LAST_TIMEOUT_SECONDS,
+        )
+    return "\n".join(lines)
 
 
 def _to_timestamp(string, now):
@@ -18,6 +18,9 @@ PAGE_SIZE_RE = re.compile(r"page size of ([0-9]+) bytes")
 # "vm.swapusage: total = 2048.00M  used = 562.75M  free = 1485.25M  (encrypted)"
 SWAPUSAGE_RE = re.compile(r".*used = ([0-9.]+)M.*")
 
+# vm_stat is normally instant, don't let a hung one stall ptop
+VM_STAT_TIMEOUT_SECONDS = 5.0
+
 
 def get_meminfo() -> str:
     total_ram_bytes, wanted_ram_bytes = _get_ram_numbers()
@@ -156,7 +159,14 @@ def _get_ram_numbers_macos() -> Optional[Tuple[int, int]]:
 
 def _get_vmstat_output_lines() -> Optional[List[str]]:
     try:
-        return px_exec_util.run(["vm_stat"]).splitlines()
+        vm_stat = px_exec_util.StreamingRun(
+            ["vm_stat"], timeout_seconds=VM_STAT_TIMEOUT_SECONDS
+        )
+        lines = list(vm_stat)
+        if not vm_stat.complete:
+            # Partial output would give us wrong numbers
+            return None
+        return lines
     except (IOError, OSError) as e:
         if e.errno == errno.ENOENT:
             # vm_stat not found, we're probably not on OSX
@@ -8,6 +8,7 @@ from . import px_processinfo
 
 from . import px_process
 from typing import List
+from typing import Iterable
 from typing import Optional
 
 LOG = logging.getLogger(__name__)
@@ -26,12 +27,10 @@ def _pump_info_to_fd(with_fileno, process, processes):
         with_fileno.close()
     except OSError as e:
         if e.errno == errno.EPIPE:
-            # The user probably just exited the pager before we were done piping into it
+            # The user probably just exited the pager before we were done piping into it.
+            # Any lsof or last still running has already been killed by
+            # print_process_info() at this point.
             LOG.debug("Lost contact with pager, errno %d", e.errno)
-
-            # FIXME: If an lsof instance was spawned by our px_processinfo.print_process_info()
-            # call above (this is likely), we may want to kill that particular lsof instance.
-            # It will use a bunch of CPU for some time, and we will never use its result anyway.
         else:
             LOG.warning(
                 "Unexpected OSError pumping process info into pager", exc_info=True
@@ -115,7 +114,7 @@ def launch_pager():
 
 
 def page_process_info(
-    process: px_process.PxProcess, processes: List[px_process.PxProcess]
+    process: px_process.PxProcess, processes: Iterable[px_process.PxProcess]
 ) -> None:
     pager = launch_pager()
     pager_stdin = pager.stdin
@@ -1,15 +1,28 @@
 import os
 import time
+import datetime
 import threading
 
 from . import px_load
+from . import px_cgroup
 from . import px_ioload
+from . import px_pressure
 from . import px_meminfo
+from . import px_procfs
+from . import px_smaps
 from . import px_process
+from . import px_processio
+from . import px_procevents
+from . import px_sort_order
 from . import px_launchcounter
+from . import px_category_bar
 
-from typing import Optional
+from typing import Dict
 from typing import List
+from typing import Iterable
+from typing import Tuple
+from typing import Sequence
+from typing import Optional
 
 
 # We'll report poll done as this key having been pressed.
@@ -21,12 +34,263 @@ POLL_COMPLETE_KEY = "\x01"
 # than that for the pause to be useful while scrolling.
 SHORT_PAUSE_SECONDS = 0.1
 
+# ptop shows the launches in at most 30% of the screen height, so this should be
+# enough for any reasonable terminal
+LAUNCHCOUNTER_MAX_LINES = 100
+
+
+def adjust_cpu_times(
+    baseline: Dict[int, Tuple[datetime.datetime, float]],
+    current: Iterable[px_process.PxProcess],
+) -> List[px_process.PxProcess]:
+    """
+    Identify processes in current that are also in baseline.
+
+    For all matches, subtract the baseline process' CPU time usage from the
+    current process' one.
+
+    This way we get CPU times computed from when "px --top" was started, rather
+    than from when each process was started.
+
+    The processes in current are updated in place, so only call this once per
+    snapshot. Baseline is not changed by this function.
+
+    Pass a px_process.ProcessSnapshot as current to reuse its PID index.
+    """
+    snapshot = px_process.to_snapshot(current)
+
+    for baseline_pid, baseline_times in baseline.items():
+        baseline_start_time, baseline_cputime = baseline_times
+        current_proc = snapshot.get_by_pid(baseline_pid)
+        if current_proc is None:
+            # This process is newer than the baseline
+            continue
+
+        if current_proc.start_time != baseline_start_time:
+            # This PID has been reused
+            continue
+
+        if current_proc.cpu_time_seconds is None:
+            # We can't subtract from None
+            continue
+
+        if baseline_cputime is None:
+            # We can't subtract None
+            continue
+
+        if current_proc.cpu_time_seconds and baseline_cputime:
+            current_proc.set_cpu_time_seconds(
+                current_proc.cpu_time_seconds - baseline_cputime
+            )
+
+    return list(snapshot)
+
+
+def compute_aggregated_cpu_times(toplist: List[px_process.PxProcess]) -> None:
+    """
+    Compute aggregated CPU times for all processes in the toplist.
+
+    This function modifies the toplist in place.
+    """
+
+    # First, find the root process
+    root_process = toplist[0]
+    while root_process.parent is not None:
+        root_process = root_process.parent
+
+    # Now, walk the process tree and compute aggregated CPU times
+    def walk_tree(proc: px_process.PxProcess) -> float:
+        sum = proc.cpu_time_seconds or 0
+        for child in proc.children:
+            sum += walk_tree(child)
+        proc.set_aggregated_cpu_time_seconds(sum)
+        return sum
+
+    walk_tree(root_process)
+
+
+def get_notnone_cpu_time_seconds(proc: px_process.PxProcess) -> float:
+    seconds = proc.cpu_time_seconds
+    if seconds is not None:
+        return seconds
+    return 0
+
+
+def get_notnone_memory_percent(proc: px_process.PxProcess) -> float:
+    percent = proc.memory_percent
+    if percent is not None:
+        return percent
+    return 0
+
+
+def get_notnone_io_bytes_per_second(proc: px_process.PxProcess) -> float:
+    bytes_per_second = proc.io_bytes_per_second
+    if bytes_per_second is not None:
+        return bytes_per_second
+    return 0
+
+
+def get_notnone_pss_kb(proc: px_process.PxProcess) -> float:
+    pss_kb = proc.pss_kb
+    if pss_kb is not None:
+        return pss_kb
+    return 0
+
+
+def sort_by_cpu_usage(
+    toplist: List[px_process.PxProcess],
+) -> List[px_process.PxProcess]:
+    can_sort_by_time = False
+    for process in toplist:
+        metric = process.cpu_time_seconds
+        if metric:
+            can_sort_by_time = True
+            break
+
+    if can_sort_by_time:
+        # There is at least one > 0 time in the process list, so sorting by time
+        # will be of some use
+        key = get_notnone_cpu_time_seconds
+        return sorted(toplist, key=key, reverse=True)
+
+    # No > 0 time in the process list, try CPU percentage as an approximation of
+    # that. This should happen on the first iteration when ptop has just been
+    # launched.
+    return sorted(toplist, key=lambda process: process.cpu_percent or 0, reverse=True)
+
+
+def sort_by_cpu_usage_tree(
+    toplist: List[px_process.PxProcess],
+) -> List[px_process.PxProcess]:
+    """
+    Sort the process list by aggregated CPU time, but keep the tree structure.
+    """
+    root_process = toplist[0]
+    while root_process.parent is not None:
+        root_process = root_process.parent
+
+    def sort_children(proc: px_process.PxProcess) -> None:
+        proc.children = sorted(
+            proc.children,
+            key=lambda child: child.aggregated_cpu_time_seconds,
+            reverse=True,
+        )
+        for child in proc.children:
+            sort_children(child)
+
+    sort_children(root_process)
+
+    # Now, recreate the list by flattening the tree
+    flat_list = []
+
+    def flatten(proc: px_process.PxProcess, level=0) -> None:
+        proc.level = level
+        flat_list.append(proc)
+        for child in proc.children:
+            flatten(child, level + 1)
+
+    flatten(root_process)
+
+    return flat_list
+
+
+def sort_by_cgroup(
+    toplist: Sequence[px_process.PxProcess],
+    cgroup_ranks: Optional[Dict[str, int]],
+) -> List[px_process.PxProcess]:
+    """
+    Group processes by control group, busiest group first. Processes keep their
+    toplist order within each group, and processes without a known control
+    group go last.
+    """
+    ranks = cgroup_ranks or {}
+    no_rank = len(ranks)
+
+    def get_rank(process: px_process.PxProcess) -> int:
+        if process.cgroup is None:
+            return no_rank
+        return ranks.get(process.cgroup, no_rank)
+
+    # Stable sort, so the toplist order is kept within each group
+    return sorted(toplist, key=get_rank)
+
+
+class Toplists:
+    """
+    Process lists ready for display, one per sort order.
+
+    Created by the poller thread for each new process snapshot, so the UI thread
+    can switch between sort orders without doing any work.
+
+    Note that the lists share their process objects with the snapshot they were
+    made from, and building them changes those objects. Aggregated CPU times get
+    computed, and sort_by_cpu_usage_tree() reorders children and sets levels.
+    This all happens in the poller thread before anybody else gets to see the
+    snapshot, so don't reuse process objects between snapshots.
+    """
+
+    def __init__(
+        self,
+        processes: List[px_process.PxProcess],
+        cgroup_ranks: Optional[Dict[str, int]] = None,
+    ) -> None:
+        """
+        Note that CPU times in processes are expected to already have been
+        adjusted, see adjust_cpu_times().
+
+        cgroup_ranks maps control group paths to their display order, see
+        px_cgroup.CgroupTracker.get_cgroup_ranks().
+        """
+        self._toplists: Dict[px_sort_order.SortOrder, Tuple[px_process.PxProcess, ...]]
+        self._toplists = {}
+        if not processes:
+            for sort_order in px_sort_order.SortOrder:
+                self._toplists[sort_order] = ()
+            return
+
+        compute_aggregated_cpu_times(processes)
+
+        # Sort by interestingness last
+        best_first = px_process.order_best_first(processes)
+
+        self._toplists[px_sort_order.SortOrder.CPU] = tuple(
+            sort_by_cpu_usage(best_first)
+        )
+        self._toplists[px_sort_order.SortOrder.MEMORY] = tuple(
+            sorted(best_first, key=get_notnone_memory_percent, reverse=True)
+        )
+        self._toplists[px_sort_order.SortOrder.AGGREGATED_CPU] = tuple(
+            sort_by_cpu_usage_tree(best_first)
+        )
+        self._toplists[px_sort_order.SortOrder.IO] = tuple(
+            sorted(best_first, key=get_notnone_io_bytes_per_second, reverse=True)
+        )
+        self._toplists[px_sort_order.SortOrder.PSS] = tuple(
+            sorted(best_first, key=get_notnone_pss_kb, reverse=True)
+        )
+        self._toplists[px_sort_order.SortOrder.CGROUP] = tuple(
+            sort_by_cgroup(self._toplists[px_sort_order.SortOrder.CPU], cgroup_ranks)
+        )
+
+    def get(
+        self, sort_order: px_sort_order.SortOrder
+    ) -> Tuple[px_process.PxProcess, ...]:
+        return self._toplists[sort_order]
+
 
 class PxPoller:
-    def __init__(self, poll_complete_notification_fd: Optional[int] = None) -> None:
+    def __init__(
+        self,
+        poll_complete_notification_fd: Optional[int] = None,
+        procevents: Optional[px_procevents.ProcEventListener] = None,
+    ) -> None:
         """
         After a poll is done and there is new data, a POLL_COMPLETE_KEY will be
         written to the poll_complete_notification_fd file descriptor.
+
+        If we get a process events listener, launches are counted from its
+        events as well as from polling. That way we'll count processes that
+        are too short lived to ever show up in a poll.
         """
         self.thread: Optional[threading.Thread] = None
 
@@ -36,15 +300,44 @@ class PxPoller:
 
         self._ioload = px_ioload.PxIoLoad()
         self._ioload_string = "None"
+        self._disk_string = ""
+
+        self._pressure = px_pressure.PxPressure()
+        self._pressure_string = ""
 
-        self._loadstring = "None"
+        self._load_values: Optional[Tuple[float, float, float]] = None
+        self._load_history = px_load.LoadHistory()
+
+        # Linux only, None until we have at least one sample
+        self._load_history_values: Optional[List[float]] = None
+        self._load_history_timestamps: Optional[List[float]] = None
+
+        # Linux only
+        self._core_usage = px_load.CoreUsage()
+        self._core_usages: List[float] = []
 
         self._meminfo = "None"
 
-        self._all_processes: List[px_process.PxProcess] = []
+        self._snapshot = px_process.ProcessSnapshot([])
+
+        # CPU times are reported relative to the first process poll, so that
+        # ptop shows which processes have been busy since it was started
+        self._baseline: Optional[Dict[int, Tuple[datetime.datetime, float]]] = None
+
+        self._category_aggregates = px_category_bar.CategoryAggregates([])
+        self._toplists = Toplists([])
+
+        self._process_io = px_processio.ProcessIo()
+        self._cgroups = px_cgroup.CgroupTracker()
+
+        # Expensive, so only collected when somebody wants to see it
+        self._process_memory = px_smaps.ProcessMemory()
+        self._process_memory_enabled = False
 
         self._launchcounter = px_launchcounter.Launchcounter()
+        self._procevents = procevents
         self._launchcounter_screen_lines: List[str] = []
+        self._launchrate_lines: List[str] = []
 
         # No process polling until this timestamp, timestamp from time.time()
         self._pause_process_updates_until = 0.0
@@ -52,6 +345,13 @@ class PxPoller:
         # Ensure we have current data already at the start
         self.poll_once()
 
+    def set_process_memory_enabled(self, enabled: bool) -> None:
+        """
+        Start or stop collecting PSS, USS and swap per process, see px_smaps.py.
+        """
+        with self.lock:
+            self._process_memory_enabled = enabled
+
     def pause_process_updates_a_bit(self):
         with self.lock:
             self._pause_process_updates_until = time.time() + SHORT_PAUSE_SECONDS
@@ -69,15 +369,53 @@ class PxPoller:
                 return
 
         # Poll processes
-        all_processes = px_process.get_all()
+        snapshot = px_process.get_snapshot()
+        if self._baseline is None:
+            self._baseline = {
+                p.pid: (p.start_time, p.cpu_time_seconds or 0.0) for p in snapshot
+            }
+        all_processes = adjust_cpu_times(self._baseline, snapshot)
+
+        # Sampled less often than we poll, but the latest rates go on every
+        # snapshot
+        self._process_io.update(all_processes)
+        self._process_io.apply(all_processes)
+
+        with self.lock:
+            process_memory_enabled = self._process_memory_enabled
+        if process_memory_enabled:
+            self._process_memory.update(all_processes)
+            self._process_memory.apply(all_processes)
+
+        # Linux only, does nothing without cgroup v2
+        self._cgroups.update(all_processes)
+
+        # Prepare everything the UI thread needs here, so that it only has to
+        # slice and render
+        toplists = Toplists(all_processes, self._cgroups.get_cgroup_ranks())
+        category_aggregates = px_category_bar.CategoryAggregates(
+            all_processes,
+            ram_by_cgroup=self._cgroups.get_ram_by_cgroup(),
+            cpu_by_cgroup=self._cgroups.get_cpu_by_cgroup(),
+        )
         with self.lock:
-            self._all_processes = all_processes
+            self._snapshot = snapshot
+            self._toplists = toplists
+            self._category_aggregates = category_aggregates
 
         # Keep a launchcounter rendering up to date
-        self._launchcounter.update(all_processes)
-        launchcounter_screen_lines = self._launchcounter.get_screen_lines()
+        if self._procevents is not None:
+            self._launchcounter.register_events(self._procevents.get_events())
+        self._launchcounter.update(snapshot)
+        launchcounter_screen_lines = self._launchcounter.get_screen_lines(
+            max_lines=LAUNCHCOUNTER_MAX_LINES
+        )
+        launchrate_lines = self._launchcounter.get_rate_lines(
+            max_lines=LAUNCHCOUNTER_MAX_LINES
+        )
         with self.lock:
             self._launchcounter_screen_lines = launchcounter_screen_lines
+            self._launchrate_lines = launchrate_lines
 
         # Poll memory
         meminfo = px_meminfo.get_meminfo()
@@ -86,15 +424,38 @@ class PxPoller:
 
         # Poll system load
         load = px_load.get_load_values()
-        loadstring = px_load.get_load_string(load)
+        load_history_values = None
+        load_history_timestamps = None
+        proc_stat = px_procfs.read_proc_file("/proc/stat")
+        core_usages: List[float] = []
+        if proc_stat is not None:
+            self._core_usage.update(proc_stat)
+            core_usages = self._core_usage.usages.tolist()
+
+            procs_running = px_load.parse_procs_running(proc_stat)
+            if procs_running is not None:
+                self._load_history.add(procs_running)
+                load_history_values = self._load_history.get_values()
+                load_history_timestamps = self._load_history.get_timestamps()
         with self.lock:
-            self._loadstring = loadstring
+            self._load_values = load
+            self._load_history_values = load_history_values
+            self._load_history_timestamps = load_history_timestamps
+            self._core_usages = core_usages
 
         # Poll IO
         self._ioload.update()
         ioload_string = self._ioload.get_load_string()
+        disk_string = self._ioload.get_disk_string()
         with self.lock:
             self._ioload_string = ioload_string
+            self._disk_string = disk_string
+
+        # Poll pressure stall information
+        self._pressure.update()
+        pressure_string = self._pressure.get_pressure_string()
+        with self.lock:
+            self._pressure_string = pressure_string
 
         # Notify fd that we have new data
         if self.poll_complete_notification_fd is not None:
@@ -113,20 +474,72 @@ class PxPoller:
 
     def get_all_processes(self) -> List[px_process.PxProcess]:
         with self.lock:
-            return self._all_processes
+            return self._snapshot.processes
+
+    def get_snapshot(self) -> px_process.ProcessSnapshot:
+        """
+        The most recent process snapshot, with CPU times adjusted as described
+        in adjust_cpu_times().
+        """
+        with self.lock:
+            return self._snapshot
+
+    def get_toplist(
+        self, sort_order: px_sort_order.SortOrder
+    ) -> Tuple[px_process.PxProcess, ...]:
+        with self.lock:
+            return self._toplists.get(sort_order)
+
+    def get_category_aggregates(self) -> px_category_bar.CategoryAggregates:
+        with self.lock:
+            return self._category_aggregates
 
     def get_ioload_string(self) -> str:
         with self.lock:
             return self._ioload_string
 
+    def get_disk_string(self) -> str:
+        with self.lock:
+            return self._disk_string
+
     def get_launchcounter_lines(self) -> List[str]:
         with self.lock:
             return self._launchcounter_screen_lines
 
+    def get_launchrate_lines(self) -> List[str]:
+        with self.lock:
+            return self._launchrate_lines
+
+    def get_pressure_string(self) -> str:
+        """
+        Empty if pressure stall information isn't available.
+        """
+        with self.lock:
+            return self._pressure_string
+
     def get_meminfo(self) -> str:
         with self.lock:
             return self._meminfo
 
-    def get_loadstring(self) -> str:
+    def get_core_usages(self) -> List[float]:
+        """
+        Usage per CPU core since the previous poll, 0.0-1.0. Empty if not
+        available.
+        """
+        with self.lock:
+            return self._core_usages
+
+    def get_loadstring(self, graph_chars: int = 8) -> str:
+        """
+        The load history graph will be at most graph_chars characters wide.
+        """
         with self.lock:
-            return self._loadstring
+            load_values = self._load_values
+            history = self._load_history_values
+            history_timestamps = self._load_history_timestamps
+
+        if load_values is None:
+            return "None"
+        return px_load.get_load_string(
+            load_values, history, graph_chars, history_timestamps
+        )
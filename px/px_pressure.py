@@ -0,0 +1,187 @@
+"""
+Pressure stall information from /proc/pressure, Linux 4.20 and up.
+
+For each of CPU, memory and IO this tells us the percentage of time some
+processes (and for memory and IO also all processes) were stalled waiting for
+that resource.
+
+Ref: https://docs.kernel.org/accounting/psi.html
+"""
+
+import time
+import logging
+import collections
+
+from . import px_load
+from . import px_procfs
+from . import px_terminal
+
+from typing import Deque
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Optional
+
+
+LOG = logging.getLogger(__name__)
+
+# Resource names and screen labels, in display order
+RESOURCES = [("cpu", "CPU"), ("memory", "Memory"), ("io", "IO")]
+
+# Samples to keep per resource. Two samples per character, so 8 characters.
+HISTORY_LENGTH = 16
+
+# Graphs are scaled to the highest value in the history, but never to less than
+# this. Otherwise a few tenths of a percent of pressure would look alarming.
+MIN_GRAPH_PEAK_PERCENT = 10.0
+
+
+def parse_pressure(contents: str) -> Dict[str, Tuple[float, int]]:
+    """
+    Parse the contents of a /proc/pressure file.
+
+    Returns a dict from "some" and "full" to (avg10, total) tuples. avg10 is a
+    percentage, total is stall time in microseconds.
+
+    Example input:
+      some avg10=3.10 avg60=3.45 avg300=3.27 total=39183129
+      full avg10=0.00 avg60=0.00 avg300=0.00 total=0
+    """
+    parsed: Dict[str, Tuple[float, int]] = {}
+    for line in contents.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+
+        values: Dict[str, str] = {}
+        for field in fields[1:]:
+            name, _, value = field.partition("=")
+            values[name] = value
+
+        if "avg10" not in values or "total" not in values:
+            continue
+
+        parsed[fields[0]] = (float(values["avg10"]), int(values["total"]))
+
+    return parsed
+
+
+def read_pressure(resource: str) -> Optional[Dict[str, Tuple[float, int]]]:
+    """
+    Returns None if pressure information isn't available for this resource.
+    """
+    try:
+        contents = px_procfs.read_proc_file("/proc/pressure/" + resource)
+    except (IOError, OSError) as e:
+        # Happens with EOPNOTSUPP if the kernel was booted with psi=0
+        LOG.debug("Pressure stall information not available: %s", e)
+        return None
+
+    if contents is None:
+        return None
+
+    return parse_pressure(contents)
+
+
+class ResourcePressure:
+    """
+    Pressure history for one resource, like "memory".
+    """
+
+    def __init__(self, resource: str) -> None:
+        self.resource = resource
+
+        # Previous stall totals for "some" and "full", with a time.time()
+        # timestamp for when we got them
+        self._previous_totals: Optional[Dict[str, int]] = None
+        self._previous_timestamp = 0.0
+
+        # Most recent percentages
+        self.percentages: Dict[str, float] = {}
+
+        self.some_history: Deque[float] = collections.deque(maxlen=HISTORY_LENGTH)
+
+    def update(self, parsed: Dict[str, Tuple[float, int]], now: float) -> None:
+        totals = {kind: total for kind, (_, total) in parsed.items()}
+
+        percentages: Dict[str, float] = {}
+        for kind, (avg10, total) in parsed.items():
+            previous_total = None
+            if self._previous_totals is not None:
+                previous_total = self._previous_totals.get(kind)
+
+            elapsed_us = (now - self._previous_timestamp) * 1_000_000
+            if previous_total is None or elapsed_us <= 0:
+                # First sample, go with the kernel's ten second average
+                percentages[kind] = avg10
+                continue
+
+            percentage = 100.0 * (total - previous_total) / elapsed_us
+            percentages[kind] = max(0.0, min(100.0, percentage))
+
+        self.percentages = percentages
+        if "some" in percentages:
+            self.some_history.append(percentages["some"])
+
+        self._previous_totals = totals
+        self._previous_timestamp = now
+
+    def get_graph(self) -> str:
+        peak = max(list(self.some_history) + [MIN_GRAPH_PEAK_PERCENT])
+        levels = [px_load.average_to_level(value, peak) for value in self.some_history]
+        return str(px_load.levels_to_graph(levels))
+
+
+def _format_percentage(percentage: float) -> str:
+    if percentage < 10:
+        return f"{percentage:.1f}%"
+    return f"{percentage:.0f}%"
+
+
+class PxPressure:
+    def __init__(self) -> None:
+        self._resources = [ResourcePressure(resource) for resource, _ in RESOURCES]
+
+        # False once we know there is no pressure information to be had
+        self._available = True
+
+    def update(self, now: Optional[float] = None) -> None:
+        if not self._available:
+            return
+
+        if now is None:
+            now = time.time()
+
+        for resource_pressure in self._resources:
+            parsed = read_pressure(resource_pressure.resource)
+            if parsed is None:
+                # Not Linux, too old a kernel, or turned off
+                self._available = False
+                return
+
+            resource_pressure.update(parsed, now)
+
+    def get_pressure_string(self) -> str:
+        """
+        Returns an empty string if pressure information isn't available.
+
+        Example return value, "full" is not shown for CPU since it's undefined
+        on the system level:
+          "CPU [3.1% GRAPH]  Memory [0.0% / 0.0% GRAPH]  IO [12% / 2.5% GRAPH]"
+        """
+        if not self._available:
+            return ""
+
+        parts: List[str] = []
+        for resource_pressure, (_, label) in zip(self._resources, RESOURCES):
+            percentages = resource_pressure.percentages
+            if "some" not in percentages:
+                continue
+
+            numbers = px_terminal.bold(_format_percentage(percentages["some"]))
+            if "full" in percentages and resource_pressure.resource != "cpu":
+                numbers += " / " + _format_percentage(percentages["full"])
+
+            parts.append(f"{label} [{numbers} {resource_pressure.get_graph()}]")
+
+        return "  ".join(parts)
@@ -1,3 +1,4 @@
+import bisect
 import logging
 import datetime
 import operator
@@ -8,6 +9,7 @@ import pwd
 import errno
 import subprocess
 
+from . import px_units
 from . import px_commandline
 from . import px_exec_util
 
@@ -16,6 +18,9 @@ from typing import Dict
 from typing import Optional
 from typing import List
 from typing import Iterable
+from typing import Iterator
+from typing import Tuple
+from typing import Set
 
 
 LOG = logging.getLogger(__name__)
@@ -26,6 +31,9 @@ PS_LINE = re.compile(
     " *([0-9]+) +([0-9]+) +([0-9]+) +([A-Za-z0-9: ]+) +([^ ]+) +([0-9.]+) +([-0-9.:]+) +([0-9.]+) +(.*)"
 )
 
+# Columns for ps to list, in the order PS_LINE expects them
+PS_COLUMNS = "pid=,ppid=,rss=,lstart=,uid=,pcpu=,time=,%mem=,command="
+
 # Match + group: "1:02.03"
 CPUTIME_OSX = re.compile(r"^([0-9]+):([0-9][0-9]\.[0-9]+)$")
 
@@ -143,6 +151,10 @@ class PxProcess:
 
         self.set_cpu_time_seconds(cpu_time)
         self.set_aggregated_cpu_time_seconds(aggregated_cpu_time)
+        self.set_io_bytes_per_second(None)
+        self.set_cgroup(None, None)
+        self.set_memory_details(None, None, None)
+        self.set_logins(None)
 
         self.children: List[PxProcess] = []
         self.parent: Optional[PxProcess] = None
@@ -182,6 +194,44 @@ class PxProcess:
         self.aggregated_cpu_time_s = seconds_to_str(seconds)
         self.aggregated_cpu_time_seconds = seconds
 
+    def set_io_bytes_per_second(self, bytes_per_second: Optional[float]) -> None:
+        """
+        Storage bytes read plus written per second, see px_processio.py.
+        """
+        self.io_s: str = "--"
+        self.io_bytes_per_second = bytes_per_second
+        if bytes_per_second is not None:
+            rounded = int(round(bytes_per_second))
+            self.io_s = px_units.bytes_to_strings(rounded, rounded)[0] + "/s"
+
+    def set_memory_details(
+        self, pss_kb: Optional[int], uss_kb: Optional[int], swap_kb: Optional[int]
+    ) -> None:
+        """
+        Proportional, unique and swapped out memory, see px_smaps.py.
+        """
+        self.pss_kb = pss_kb
+        self.uss_kb = uss_kb
+        self.swap_kb = swap_kb
+
+        self.pss_s: str = kb_to_str(pss_kb)
+        self.uss_s: str = kb_to_str(uss_kb)
+        self.swap_s: str = kb_to_str(swap_kb)
+
+    def set_cgroup(self, cgroup: Optional[str], cgroup_s: Optional[str]) -> None:
+        """
+        Control group path and display string, see px_cgroup.py.
+        """
+        self.cgroup = cgroup
+        self.cgroup_s: str = cgroup_s or "--"
+
+    def set_logins(self, logins: Optional[Set[str]]) -> None:
+        """
+        Users logged in when this process started, see px_loginhistory.py.
+        """
+        self.logins = logins
+        self.logins_s: str = ", ".join(sorted(logins)) if logins else "--"
+
     def match(self, string, require_exact_user=True):
         """
         Returns True if this process matches the string.
@@ -432,12 +482,7 @@ def get_all() -> List[PxProcess]:
     # If you want to change this, try benchmark_proc_get_all.py and make sure
     # you don't regress.
     close_fds = False
-    command = [
-        "/bin/ps",
-        "-ax",
-        "-o",
-        "pid=,ppid=,rss=,lstart=,uid=,pcpu=,time=,%mem=,command=",
-    ]
+    command = ["/bin/ps", "-ax", "-o", PS_COLUMNS]
 
     with open(os.devnull, "w", encoding="utf-8") as DEVNULL:
         with subprocess.Popen(
@@ -536,6 +581,214 @@ def order_best_first(processes: Iterable[PxProcess]) -> List[PxProcess]:
     return order_best_last(processes)[::-1]
 
 
+class StartTimeIndex:
+    """
+    Processes ordered by start time.
+
+    Build this once per process snapshot, then ask it about as many processes
+    as you like.
+    """
+
+    def __init__(self, processes: Iterable[PxProcess]) -> None:
+        self._processes = sorted(processes, key=operator.attrgetter("age_seconds"))
+        self._ages = [process.age_seconds for process in self._processes]
+
+    def get_closest_starts(self, process: PxProcess) -> List[PxProcess]:
+        """
+        Return the processes that were started closest in time to process, not
+        including process itself.
+
+        All processes started within 1s of process are returned, or the five
+        closest if not at least five were that close.
+
+        Returned processes are sorted by age, oldest first, and then by command
+        and PID.
+        """
+        age = process.age_seconds
+
+        # Everything within 1s is in [first, end)
+        first = bisect.bisect_left(self._ages, age - 1)
+        end = bisect.bisect_right(self._ages, age + 1)
+        others = sum(1 for p in self._processes[first:end] if p is not process)
+
+        # Widen the window one process at a time, towards whichever neighbor is
+        # closest. "5" is arbitrarily chosen, look at the printouts to see if it
+        # needs tuning.
+        while others < 5 and (first > 0 or end < len(self._ages)):
+            if end == len(self._ages) or (
+                first > 0 and age - self._ages[first - 1] <= self._ages[end] - age
+            ):
+                first -= 1
+            else:
+                end += 1
+            others += 1
+
+        closest = [p for p in self._processes[first:end] if p is not process]
+
+        # Sort closest processes by age, command and PID in that order
+        closest.sort(key=operator.attrgetter("command", "pid"))
+        closest.sort(key=operator.attrgetter("age_seconds"), reverse=True)
+        return closest
+
+
+class ProcessSnapshot:
+    """
+    A list of processes, with indexes for looking them up.
+
+    Build this once per process listing and share it, rather than having
+    everybody who needs to look up processes scan the list or build their own
+    indexes.
+
+    Iterating over a snapshot gives you its processes in listing order.
+    """
+
+    def __init__(self, processes: Iterable[PxProcess]) -> None:
+        self.processes: List[PxProcess] = list(processes)
+
+        self._pid_to_process: Dict[int, PxProcess] = {}
+        self._key_to_process: Dict[Tuple[int, datetime.datetime], PxProcess] = {}
+        self._ppid_to_children: Dict[int, List[PxProcess]] = {}
+        for process in self.processes:
+            self._pid_to_process[process.pid] = process
+            self._key_to_process[(process.pid, process.start_time)] = process
+            if process.ppid is not None:
+                self._ppid_to_children.setdefault(process.ppid, []).append(process)
+
+        # Built on first use, most snapshots never need it
+        self._start_time_index: Optional[StartTimeIndex] = None
+
+    def __iter__(self) -> Iterator[PxProcess]:
+        return iter(self.processes)
+
+    def __len__(self) -> int:
+        return len(self.processes)
+
+    def get_by_pid(self, pid: int) -> Optional[PxProcess]:
+        return self._pid_to_process.get(pid)
+
+    def get_by_key(self, key: Tuple[int, datetime.datetime]) -> Optional[PxProcess]:
+        """
+        Look up a process by PID and start time. Unlike a PID lookup, this
+        won't give you some other process that got the same PID later.
+        """
+        return self._key_to_process.get(key)
+
+    def get_children(self, pid: int) -> List[PxProcess]:
+        return list(self._ppid_to_children.get(pid, []))
+
+    def get_descendants(self, pid: int) -> List[PxProcess]:
+        """
+        Children, grandchildren and so on, parents before children.
+        """
+        descendants: List[PxProcess] = []
+        seen = {pid}
+        parents = [pid]
+        while parents:
+            next_parents: List[int] = []
+            for parent in parents:
+                for child in self._ppid_to_children.get(parent, []):
+                    # PID reuse can make the tree loop, don't go in circles
+                    if child.pid in seen:
+                        continue
+                    seen.add(child.pid)
+                    descendants.append(child)
+                    next_parents.append(child.pid)
+            parents = next_parents
+
+        return descendants
+
+    def get_start_time_index(self) -> StartTimeIndex:
+        if self._start_time_index is None:
+            self._start_time_index = StartTimeIndex(self.processes)
+        return self._start_time_index
+
+    def refreshed(self, pid: int) -> Optional["ProcessSnapshot"]:
+        """
+        Returns a copy of this snapshot with up to date details for one
+        process. That's a lot cheaper than getting a whole new snapshot when
+        you only care about the details of one process.
+
+        Returns None if the process isn't in this snapshot, or if it has gone
+        away since.
+
+        The other processes are shared with this snapshot, and the tree links of
+        its parent and children are updated to point to the fresh process.
+        """
+        fresh = get_one(pid)
+        if fresh is None:
+            return None
+
+        old = self.get_by_key((fresh.pid, fresh.start_time))
+        if old is None:
+            # Either newer than this snapshot, or the PID has been reused
+            return None
+
+        # Details that aren't from ps, but collected separately on request
+        fresh.set_io_bytes_per_second(old.io_bytes_per_second)
+        fresh.set_cgroup(old.cgroup, old.cgroup_s)
+        fresh.set_memory_details(old.pss_kb, old.uss_kb, old.swap_kb)
+        fresh.set_logins(old.logins)
+
+        fresh.parent = old.parent
+        fresh.children = old.children
+        fresh.level = old.level
+        for child in fresh.children:
+            child.parent = fresh
+        if fresh.parent is not None:
+            fresh.parent.children = [
+                fresh if sibling is old else sibling
+                for sibling in fresh.parent.children
+            ]
+
+        return ProcessSnapshot(
+            fresh if process is old else process for process in self.processes
+        )
+
+
+def to_snapshot(processes: Iterable[PxProcess]) -> ProcessSnapshot:
+    """
+    Returns processes as-is if it already is a snapshot, otherwise builds one.
+    """
+    if isinstance(processes, ProcessSnapshot):
+        return processes
+    return ProcessSnapshot(processes)
+
+
+def get_one(pid: int) -> Optional[PxProcess]:
+    """
+    List just one process, which is a lot quicker than get_all() on a busy
+    system.
+
+    Returns None if there is no such process. The returned process has no
+    parent or children, see ProcessSnapshot.refreshed() if you want those.
+    """
+    for process in get_many([pid]):
+        if process.pid == pid:
+            return process
+
+    return None
+
+
+def get_many(pids: Iterable[int]) -> List[PxProcess]:
+    """
+    List just these processes, using one ps invocation.
+
+    Processes that don't exist are left out. The returned processes have no
+    parents or children.
+    """
+    pids_string = ",".join(str(pid) for pid in pids)
+    if not pids_string:
+        return []
+
+    ps_output = px_exec_util.run(["/bin/ps", "-p", pids_string, "-o", PS_COLUMNS])
+    now = datetime.datetime.now().replace(tzinfo=TIMEZONE)
+    return [ps_line_to_process(ps_line, now) for ps_line in ps_output.splitlines()]
+
+
+def get_snapshot() -> ProcessSnapshot:
+    return ProcessSnapshot(get_all())
+
+
 def seconds_to_str(seconds: float) -> str:
     if seconds < 60:
         seconds_s = str(seconds)
@@ -558,3 +811,9 @@ def seconds_to_str(seconds: float) -> str:
     days = int(seconds / 86400)
     hours = int((seconds - 86400 * days) / 3600)
     return f"{days}d{hours:02d}h"
+
+
+def kb_to_str(kb: Optional[int]) -> str:
+    if kb is None:
+        return "--"
+    return px_units.bytes_to_strings(kb * 1024, kb * 1024)[0]
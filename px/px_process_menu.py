@@ -10,11 +10,16 @@ import errno
 import subprocess
 
 from . import px_pager
+from . import px_filter
 from . import px_process
+from . import px_bulkkill
 from . import px_terminal
-from . import px_processinfo
 
 from typing import Callable
+from typing import List
+from typing import Set
+from typing import Tuple
+from typing import Optional
 
 # Constants signal.SIGXXX are enums in Python 3. But we want the numbers (to
 # pass as an argument to /bin/kill), so we make our own int constants.
@@ -23,6 +28,10 @@ SIGKILL = 9
 
 KILL_TIMEOUT_SECONDS = 5
 
+# Appended to bulk kill menu entries that leave out protected processes, see
+# get_protected_pids()
+EXCLUDING_PROTECTED = " (excluding init, ptop and its parents)"
+
 
 def get_header_line(process: px_process.PxProcess) -> str:
     header_line = "Process: "
@@ -31,6 +40,28 @@ def get_header_line(process: px_process.PxProcess) -> str:
     return header_line
 
 
+def get_protected_pids(snapshot: px_process.ProcessSnapshot) -> Set[int]:
+    """
+    PIDs bulk kills must never touch: the kernel, init, ourselves and our
+    parents. Our parents are the user's shell, terminal multiplexer or SSH
+    session.
+    """
+    protected = {0, 1, os.getpid()}
+    pid = os.getppid()
+    while pid not in protected:
+        protected.add(pid)
+
+        parent = snapshot.get_by_pid(pid)
+        if parent is None:
+            # Not in the snapshot if it's newer than the snapshot
+            parent = px_process.get_one(pid)
+        if parent is None or parent.ppid is None:
+            break
+        pid = parent.ppid
+
+    return protected
+
+
 def kill(process: px_process.PxProcess, signo: int) -> bool:
     """
     Signal a process.
@@ -82,22 +113,73 @@ def sudo_kill(process: px_process.PxProcess, signo: int) -> bool:
 
 
 class PxProcessMenu:
-    # NOTE: Must match number constants in execute_menu_entry()
-    MENU_ENTRIES = [
-        "Show info",
-        "Kill process",
-        "Kill process as root",
-        "Back to process listing",
-    ]
-
-    def __init__(self, process: px_process.PxProcess) -> None:
+    def __init__(
+        self,
+        process: px_process.PxProcess,
+        snapshot: px_process.ProcessSnapshot,
+        search: Optional[str] = None,
+    ) -> None:
+        """
+        The snapshot is where process came from, the process info view and the
+        bulk kill entries get their other processes from there.
+
+        If there's a search, there will be an entry for killing all matching
+        processes.
+        """
         self.process = process
+        self.snapshot = snapshot
         self.done = False
 
         # Shown to user, status of last operation
         self.status = ""
 
-        # Index into MENU_ENTRIES
+        # Menu entry texts, and what to do when they get selected
+        self.menu_entries: List[Tuple[str, Callable[[], None]]] = [
+            ("Show info", self.page_process_info),
+            ("Kill process", lambda: self.kill_process(kill)),
+            ("Kill process as root", lambda: self.kill_process(sudo_kill)),
+        ]
+
+        # Bulk kills are easy to point at ourselves by mistake, by searching
+        # for "bash" or picking a process high up in the tree
+        protected_pids = get_protected_pids(snapshot)
+
+        def unprotected(
+            processes: List[px_process.PxProcess],
+        ) -> Tuple[List[px_process.PxProcess], str]:
+            """
+            Returns the processes we may kill, and a menu text suffix.
+            """
+            targets = [p for p in processes if p.pid not in protected_pids]
+            if len(targets) == len(processes):
+                return targets, ""
+            return targets, EXCLUDING_PROTECTED
+
+        descendants = snapshot.get_descendants(process.pid)
+        subtree, suffix = unprotected([process] + descendants)
+        if descendants and subtree:
+            self.menu_entries.append(
+                (
+                    f"Kill process and its {len(descendants)} descendants{suffix}",
+                    lambda: self.kill_processes(subtree),
+                )
+            )
+
+        if search:
+            matcher = px_filter.create_matcher(search, require_exact_user=False)
+            matches, suffix = unprotected(list(filter(matcher, snapshot)))
+            if matches:
+                self.menu_entries.append(
+                    (
+                        f'Kill all {len(matches)} processes matching "{search}"'
+                        + suffix,
+                        lambda: self.kill_processes(matches),
+                    )
+                )
+
+        self.menu_entries.append(("Back to process listing", self.go_back))
+
+        # Index into menu_entries
         self.active_entry = 0
 
     def refresh_display(self) -> None:
@@ -118,8 +200,8 @@ class PxProcessMenu:
         ]
         lines += [""]
 
-        last_entry_no = len(self.MENU_ENTRIES) - 1
-        for entry_no, text in enumerate(self.MENU_ENTRIES):
+        last_entry_no = len(self.menu_entries) - 1
+        for entry_no, (text, _) in enumerate(self.menu_entries):
             prefix = "    "
             arrow = "⇵"
             if entry_no == 0:
@@ -151,8 +233,8 @@ class PxProcessMenu:
                     self.active_entry = 0
             elif incoming.consume(px_terminal.KEY_DOWNARROW):
                 self.active_entry += 1
-                if self.active_entry >= len(self.MENU_ENTRIES):
-                    self.active_entry = len(self.MENU_ENTRIES) - 1
+                if self.active_entry >= len(self.menu_entries):
+                    self.active_entry = len(self.menu_entries) - 1
             elif incoming.consume(px_terminal.KEY_ENTER):
                 self.execute_menu_entry()
             elif incoming.consume("q"):
@@ -181,14 +263,16 @@ class PxProcessMenu:
         """
         Display process info in a pager.
         """
-        processes = px_process.get_all()
-        process = px_processinfo.find_process_by_pid(self.process.pid, processes)
-        if not process:
+        # Numbers may have changed while the menu was up
+        snapshot = self.snapshot.refreshed(self.process.pid)
+        if snapshot is None:
             # Process not available, never mind
             return
+        process = snapshot.get_by_pid(self.process.pid)
+        assert process is not None
 
         with px_terminal.normal_display():
-            px_pager.page_process_info(process, processes)
+            px_pager.page_process_info(process, snapshot)
 
     def await_death(self, message):
         # type(str) -> None
@@ -244,14 +328,51 @@ class PxProcessMenu:
         self.status = "<" + self.process.command + "> did not die!"
         return
 
+    def kill_processes(self, processes: List[px_process.PxProcess]) -> None:
+        """
+        Send first SIGTERM then SIGKILL to a bunch of processes.
+
+        All processes get signalled at once and waited for together, so this
+        takes at most two KILL_TIMEOUT_SECONDS no matter how many processes
+        there are.
+        """
+
+        def show_progress(signal_name: str) -> Callable[[int, float], None]:
+            def show(alive: int, countdown_s: float) -> None:
+                self.status = (
+                    f"{countdown_s:.1f}s Waiting for {alive}/{len(processes)}"
+                    + f" processes to shut down after {signal_name}"
+                )
+                self.refresh_display()
+
+            return show
+
+        with px_bulkkill.BulkKill(processes) as bulk_kill:
+            # Please go away
+            not_allowed = bulk_kill.send_signal(SIGTERM)
+            bulk_kill.wait(KILL_TIMEOUT_SECONDS, show_progress("SIGTERM"))
+
+            # Die!!
+            if bulk_kill.get_alive():
+                not_allowed += bulk_kill.send_signal(SIGKILL)
+                bulk_kill.wait(KILL_TIMEOUT_SECONDS, show_progress("kill -9"))
+
+            survivors = bulk_kill.get_alive()
+
+        if not not_allowed and not survivors:
+            self.status = f"Killed {len(processes)} processes"
+            return
+
+        problems = []
+        if not_allowed:
+            problems.append(f"not allowed to kill {len(not_allowed)}")
+        if survivors:
+            problems.append(f"{len(survivors)} did not die")
+        self.status = f"Of {len(processes)} processes, " + " and ".join(problems)
+
+    def go_back(self) -> None:
+        self.done = True
+
     def execute_menu_entry(self):
-        # NOTE: Constants here must match lines in self.MENU_ENTRIES
-        # at the top of this file
-        if self.active_entry == 0:
-            self.page_process_info()
-        elif self.active_entry == 1:
-            self.kill_process(kill)
-        elif self.active_entry == 2:
-            self.kill_process(sudo_kill)
-        elif self.active_entry == 3:
-            self.done = True
+        _, action = self.menu_entries[self.active_entry]
+        action()
@@ -1,8 +1,11 @@
 import sys
 import errno
+import select
 import getpass
 import datetime
 import operator
+import threading
+import concurrent.futures
 
 import os
 from . import px_file
@@ -13,25 +16,61 @@ from . import px_cwdfriends
 from . import px_loginhistory
 
 
+from typing import Any
 from typing import MutableSet
 from typing import Optional
 from typing import Iterable
 from typing import List
 from typing import Tuple
+from typing import Set
+from typing import TypeVar
+
+
+T = TypeVar("T")
+
+# How often to check whether our output is still wanted while waiting for
+# background work
+CANCEL_POLL_SECONDS = 0.1
 
 
 def println(fd: int, string: str) -> None:
     os.write(fd, string.encode() + b"\n")
 
 
+def _is_reader_gone(fd: int) -> bool:
+    """
+    True if fd is a pipe and whoever was reading from it has closed it. That
+    happens when the user exits the pager before we're done.
+    """
+    poller = select.poll()
+    poller.register(fd, select.POLLOUT)
+    for _, event in poller.poll(0):
+        if event & (select.POLLERR | select.POLLHUP):
+            return True
+    return False
+
+
+def _wait_for(fd: int, future: "concurrent.futures.Future[T]") -> T:
+    """
+    Wait for a background result. Raises BrokenPipeError if our output goes away
+    while we're waiting, no point in waiting for something nobody will see.
+    """
+    while True:
+        try:
+            return future.result(timeout=CANCEL_POLL_SECONDS)
+        except concurrent.futures.TimeoutError:
+            if _is_reader_gone(fd):
+                raise BrokenPipeError(errno.EPIPE, "Output closed while waiting")
+
+
 def find_process_by_pid(
-    pid: int, processes: List[px_process.PxProcess]
+    pid: int, processes: Iterable[px_process.PxProcess]
 ) -> Optional[px_process.PxProcess]:
-    for process in processes:
-        if process.pid == pid:
-            return process
-
-    return None
+    """
+    Pass a px_process.ProcessSnapshot for a quick lookup, otherwise we'll have
+    to index processes first.
+    """
+    return px_process.to_snapshot(processes).get_by_pid(pid)
 
 
 def print_command_line(fd: int, process: px_process.PxProcess) -> None:
@@ -136,41 +175,18 @@ def to_relative_start_string(base, relative):
 
 
 def get_closest_starts(
-    process: px_process.PxProcess, all_processes: List[px_process.PxProcess]
+    process: px_process.PxProcess, all_processes: Iterable[px_process.PxProcess]
 ) -> List[px_process.PxProcess]:
     """
     Return the processes that were started closest in time to the base process.
 
     All processes started within 1s of the base process are returned, or the
     five closest if not at least five were that close.
-    """
-    by_temporal_vicinity = sorted(
-        all_processes, key=lambda p: abs(p.age_seconds - process.age_seconds)
-    )
-
-    closest_raw = set()
-    for close in by_temporal_vicinity:
-        delta_seconds = abs(close.age_seconds - process.age_seconds)
-
-        if delta_seconds <= 1:
-            closest_raw.add(close)
-            continue
-
-        # "5" is arbitrarily chosen, look at the printouts to see if it needs tuning
-        if len(closest_raw) > 5:
-            break
 
-        closest_raw.add(close)
-
-    # Remove ourselves from the closest processes list
-    closest: Iterable[px_process.PxProcess] = filter(
-        lambda p: p is not process, closest_raw
-    )
-
-    # Sort closest processes by age, command and PID in that order
-    closest = sorted(closest, key=operator.attrgetter("command", "pid"))
-    closest = sorted(closest, key=operator.attrgetter("age_seconds"), reverse=True)
-    return closest
+    Pass a px_process.ProcessSnapshot to reuse its start time index.
+    """
+    snapshot = px_process.to_snapshot(all_processes)
+    return snapshot.get_start_time_index().get_closest_starts(process)
 
 
 def print_processes_started_at_the_same_time(fd, process, all_processes):
@@ -179,9 +195,15 @@ def print_processes_started_at_the_same_time(fd, process, all_processes):
         println(fd, "  " + to_relative_start_string(process, close))
 
 
-def print_users_when_process_started(fd: int, process: px_process.PxProcess) -> None:
+def print_users_when_process_started(
+    fd: int, process: px_process.PxProcess, users: Optional[Set[str]] = None
+) -> None:
+    """
+    Pass users if you already have them, otherwise they will be looked up.
+    """
     println(fd, "Users logged in when " + str(process) + " started:")
-    users = px_loginhistory.get_users_at(process.start_time)
+    if users is None:
+        users = px_loginhistory.get_users_at(process.start_time)
     if not users:
         println(
             fd,
@@ -230,31 +252,80 @@ def print_cwd_friends(fd, process, all_processes, all_files):
         println(fd, "  " + str(friend))
 
 
+class OpenFiles:
+    """
+    Everything print_fds() needs from lsof.
+
+    Creating one of these is slow, so print_process_info() does that in the
+    background.
+    """
+
+    def __init__(
+        self,
+        process: px_process.PxProcess,
+        processes: Iterable[px_process.PxProcess],
+        cancel: Optional[threading.Event] = None,
+    ) -> None:
+        """
+        Setting the cancel event kills lsof and makes this raise
+        px_exec_util.CancelledError.
+        """
+        self.files, self.files_warning = px_file.get_all_with_warning(cancel)
+
+        is_root = os.geteuid() == 0
+        self.ipc_map = px_ipc_map.IpcMap(
+            process, self.files, processes, is_root=is_root
+        )
+
+        # Not resolved into names here. Lookups can't be cancelled, so
+        # print_fds() does them while checking whether anybody is still reading.
+        self.network_connections = sorted(
+            self.ipc_map.network_connections, key=operator.attrgetter("name")
+        )
+
+
 def print_fds(
-    fd: int, process: px_process.PxProcess, processes: Iterable[px_process.PxProcess]
+    fd: int,
+    process: px_process.PxProcess,
+    processes: Iterable[px_process.PxProcess],
+    open_files: "Optional[concurrent.futures.Future[OpenFiles]]" = None,
 ) -> None:
-    # It's true, I measured it myself /johan.walles@gmail.com
-    println(
-        fd,
-        datetime.datetime.now().isoformat()
-        + ": Now invoking lsof, this can take over a minute on a big system...",
-    )
+    """
+    Pass an open_files future if lsof is already running, otherwise we'll run it
+    here.
+    """
+    if open_files is None or not open_files.done():
+        # It's true, I measured it myself /johan.walles@gmail.com
+        println(
+            fd,
+            datetime.datetime.now().isoformat()
+            + ": Waiting for lsof, this can take a while on a big system...",
+        )
+
+        # Flush what we have so far so the user has something to read during the pause.
+        # This is useful when piping output into a pager like moar or less.
 
-    # Flush what we have so far so the user has something to read during the pause.
-    # This is useful when piping output into a pager like moar or less.
+        # NOTE: If we switch to writing to file-like objects we should flush here,
+        # our println() function flushes implicitly.
 
-    # NOTE: If we switch to writing to file-like objects we should flush here,
-    # our println() function flushes implicitly.
+        if open_files is None:
+            result = OpenFiles(process, processes)
+        else:
+            result = _wait_for(fd, open_files)
+        println(fd, datetime.datetime.now().isoformat() + ": lsof done, proceeding.")
+    else:
+        result = open_files.result()
 
-    files = px_file.get_all()
-    println(fd, datetime.datetime.now().isoformat() + ": lsof done, proceeding.")
+    files = result.files
+    ipc_map = result.ipc_map
+
+    if result.files_warning is not None:
+        println(fd, "")
+        println(fd, px_terminal.red("WARNING: " + result.files_warning))
 
     println(fd, "")
     print_cwd_friends(fd, process, processes, files)
 
-    is_root = os.geteuid() == 0
-    ipc_map = px_ipc_map.IpcMap(process, files, processes, is_root=is_root)
-
     println(fd, "")
     println(fd, "File descriptors:")
     println(fd, "  stdin : " + ipc_map.fds[0])
@@ -268,9 +339,11 @@ def print_fds(
     println(fd, "Network connections:")
     # FIXME: Print "nothing found" or something if we don't find anything to put
     # here, maybe with a hint to run as root if we think that would help.
-    for connection in sorted(
-        ipc_map.network_connections, key=operator.attrgetter("name")
-    ):
+    for connection in result.network_connections:
+        if _is_reader_gone(fd):
+            raise BrokenPipeError(errno.EPIPE, "Output closed while resolving names")
+
+        # Turning network connections into strings resolves their addresses
         println(fd, "  " + str(connection))
 
     println(fd, "")
@@ -320,7 +393,7 @@ def print_start_time(fd: int, process: px_process.PxProcess) -> None:
 
 
 def print_pid_info(fd: int, pid: int) -> None:
-    processes = px_process.get_all()
+    processes = px_process.get_snapshot()
 
     process = find_process_by_pid(pid, processes)
     if not process:
@@ -330,7 +403,44 @@ def print_pid_info(fd: int, pid: int) -> None:
 
 
 def print_process_info(
-    fd: int, process: px_process.PxProcess, processes: List[px_process.PxProcess]
+    fd: int, process: px_process.PxProcess, processes: Iterable[px_process.PxProcess]
+) -> None:
+    # Many sections below look up processes, this way they share the indexes
+    snapshot = px_process.to_snapshot(processes)
+
+    # Login history and lsof are slow and don't depend on each other, so start
+    # both right away. That way we only have to wait for the slowest one.
+    cancel = threading.Event()
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=2, thread_name_prefix="px info"
+    )
+    futures: "List[concurrent.futures.Future[Any]]" = []
+    try:
+        users = executor.submit(
+            px_loginhistory.get_users_at, process.start_time, cancel=cancel
+        )
+        futures.append(users)
+        open_files = executor.submit(OpenFiles, process, snapshot, cancel)
+        futures.append(open_files)
+        _print_process_info(fd, process, snapshot, users, open_files)
+    finally:
+        # If we failed, probably because the user exited the pager before we
+        # were done, this kills any subprocesses still running. Then don't
+        # wait for the workers, they will be done soon enough on their own.
+        #
+        # Not using shutdown(cancel_futures=True), that's Python 3.9+.
+        cancel.set()
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def _print_process_info(
+    fd: int,
+    process: px_process.PxProcess,
+    snapshot: px_process.ProcessSnapshot,
+    users: "concurrent.futures.Future[Set[str]]",
+    open_files: "concurrent.futures.Future[OpenFiles]",
 ) -> None:
     print_command_line(fd, process)
 
@@ -342,15 +452,15 @@ def print_process_info(
     print_start_time(fd, process)
 
     println(fd, "")
-    print_processes_started_at_the_same_time(fd, process, processes)
+    print_processes_started_at_the_same_time(fd, process, snapshot)
 
     println(fd, "")
-    print_users_when_process_started(fd, process)
+    print_users_when_process_started(fd, process, _wait_for(fd, users))
 
     # List all files PID has open
     println(fd, "")
     try:
-        print_fds(fd, process, processes)
+        print_fds(fd, process, snapshot, open_files)
     except OSError as e:
         if e.errno != errno.ENOENT:
             raise
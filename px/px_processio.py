@@ -0,0 +1,132 @@
+"""
+Per process disk IO, from /proc/<pid>/io.
+
+Linux only. Reading one file per process is too expensive to do on every ptop
+poll, so this is sampled on a slower schedule.
+"""
+
+import time
+import errno
+import datetime
+
+from . import px_process
+
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Optional
+
+
+# Seconds between samples
+SAMPLE_INTERVAL_SECONDS = 5.0
+
+# Identifies a process, PIDs can be reused
+ProcessKey = Tuple[int, datetime.datetime]
+
+
+def parse_proc_pid_io(proc_pid_io_contents: str) -> Optional[int]:
+    """
+    Returns the number of bytes read plus bytes written to storage, or None if
+    the contents can't be parsed.
+
+    Example input:
+      rchar: 323934931
+      wchar: 323929600
+      syscr: 632687
+      syscw: 632675
+      read_bytes: 0
+      write_bytes: 323932160
+      cancelled_write_bytes: 0
+    """
+    read_bytes: Optional[int] = None
+    write_bytes: Optional[int] = None
+    for line in proc_pid_io_contents.splitlines():
+        name, _, value = line.partition(": ")
+        if name == "read_bytes":
+            read_bytes = int(value)
+        elif name == "write_bytes":
+            write_bytes = int(value)
+
+    if read_bytes is None or write_bytes is None:
+        return None
+
+    return read_bytes + write_bytes
+
+
+def read_process_io(pid: int, proc_root: str = "/proc") -> Optional[int]:
+    """
+    Returns the number of bytes a process has read plus written to storage.
+
+    Returns None if the process is gone, if this isn't Linux or if we aren't
+    allowed to look, which we usually aren't for other users' processes.
+    """
+    try:
+        with open(f"{proc_root}/{pid}/io", encoding="utf-8") as proc_pid_io:
+            return parse_proc_pid_io(proc_pid_io.read())
+    except (IOError, OSError) as e:
+        if e.errno in [errno.ENOENT, errno.ESRCH, errno.EACCES, errno.EPERM]:
+            return None
+        raise
+
+
+class ProcessIo:
+    def __init__(
+        self,
+        interval_seconds: float = SAMPLE_INTERVAL_SECONDS,
+        proc_root: str = "/proc",
+    ) -> None:
+        self._interval_seconds = interval_seconds
+        self._proc_root = proc_root
+
+        # Byte counts from the most recent sample
+        self._samples: Dict[ProcessKey, int] = {}
+        self._sample_timestamp: Optional[float] = None
+
+        # Bytes per second between the two most recent samples
+        self._rates: Dict[ProcessKey, float] = {}
+
+    def update(
+        self, processes: List[px_process.PxProcess], now: Optional[float] = None
+    ) -> None:
+        """
+        Sample IO for all processes, unless we did that less than
+        interval_seconds ago.
+        """
+        if now is None:
+            now = time.time()
+
+        if (
+            self._sample_timestamp is not None
+            and now - self._sample_timestamp < self._interval_seconds
+        ):
+            return
+
+        samples: Dict[ProcessKey, int] = {}
+        for process in processes:
+            bytecount = read_process_io(process.pid, self._proc_root)
+            if bytecount is None:
+                continue
+            samples[(process.pid, process.start_time)] = bytecount
+
+        rates: Dict[ProcessKey, float] = {}
+        if self._sample_timestamp is not None:
+            seconds = now - self._sample_timestamp
+            for key, bytecount in samples.items():
+                previous = self._samples.get(key)
+                if previous is None:
+                    # Need two samples to make a metric
+                    continue
+                rates[key] = max(0, bytecount - previous) / seconds
+
+        self._samples = samples
+        self._rates = rates
+        self._sample_timestamp = now
+
+    def apply(self, processes: List[px_process.PxProcess]) -> None:
+        """
+        Set IO rates from the most recent samples on a process snapshot.
+        """
+        for process in processes:
+            process.set_io_bytes_per_second(
+                self._rates.get((process.pid, process.start_time))
+            )
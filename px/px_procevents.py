@@ -0,0 +1,256 @@
+"""
+Get process exec() and exit events from the Linux kernel as they happen.
+
+Polling the process list once per second misses processes living shorter than
+that. On Linux, root can subscribe to the process events connector over
+netlink, and get told about every exec() and exit() no matter how short lived
+the processes are.
+
+On other platforms, and for non-root users, create_listener() returns None and
+we stick to polling.
+"""
+
+import os
+import time
+import errno
+import socket
+import struct
+import logging
+import threading
+import collections
+
+from . import px_commandline
+
+from typing import Deque
+from typing import List
+from typing import Union
+from typing import Iterable
+from typing import Iterator
+from typing import Optional
+
+
+LOG = logging.getLogger(__name__)
+
+# From linux/netlink.h and linux/connector.h
+NETLINK_CONNECTOR = 11
+NLMSG_DONE = 3
+CN_IDX_PROC = 1
+CN_VAL_PROC = 1
+
+# From linux/cn_proc.h
+PROC_CN_MCAST_LISTEN = 1
+PROC_EVENT_EXEC = 0x00000002
+PROC_EVENT_EXIT = 0x80000000
+
+# struct nlmsghdr: length, type, flags, sequence number, port ID
+NLMSGHDR = struct.Struct("=IHHII")
+
+# struct cn_msg: index, value, sequence number, ack, length, flags
+CN_MSG = struct.Struct("=IIIIHH")
+
+# struct proc_event header: what, cpu, timestamp_ns
+PROC_EVENT_HEADER = struct.Struct("=IIQ")
+
+# Exec and exit event data both start with process_pid and process_tgid
+PROC_EVENT_PIDS = struct.Struct("=II")
+
+# Listeners buffer at most this many events between polls. If somebody launches
+# more than this per second we drop the oldest ones, and the poller will still
+# catch whatever is long lived enough.
+MAX_BUFFERED_EVENTS = 10000
+
+
+class ExecEvent:
+    def __init__(self, pid: int, ppid: int, cmdline: str, timestamp: float) -> None:
+        self.pid = pid
+        self.ppid = ppid
+        self.cmdline = cmdline
+
+        # From time.time()
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return f"ExecEvent(pid={self.pid}, ppid={self.ppid}, cmdline={self.cmdline})"
+
+    @property
+    def command(self) -> str:
+        return px_commandline.get_command(self.cmdline)
+
+
+class ExitEvent:
+    def __init__(self, pid: int, timestamp: float) -> None:
+        self.pid = pid
+
+        # From time.time()
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return f"ExitEvent(pid={self.pid})"
+
+
+ProcEvent = Union[ExecEvent, ExitEvent]
+
+
+def read_exec_event(
+    pid: int, timestamp: float, proc_root: str = "/proc"
+) -> Optional[ExecEvent]:
+    """
+    Look up parent PID and command line of a process that just exec()ed.
+
+    Returns None if the process is already gone.
+    """
+    try:
+        with open(f"{proc_root}/{pid}/stat", encoding="utf-8") as stat_file:
+            stat = stat_file.read()
+        with open(f"{proc_root}/{pid}/cmdline", "rb") as cmdline_file:
+            raw_cmdline = cmdline_file.read()
+    except (IOError, OSError) as e:
+        if e.errno in [errno.ENOENT, errno.ESRCH]:
+            # Process went away before we got to it
+            return None
+        raise
+
+    # The command name in parentheses can contain both spaces and parentheses,
+    # so look for fields after the last closing parenthesis.
+    #
+    # Example: "1234 (my (cmd)) S 1 ...", fields after that are state and ppid
+    comm_end = stat.rfind(")")
+    fields = stat[comm_end + 2 :].split(" ", 2)
+    if comm_end < 0 or len(fields) < 2:
+        LOG.warning("Unparsable stat for PID %d: <%s>", pid, stat)
+        return None
+    ppid = int(fields[1])
+
+    cmdline = raw_cmdline.rstrip(b"\0").replace(b"\0", b" ").decode("utf-8", "replace")
+    if not cmdline:
+        # Kernel threads and zombies have empty command lines
+        cmdline = stat[stat.find("(") + 1 : comm_end]
+
+    return ExecEvent(pid, ppid, cmdline, timestamp)
+
+
+def parse_netlink_message(
+    data: bytes, timestamp: float, proc_root: str = "/proc"
+) -> List[ProcEvent]:
+    """
+    Parse one datagram from the process events connector into events.
+
+    Events other than exec() and exit() of whole processes are ignored.
+    """
+    events: List[ProcEvent] = []
+
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        length, _, _, _, _ = NLMSGHDR.unpack_from(data, offset)
+        if length < NLMSGHDR.size:
+            break
+
+        event_offset = offset + NLMSGHDR.size + CN_MSG.size
+        offset += length
+
+        if event_offset + PROC_EVENT_HEADER.size + PROC_EVENT_PIDS.size > len(data):
+            continue
+
+        what, _, _ = PROC_EVENT_HEADER.unpack_from(data, event_offset)
+        pid, tgid = PROC_EVENT_PIDS.unpack_from(
+            data, event_offset + PROC_EVENT_HEADER.size
+        )
+        if pid != tgid:
+            # This is a thread, not a process
+            continue
+
+        if what == PROC_EVENT_EXEC:
+            exec_event = read_exec_event(pid, timestamp, proc_root)
+            if exec_event is not None:
+                events.append(exec_event)
+        elif what == PROC_EVENT_EXIT:
+            events.append(ExitEvent(pid, timestamp))
+
+    return events
+
+
+def open_netlink_socket() -> Optional[socket.socket]:
+    """
+    Subscribe to process events from the kernel.
+
+    Returns None if this isn't Linux or if we aren't allowed to listen, which
+    we usually aren't unless we're root.
+    """
+    if not hasattr(socket, "AF_NETLINK"):
+        return None
+
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_CONNECTOR)
+    except (IOError, OSError) as e:
+        LOG.debug("Process events connector not available: %s", e)
+        return None
+
+    try:
+        sock.bind((os.getpid(), CN_IDX_PROC))
+
+        op = struct.pack("=I", PROC_CN_MCAST_LISTEN)
+        cn_msg = CN_MSG.pack(CN_IDX_PROC, CN_VAL_PROC, 0, 0, len(op), 0)
+        length = NLMSGHDR.size + len(cn_msg) + len(op)
+        nlmsghdr = NLMSGHDR.pack(length, NLMSG_DONE, 0, 0, os.getpid())
+        sock.send(nlmsghdr + cn_msg + op)
+    except (IOError, OSError) as e:
+        LOG.debug("Not allowed to listen for process events: %s", e)
+        sock.close()
+        return None
+
+    return sock
+
+
+def netlink_events(sock: socket.socket) -> Iterator[ProcEvent]:
+    while True:
+        data = sock.recv(65536)
+        yield from parse_netlink_message(data, time.time())
+
+
+class ProcEventListener:
+    """
+    Collects events from an event source in a background thread, for the poller
+    to pick up.
+
+    The event source can be any iterable, which is how the tests feed fake
+    events into this.
+    """
+
+    def __init__(self, events: Iterable[ProcEvent]) -> None:
+        self._events = events
+        self._lock = threading.Lock()
+        self._buffer: Deque[ProcEvent] = collections.deque(maxlen=MAX_BUFFERED_EVENTS)
+
+        self.thread = threading.Thread(name="Process events", target=self._listen)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _listen(self) -> None:
+        try:
+            for event in self._events:
+                with self._lock:
+                    self._buffer.append(event)
+        except (IOError, OSError) as e:
+            # The poller will still be polling, so this isn't fatal
+            LOG.warning("Stopped listening for process events: %s", e)
+
+    def get_events(self) -> List[ProcEvent]:
+        """
+        Returns all events since the last call, oldest first.
+        """
+        with self._lock:
+            events = list(self._buffer)
+            self._buffer.clear()
+        return events
+
+
+def create_listener() -> Optional[ProcEventListener]:
+    """
+    Returns None if the kernel won't tell us about process events, in which
+    case we'll have to rely on polling.
+    """
+    sock = open_netlink_socket()
+    if sock is None:
+        return None
+
+    return ProcEventListener(netlink_events(sock))
@@ -0,0 +1,30 @@
+"""
+Access to files in /proc, for the numbers we poll every second.
+"""
+
+import os
+
+from typing import IO
+from typing import Dict
+from typing import Optional
+
+
+# Open /proc files by path. We rewind and reread these rather than reopening
+# them on every poll.
+_proc_files: Dict[str, IO[str]] = {}
+
+
+def read_proc_file(path: str) -> Optional[str]:
+    """
+    Returns the current contents of a /proc file, or None if the file doesn't
+    exist.
+    """
+    proc_file = _proc_files.get(path)
+    if proc_file is None:
+        if not os.path.exists(path):
+            return None
+        proc_file = open(path, encoding="utf-8")
+        _proc_files[path] = proc_file
+
+    proc_file.seek(0)
+    return proc_file.read()
@@ -0,0 +1,159 @@
+"""
+Per process proportional memory usage, from /proc/<pid>/smaps_rollup.
+
+RSS counts shared pages once for every process sharing them, so a hundred
+forked workers sharing one big heap look like they use a hundred times the RAM
+they actually do. PSS divides shared pages between the processes sharing them,
+and USS only counts pages private to a process.
+
+Linux only. Reading smaps_rollup makes the kernel walk all memory mappings of a
+process, which is too expensive to do for all processes on every ptop poll. So
+this is sampled on a slower schedule, by a pool of threads, and only on request.
+"""
+
+import time
+import errno
+import datetime
+import concurrent.futures
+
+from . import px_process
+
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Optional
+
+
+# Seconds between samples
+SAMPLE_INTERVAL_SECONDS = 10.0
+
+# Reading smaps_rollup is mostly kernel time, during which Python doesn't hold
+# the GIL, so this many threads can really read in parallel
+MAX_WORKERS = 8
+
+# Identifies a process, PIDs can be reused
+ProcessKey = Tuple[int, datetime.datetime]
+
+
+class MemoryDetails:
+    def __init__(self, pss_kb: int, uss_kb: int, swap_kb: int) -> None:
+        self.pss_kb = pss_kb
+        self.uss_kb = uss_kb
+        self.swap_kb = swap_kb
+
+    def __repr__(self):
+        return (
+            f"MemoryDetails(pss_kb={self.pss_kb}, uss_kb={self.uss_kb},"
+            + f" swap_kb={self.swap_kb})"
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, MemoryDetails):
+            return False
+        return self.__dict__ == other.__dict__
+
+
+def parse_smaps_rollup(smaps_rollup_contents: str) -> Optional[MemoryDetails]:
+    """
+    Returns None if the contents can't be parsed.
+
+    Example input, all sizes are in kB:
+      55d1c3a4b000-7ffd5a1f2000 ---p 00000000 00:00 0    [rollup]
+      Rss:                3924 kB
+      Pss:                1021 kB
+      Shared_Clean:       2924 kB
+      Shared_Dirty:          0 kB
+      Private_Clean:       116 kB
+      Private_Dirty:       884 kB
+      Swap:                 12 kB
+    """
+    values: Dict[str, int] = {}
+    for line in smaps_rollup_contents.splitlines():
+        fields = line.split()
+        if len(fields) != 3 or fields[2] != "kB":
+            continue
+        values[fields[0]] = int(fields[1])
+
+    try:
+        return MemoryDetails(
+            pss_kb=values["Pss:"],
+            uss_kb=values["Private_Clean:"] + values["Private_Dirty:"],
+            swap_kb=values.get("Swap:", 0),
+        )
+    except KeyError:
+        return None
+
+
+def read_smaps_rollup(pid: int, proc_root: str = "/proc") -> Optional[MemoryDetails]:
+    """
+    Returns None if the process is gone, if this isn't Linux or if we aren't
+    allowed to look, which we usually aren't for other users' processes.
+    """
+    try:
+        with open(f"{proc_root}/{pid}/smaps_rollup", encoding="utf-8") as f:
+            return parse_smaps_rollup(f.read())
+    except (IOError, OSError) as e:
+        if e.errno in [errno.ENOENT, errno.ESRCH, errno.EACCES, errno.EPERM]:
+            return None
+        raise
+
+
+class ProcessMemory:
+    def __init__(
+        self,
+        interval_seconds: float = SAMPLE_INTERVAL_SECONDS,
+        proc_root: str = "/proc",
+        max_workers: int = MAX_WORKERS,
+    ) -> None:
+        self._interval_seconds = interval_seconds
+        self._proc_root = proc_root
+        self._max_workers = max_workers
+
+        # Memory details from the most recent sample
+        self._details: Dict[ProcessKey, MemoryDetails] = {}
+        self._sample_timestamp: Optional[float] = None
+
+    def update(
+        self, processes: List[px_process.PxProcess], now: Optional[float] = None
+    ) -> None:
+        """
+        Sample memory details for all processes, unless we did that less than
+        interval_seconds ago.
+        """
+        if now is None:
+            now = time.time()
+
+        if (
+            self._sample_timestamp is not None
+            and now - self._sample_timestamp < self._interval_seconds
+        ):
+            return
+
+        def read(process: px_process.PxProcess) -> Optional[MemoryDetails]:
+            return read_smaps_rollup(process.pid, self._proc_root)
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self._max_workers, thread_name_prefix="smaps"
+        ) as executor:
+            all_details = list(executor.map(read, processes))
+
+        # Replacing the cache also forgets about dead processes
+        details: Dict[ProcessKey, MemoryDetails] = {}
+        for process, process_details in zip(processes, all_details):
+            if process_details is None:
+                continue
+            details[(process.pid, process.start_time)] = process_details
+
+        self._details = details
+        self._sample_timestamp = now
+
+    def apply(self, processes: List[px_process.PxProcess]) -> None:
+        """
+        Set memory details from the most recent sample on a process snapshot.
+        """
+        for process in processes:
+            details = self._details.get((process.pid, process.start_time))
+            if details is None:
+                process.set_memory_details(None, None, None)
+                continue
+            process.set_memory_details(details.pss_kb, details.uss_kb, details.swap_kb)
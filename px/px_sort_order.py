@@ -5,10 +5,19 @@ class SortOrder(enum.Enum):
     CPU = 1
     MEMORY = 2
     AGGREGATED_CPU = 3
+    IO = 4
+    CGROUP = 5
+    PSS = 6
 
     def next(self):
         if self == SortOrder.CPU:
             return SortOrder.MEMORY
         if self == SortOrder.MEMORY:
+            return SortOrder.PSS
+        if self == SortOrder.PSS:
             return SortOrder.AGGREGATED_CPU
+        if self == SortOrder.AGGREGATED_CPU:
+            return SortOrder.IO
+        if self == SortOrder.IO:
+            return SortOrder.CGROUP
         return SortOrder.CPU
@@ -12,6 +12,7 @@ from typing import List
 from typing import Tuple
 from typing import Optional
 from typing import Iterable
+from typing import Sequence
 from . import px_process
 from . import px_sort_order
 
@@ -313,16 +314,20 @@ def format_with_widths(widths: List[int], strings: List[str]) -> str:
 
 
 def to_screen_lines(
-    procs: List[px_process.PxProcess],
+    procs: Sequence[px_process.PxProcess],
     row_to_highlight: Optional[int],
     sort_order: Optional[px_sort_order.SortOrder],
     with_username: bool = True,
+    with_logins: bool = False,
 ) -> List[str]:
     """
     Returns an array of lines that can be printed to screen. Lines are not
     cropped, so they can be longer than the screen width.
 
     If sort_order is set, the sort order column will be highlighted.
+
+    If with_logins is set, there will be a column with who was logged in when
+    each process started, see PxProcess.set_logins().
     """
 
     cputime_name = "CPUTIME"
@@ -346,6 +351,29 @@ def to_screen_lines(
     ]:
         highlight_column = 4  # "CPUTIME" or "AGGRCPU"
 
+    # Only show the IO column when sorting by it, it's Linux only and usually
+    # unavailable for other users' processes
+    with_io = sort_order == px_sort_order.SortOrder.IO
+    if with_io:
+        headings.insert(6, "IO")
+        highlight_column = 6  # "IO"
+
+    # Control groups can be long, so those are only shown when grouping by them
+    with_cgroup = sort_order == px_sort_order.SortOrder.CGROUP
+    if with_cgroup:
+        headings.insert(6, "CGROUP")
+        highlight_column = 6  # "CGROUP"
+
+    # PSS, USS and swap are only collected on request, see px_smaps.py
+    with_memory_details = sort_order == px_sort_order.SortOrder.PSS
+    if with_memory_details:
+        headings[6:6] = ["PSS", "USS", "SWAP"]
+        highlight_column = 6  # "PSS"
+
+    # Right before the command line, after any sort order specific columns
+    if with_logins:
+        headings.insert(-1, "LOGINS")
+
     # Compute widest width for pid, command, user, cpu and memory usage columns
     pid_width = len(headings[0])
     command_width = len(headings[1])
@@ -353,9 +381,18 @@ def to_screen_lines(
     cpu_width = len(headings[3])
     cputime_width = len(headings[4])
     mem_width = len(headings[5])
+    io_width = len("IO")
+    cgroup_width = len("CGROUP")
+    pss_width = len("PSS")
+    uss_width = len("USS")
+    swap_width = len("SWAP")
+    logins_width = len("LOGINS")
     for proc in procs:
         pid_width = max(pid_width, len(str(proc.pid)))
-        command_width = max(command_width, len(proc.command) + proc.level * 2)
+        indent_width = 0
+        if sort_order == px_sort_order.SortOrder.AGGREGATED_CPU:
+            indent_width = proc.level * 2
+        command_width = max(command_width, len(proc.command) + indent_width)
         username_width = max(username_width, len(proc.username))
         cpu_width = max(cpu_width, len(proc.cpu_percent_s))
 
@@ -365,6 +402,12 @@ def to_screen_lines(
         cputime_width = max(cputime_width, len(cputime_s))
 
         mem_width = max(mem_width, len(proc.memory_percent_s))
+        io_width = max(io_width, len(proc.io_s))
+        cgroup_width = max(cgroup_width, len(proc.cgroup_s))
+        pss_width = max(pss_width, len(proc.pss_s))
+        uss_width = max(uss_width, len(proc.uss_s))
+        swap_width = max(swap_width, len(proc.swap_s))
+        logins_width = max(logins_width, len(proc.logins_s))
 
     column_widths = [
         -pid_width,
@@ -375,6 +418,14 @@ def to_screen_lines(
         -mem_width,
         0,  # The command line can have any length
     ]
+    if with_io:
+        column_widths.insert(6, -io_width)
+    if with_cgroup:
+        column_widths.insert(6, cgroup_width)
+    if with_memory_details:
+        column_widths[6:6] = [-pss_width, -uss_width, -swap_width]
+    if with_logins:
+        column_widths.insert(-1, logins_width)
 
     username_index = headings.index("USERNAME")
     if not with_username:
@@ -467,6 +518,18 @@ def to_screen_lines(
             memory_percent_s,
             proc.cmdline,
         ]
+        if with_io:
+            io_s = proc.io_s
+            if not proc.io_bytes_per_second:
+                # Zero or undefined
+                io_s = faint(io_s.rjust(io_width))
+            columns.insert(6, io_s)
+        if with_cgroup:
+            columns.insert(6, proc.cgroup_s)
+        if with_memory_details:
+            columns[6:6] = [proc.pss_s, proc.uss_s, proc.swap_s]
+        if with_logins:
+            columns.insert(-1, proc.logins_s)
         if not with_username:
             del columns[username_index]
         line = format_with_widths(column_widths, columns)
@@ -1,20 +1,19 @@
-import datetime
 import sys
 import logging
 import unicodedata
 
 import os
+from . import px_load
+from . import px_filter
 from . import px_poller
 from . import px_process
+from . import px_procevents
 from . import px_terminal
 from . import px_sort_order
-from . import px_processinfo
 from . import px_process_menu
-from . import px_category_bar
 
 from typing import List
-from typing import Dict
-from typing import Tuple
+from typing import Sequence
 from typing import Optional
 
 LOG = logging.getLogger(__name__)
@@ -29,6 +28,12 @@ SEARCH_PROMPT_ACTIVE = px_terminal.inverse_video("Search (ENTER when done): ")
 SEARCH_PROMPT_INACTIVE = "Search ('/' to edit): "
 SEARCH_CURSOR = px_terminal.inverse_video(" ")
 
+# Narrower load graphs than this get the whole screen width rather than half
+MIN_LOAD_GRAPH_CHARS = 8
+
+# Per core CPU usage gets at most this many header lines
+MAX_CORE_ROWS = 2
+
 MODE_BASE = 0
 MODE_SEARCH = 1
 
@@ -49,165 +54,8 @@ highlight_has_moved: bool = False
 
 sort_order = px_sort_order.SortOrder.CPU
 
-
-def adjust_cpu_times(
-    baseline: Dict[int, Tuple[datetime.datetime, float]],
-    current: List[px_process.PxProcess],
-) -> List[px_process.PxProcess]:
-    """
-    Identify processes in current that are also in baseline.
-
-    For all matches, subtract the baseline process' CPU time usage from the
-    current process' one.
-
-    This way we get CPU times computed from when "px --top" was started, rather
-    than from when each process was started.
-
-    Neither current nor baseline are changed by this function.
-    """
-    pid2proc: Dict[int, px_process.PxProcess] = {}
-    for proc in current:
-        pid2proc[proc.pid] = proc
-
-    for baseline_pid, baseline_times in baseline.items():
-        baseline_start_time, baseline_cputime = baseline_times
-        current_proc = pid2proc.get(baseline_pid)
-        if current_proc is None:
-            # This process is newer than the baseline
-            continue
-
-        if current_proc.start_time != baseline_start_time:
-            # This PID has been reused
-            continue
-
-        if current_proc.cpu_time_seconds is None:
-            # We can't subtract from None
-            continue
-
-        if baseline_cputime is None:
-            # We can't subtract None
-            continue
-
-        if current_proc.cpu_time_seconds and baseline_cputime:
-            current_proc.set_cpu_time_seconds(
-                current_proc.cpu_time_seconds - baseline_cputime
-            )
-
-    return list(pid2proc.values())
-
-
-def compute_aggregated_cpu_times(toplist: List[px_process.PxProcess]) -> None:
-    """
-    Compute aggregated CPU times for all processes in the toplist.
-
-    This function modifies the toplist in place.
-    """
-
-    # First, find the root process
-    root_process = toplist[0]
-    while root_process.parent is not None:
-        root_process = root_process.parent
-
-    # Now, walk the process tree and compute aggregated CPU times
-    def walk_tree(proc: px_process.PxProcess) -> float:
-        sum = proc.cpu_time_seconds or 0
-        for child in proc.children:
-            sum += walk_tree(child)
-        proc.set_aggregated_cpu_time_seconds(sum)
-        return sum
-
-    walk_tree(root_process)
-
-
-def get_notnone_cpu_time_seconds(proc: px_process.PxProcess) -> float:
-    seconds = proc.cpu_time_seconds
-    if seconds is not None:
-        return seconds
-    return 0
-
-
-def get_notnone_memory_percent(proc: px_process.PxProcess) -> float:
-    percent = proc.memory_percent
-    if percent is not None:
-        return percent
-    return 0
-
-
-def sort_by_cpu_usage(
-    toplist: List[px_process.PxProcess],
-) -> List[px_process.PxProcess]:
-    can_sort_by_time = False
-    for process in toplist:
-        metric = process.cpu_time_seconds
-        if metric:
-            can_sort_by_time = True
-            break
-
-    if can_sort_by_time:
-        # There is at least one > 0 time in the process list, so sorting by time
-        # will be of some use
-        key = get_notnone_cpu_time_seconds
-        return sorted(toplist, key=key, reverse=True)
-
-    # No > 0 time in the process list, try CPU percentage as an approximation of
-    # that. This should happen on the first iteration when ptop has just been
-    # launched.
-    return sorted(toplist, key=lambda process: process.cpu_percent or 0, reverse=True)
-
-
-def sort_by_cpu_usage_tree(
-    toplist: List[px_process.PxProcess],
-) -> List[px_process.PxProcess]:
-    """
-    Sort the process list by aggregated CPU time, but keep the tree structure.
-    """
-    root_process = toplist[0]
-    while root_process.parent is not None:
-        root_process = root_process.parent
-
-    def sort_children(proc: px_process.PxProcess) -> None:
-        proc.children = sorted(
-            proc.children,
-            key=lambda child: child.aggregated_cpu_time_seconds,
-            reverse=True,
-        )
-        for child in proc.children:
-            sort_children(child)
-
-    sort_children(root_process)
-
-    # Now, recreate the list by flattening the tree
-    flat_list = []
-
-    def flatten(proc: px_process.PxProcess, level=0) -> None:
-        proc.level = level
-        flat_list.append(proc)
-        for child in proc.children:
-            flatten(child, level + 1)
-
-    flatten(root_process)
-
-    return flat_list
-
-
-def get_toplist(
-    baseline: Dict[int, Tuple[datetime.datetime, float]],
-    current: List[px_process.PxProcess],
-    sort_order=px_sort_order.SortOrder.CPU,
-) -> List[px_process.PxProcess]:
-    toplist = adjust_cpu_times(baseline, current)
-    compute_aggregated_cpu_times(toplist)
-
-    # Sort by interestingness last
-    toplist = px_process.order_best_first(toplist)
-    if sort_order == px_sort_order.SortOrder.MEMORY:
-        toplist = sorted(toplist, key=get_notnone_memory_percent, reverse=True)
-    elif sort_order == px_sort_order.SortOrder.CPU:
-        toplist = sort_by_cpu_usage(toplist)
-    elif sort_order == px_sort_order.SortOrder.AGGREGATED_CPU:
-        toplist = sort_by_cpu_usage_tree(toplist)
-
-    return toplist
+# Show proportional memory usage (PSS) rather than RSS in the header RAM bars?
+show_pss: bool = False
 
 
 def writebytes(bytestring: bytes) -> None:
@@ -215,7 +63,7 @@ def writebytes(bytestring: bytes) -> None:
 
 
 def get_line_to_highlight(
-    toplist: List[px_process.PxProcess], max_process_count: int
+    toplist: Sequence[px_process.PxProcess], max_process_count: int
 ) -> Optional[int]:
     global last_highlighted_pid
     global last_highlighted_row
@@ -259,16 +107,72 @@ def get_line_to_highlight(
     return last_highlighted_row
 
 
+def get_sysload_line(poller: px_poller.PxPoller, screen_columns: int) -> str:
+    """
+    Make the load history graph as wide as the header layout has room for.
+    """
+    prefix = px_terminal.bold("Sysload: ")
+
+    # Slack for the number of seconds in the graph label growing with the graph
+    label_slack = 3
+    without_graph = (
+        px_terminal.visual_length(prefix + poller.get_loadstring(0)) + label_slack
+    )
+
+    # Try fitting into the left half of a split header first
+    graph_chars = screen_columns // 2 - 1 - without_graph
+    if graph_chars < MIN_LOAD_GRAPH_CHARS:
+        # Not enough room for a split header, use the whole width
+        graph_chars = screen_columns - 1 - without_graph
+    graph_chars = max(0, min(graph_chars, px_load.HISTORY_LENGTH // 2))
+
+    return prefix + poller.get_loadstring(graph_chars)
+
+
 def generate_header(
-    filtered_processes: List[px_process.PxProcess],
     poller: px_poller.PxPoller,
     screen_columns: int,
+    extra_rows: int = 0,
 ) -> List[str]:
+    """
+    The header will use at most extra_rows more lines than the basic header,
+    for pressure stall information and per core CPU usage.
+    """
     assert screen_columns > 0
 
-    sysload_line = px_terminal.bold("Sysload: ") + poller.get_loadstring()
+    sysload_line = get_sysload_line(poller, screen_columns)
     ramuse_line = px_terminal.bold("RAM Use: ") + poller.get_meminfo()
 
+    ioload_line = px_terminal.bold("IO Load:      ") + poller.get_ioload_string()
+
+    # Linux only
+    disk_string = poller.get_disk_string()
+    diskuse_line = ""
+    if disk_string:
+        diskuse_line = px_terminal.bold("Disk Use: ") + disk_string
+
+    io_lines = [ioload_line]
+    pressure_string = poller.get_pressure_string()
+    if extra_rows > 0 and pressure_string:
+        io_lines.append(px_terminal.bold("Pressure:     ") + pressure_string)
+        extra_rows -= 1
+
+    # One character per core, with several rows for machines with lots of cores
+    heat_prefix = "Cores:        "
+    heat_rows = px_load.render_heat_strip(
+        poller.get_core_usages(),
+        screen_columns - len(heat_prefix),
+        min(extra_rows, MAX_CORE_ROWS),
+    )
+    for row_number, heat_row in enumerate(heat_rows):
+        if row_number == 0:
+            io_lines.append(px_terminal.bold(heat_prefix) + heat_row)
+        else:
+            io_lines.append(" " * len(heat_prefix) + heat_row)
+
+    # Aggregated by the poller, and with rendered bars cached per length
+    category_aggregates = poller.get_category_aggregates()
+
     if px_terminal.visual_length(sysload_line) > (screen_columns // 2 - 1):
         # Traditional header
         bar_length = screen_columns - 16
@@ -276,64 +180,98 @@ def generate_header(
             # Enough space for usable category bars. Length limit ^ picked entirely
             # arbitrarily, feel free to change it if you have a better number.
             rambar_by_program = (
-                "["
-                + px_category_bar.ram_by_program(bar_length, filtered_processes)
-                + "]"
-            )
-            rambar_by_user = (
-                "[" + px_category_bar.ram_by_user(bar_length, filtered_processes) + "]"
+                "[" + category_aggregates.ram_by_program(bar_length) + "]"
             )
+            rambar_by_user = "[" + category_aggregates.ram_by_user(bar_length) + "]"
+            if show_pss:
+                rambar_by_program = (
+                    "[" + category_aggregates.pss_by_program(bar_length) + "]"
+                )
+                rambar_by_user = "[" + category_aggregates.pss_by_user(bar_length) + "]"
+            if sort_order == px_sort_order.SortOrder.CGROUP:
+                rambar_by_program = (
+                    "[" + category_aggregates.ram_by_cgroup(bar_length) + "]"
+                )
         else:
             rambar_by_program = "[ ... ]"
             rambar_by_user = "[ ... ]"
 
+        by_program_label = "  By program: "
+        if sort_order == px_sort_order.SortOrder.CGROUP:
+            by_program_label = "   By cgroup: "
+
+        if diskuse_line:
+            io_lines[0] += "  " + diskuse_line
+
         # Print header
-        return [
-            sysload_line,
-            ramuse_line,
-            "  By program: " + rambar_by_program,
-            "     By user: " + rambar_by_user,
-            px_terminal.bold("IO Load:      ") + poller.get_ioload_string(),
-            "",
-        ]
+        return (
+            [
+                sysload_line,
+                ramuse_line,
+                by_program_label + rambar_by_program,
+                "     By user: " + rambar_by_user,
+            ]
+            + io_lines
+            + [""]
+        )
 
     # Make a split header
     bar_length = screen_columns // 2 - 3
     if bar_length > 20:
         # Enough space for usable category bars. Length limit ^ picked entirely
         # arbitrarily, feel free to change it if you have a better number.
-        cpubar_by_program = (
-            "[" + px_category_bar.cpu_by_program(bar_length, filtered_processes) + "]"
-        )
-        cpubar_by_user = (
-            "[" + px_category_bar.cpu_by_user(bar_length, filtered_processes) + "]"
-        )
-        rambar_by_program = (
-            "[" + px_category_bar.ram_by_program(bar_length, filtered_processes) + "]"
-        )
-        rambar_by_user = (
-            "[" + px_category_bar.ram_by_user(bar_length, filtered_processes) + "]"
-        )
+        cpubar_by_program = "[" + category_aggregates.cpu_by_program(bar_length) + "]"
+        cpubar_by_user = "[" + category_aggregates.cpu_by_user(bar_length) + "]"
+        if sort_order == px_sort_order.SortOrder.IO:
+            # Show IO rather than CPU usage when sorting by IO
+            cpubar_by_program = (
+                "[" + category_aggregates.io_by_program(bar_length) + "]"
+            )
+            cpubar_by_user = "[" + category_aggregates.io_by_user(bar_length) + "]"
+        rambar_by_program = "[" + category_aggregates.ram_by_program(bar_length) + "]"
+        rambar_by_user = "[" + category_aggregates.ram_by_user(bar_length) + "]"
+        if show_pss:
+            rambar_by_program = (
+                "[" + category_aggregates.pss_by_program(bar_length) + "]"
+            )
+            rambar_by_user = "[" + category_aggregates.pss_by_user(bar_length) + "]"
+        if sort_order == px_sort_order.SortOrder.CGROUP:
+            # Show usage by control group rather than by program when grouping
+            # by control group
+            cpubar_by_program = (
+                "[" + category_aggregates.cpu_by_cgroup(bar_length) + "]"
+            )
+            rambar_by_program = (
+                "[" + category_aggregates.ram_by_cgroup(bar_length) + "]"
+            )
     else:
         cpubar_by_program = "[ ... ]"
         cpubar_by_user = "[ ... ]"
         rambar_by_program = "[ ... ]"
         rambar_by_user = "[ ... ]"
 
-    return [
-        px_terminal.get_string_of_length(sysload_line, screen_columns // 2)
-        + ramuse_line,
-        px_terminal.get_string_of_length(cpubar_by_program, screen_columns // 2)
-        + rambar_by_program,
-        px_terminal.get_string_of_length(cpubar_by_user, screen_columns // 2)
-        + rambar_by_user,
-        px_terminal.bold("IO Load:      ") + poller.get_ioload_string(),
-        "",
-    ]
+    if diskuse_line:
+        io_lines[0] = (
+            px_terminal.get_string_of_length(ioload_line, screen_columns // 2)
+            + diskuse_line
+        )
+
+    return (
+        [
+            px_terminal.get_string_of_length(sysload_line, screen_columns // 2)
+            + ramuse_line,
+            px_terminal.get_string_of_length(cpubar_by_program, screen_columns // 2)
+            + rambar_by_program,
+            px_terminal.get_string_of_length(cpubar_by_user, screen_columns // 2)
+            + rambar_by_user,
+        ]
+        + io_lines
+        + [""]
+    )
 
 
 def get_screen_lines(
-    toplist: List[px_process.PxProcess],
+    toplist: Sequence[px_process.PxProcess],
     poller: px_poller.PxPoller,
     screen_rows: int,
     screen_columns: int,
@@ -346,12 +284,11 @@ def get_screen_lines(
     printed to screen.
     """
 
-    all_processes = toplist
     if search:
         # Note that we accept partial user name match, otherwise incrementally typing
         # a username becomes weird for the ptop user
         toplist = list(
-            filter(lambda p: p.match(search, require_exact_user=False), toplist)
+            filter(px_filter.create_matcher(search, require_exact_user=False), toplist)
         )
 
         # Put exact search matches first. Useful for "px cat" or other short
@@ -373,7 +310,10 @@ def get_screen_lines(
     if include_footer:
         footer_height = 1
 
-    lines = generate_header(all_processes, poller, screen_columns)
+    # Extra header lines are only shown if the CPU top part still gets enough
+    # space
+    extra_header_rows = screen_rows - footer_height - 6 - cputop_minheight
+    lines = generate_header(poller, screen_columns, extra_header_rows)
 
     # Create a launches section
     header_height = len(lines)
@@ -396,8 +336,21 @@ def get_screen_lines(
                 px_terminal.bold("Launched binaries, launch counts in (parentheses)"),
             ] + launchlines
 
-            # Cut if we got too many lines
-            launchlines = launchlines[0:launches_maxheight]
+        # Launch storms go on top, but leave room for the totals as well
+        ratelines = poller.get_launchrate_lines()
+        if len(ratelines) > 0 and launches_maxheight >= 6:
+            ratelines = ratelines[0 : launches_maxheight // 2 - 2]
+            launchlines = (
+                [
+                    "",
+                    px_terminal.bold("Launches per second, last 10s / last minute"),
+                ]
+                + ratelines
+                + launchlines
+            )
+
+        # Cut if we got too many lines
+        launchlines = launchlines[0:launches_maxheight]
 
     # Compute cputop height now that we know how many launchlines we have
     cputop_height = screen_rows - header_height - len(launchlines) - footer_height
@@ -425,6 +378,12 @@ def get_screen_lines(
         top_line = "Top processes by memory usage"
     elif sort_order == px_sort_order.SortOrder.AGGREGATED_CPU:
         top_line = "Process tree ordered by aggregated CPU time"
+    elif sort_order == px_sort_order.SortOrder.IO:
+        top_line = "Top processes by disk IO"
+    elif sort_order == px_sort_order.SortOrder.CGROUP:
+        top_line = "Processes grouped by control group"
+    elif sort_order == px_sort_order.SortOrder.PSS:
+        top_line = "Top processes by proportional memory usage (PSS)"
     lines += [px_terminal.bold(top_line)]
 
     if top_mode == MODE_SEARCH:
@@ -442,7 +401,8 @@ def get_screen_lines(
 
     if include_footer:
         footer_line = (
-            "  q - Quit  m - Sort order  / - Search  ↑↓ - Move  Enter - Select"
+            "  q - Quit  m - Sort order  p - RSS/PSS  / - Search  ↑↓ - Move"
+            + "  Enter - Select"
         )
         # Inverse the whole footer line
         footer_line = px_terminal.inverse_video(footer_line + 999 * " ")
@@ -453,7 +413,7 @@ def get_screen_lines(
 
 
 def redraw(
-    toplist: List[px_process.PxProcess],
+    toplist: Sequence[px_process.PxProcess],
     poller: px_poller.PxPoller,
     rows: int,
     columns: int,
@@ -526,9 +486,12 @@ def handle_search_keypresses(key_sequence: px_terminal.ConsumableString) -> None
     search_string += key_sequence._string
 
 
-def get_command(**kwargs):
+def get_command(poller: Optional[px_poller.PxPoller] = None, **kwargs):
     """
     Call getch() and interpret the results.
+
+    Opening the process menu uses the poller's most recent snapshot if there is
+    a poller.
     """
     user_input = px_terminal.getch(**kwargs)
     if user_input is None:
@@ -543,6 +506,7 @@ def get_command(**kwargs):
     global last_highlighted_row
     global last_highlighted_pid
     global sort_order
+    global show_pss
     while len(user_input) > 0:
         if user_input.consume(px_terminal.KEY_UPARROW):
             last_highlighted_row -= 1
@@ -553,18 +517,28 @@ def get_command(**kwargs):
         elif user_input.consume(px_terminal.KEY_ENTER):
             if last_highlighted_pid is None:
                 continue
-            processes = px_process.get_all()
-            process = px_processinfo.find_process_by_pid(
-                last_highlighted_pid, processes
-            )
-            if not process:
+            if poller is None:
+                snapshot = px_process.get_snapshot()
+            else:
+                snapshot = poller.get_snapshot()
+
+            # The poller's snapshot can be a second old, and has its CPU times
+            # adjusted for ptop. Get the real numbers for the selected process
+            # only, listing all processes again would take a while on a busy
+            # system.
+            refreshed = snapshot.refreshed(last_highlighted_pid)
+            if refreshed is None:
                 continue
-            px_process_menu.PxProcessMenu(process).start()
+            process = refreshed.get_by_pid(last_highlighted_pid)
+            assert process is not None
+            px_process_menu.PxProcessMenu(process, refreshed, search_string).start()
         elif user_input.consume("/"):
             top_mode = MODE_SEARCH
             return None
         elif user_input.consume("m") or user_input.consume("M"):
             sort_order = sort_order.next()
+        elif user_input.consume("p") or user_input.consume("P"):
+            show_pss = not show_pss
         elif user_input.consume("q"):
             return CMD_QUIT
         elif user_input.consume(px_terminal.SIGWINCH_KEY):
@@ -582,20 +556,20 @@ def _top(search: str = "") -> None:
     global search_string
     search_string = search
 
-    poller = px_poller.PxPoller(px_terminal.SIGWINCH_PIPE[1])
+    poller = px_poller.PxPoller(
+        px_terminal.SIGWINCH_PIPE[1], px_procevents.create_listener()
+    )
     poller.start()
 
-    current = poller.get_all_processes()
-    baseline = {p.pid: (p.start_time, p.cpu_time_seconds or 0.0) for p in current}
-
-    toplist = get_toplist(baseline, current, sort_order)
-
     rows, columns = px_terminal.get_window_size()
 
     while True:
+        # Prepared by the poller, so this is instant even after a sort order
+        # change
+        toplist = poller.get_toplist(sort_order)
         redraw(toplist, poller, rows, columns)
 
-        command = get_command()
+        command = get_command(poller)
 
         # Handle all keypresses before refreshing the display
         if command is not None:
@@ -610,9 +584,10 @@ def _top(search: str = "") -> None:
             if command == CMD_RESIZE:
                 rows, columns = px_terminal.get_window_size()
 
-            if command == CMD_POLL_COMPLETE:
-                current = poller.get_all_processes()
-                toplist = get_toplist(baseline, current, sort_order)
+            # PSS is expensive to collect, so only do that when it's on screen
+            poller.set_process_memory_enabled(
+                show_pss or sort_order == px_sort_order.SortOrder.PSS
+            )
 
 
 def top(search: str = "") -> None:
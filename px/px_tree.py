@@ -1,3 +1,4 @@
+from . import px_filter
 from . import px_process
 from . import px_terminal
 
@@ -28,8 +29,9 @@ def _generate_tree(processes: List[px_process.PxProcess], search: str) -> List[s
     # tree, we only render those PIDs.
     show_pids: Set[int] = set()
     if search:
+        matcher = px_filter.create_matcher(search)
         for process in processes:
-            if not process.match(search):
+            if not matcher(process):
                 continue
 
             _mark_children(process, show_pids)
@@ -71,7 +73,7 @@ class Coalescer:
 
     def submit(self, process: px_process.PxProcess, search: str) -> List[str]:
         """Returns an array of zero or more lines to be printed"""
-        is_search_hit = search and process.match(search)
+        is_search_hit = search and px_filter.create_matcher(search)(process)
         has_children = bool(process.children)
         is_candidate = not is_search_hit and not has_children
 
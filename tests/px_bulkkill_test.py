@@ -0,0 +1,124 @@
+import time
+import errno
+import signal
+import threading
+import subprocess
+
+from px import px_process
+from px import px_bulkkill
+from . import testutils
+
+from typing import List
+
+
+def start_sleepers(count: int) -> List["subprocess.Popen[bytes]"]:
+    sleepers = [subprocess.Popen(["sleep", "30"]) for _ in range(count)]
+
+    # Reap the sleepers as they exit. Zombies count as alive unless we have a
+    # pidfd for them.
+    for sleeper in sleepers:
+        threading.Thread(target=sleeper.wait, daemon=True).start()
+
+    return sleepers
+
+
+def get_process(pid: int) -> px_process.PxProcess:
+    process = px_process.get_one(pid)
+    assert process is not None
+    return process
+
+
+def test_kill_many():
+    sleepers = start_sleepers(20)
+    processes = [get_process(sleeper.pid) for sleeper in sleepers]
+
+    progress = []
+    t0 = time.time()
+    with px_bulkkill.BulkKill(processes) as bulk_kill:
+        assert bulk_kill.send_signal(signal.SIGTERM) == []
+        bulk_kill.wait(5, lambda alive, seconds_left: progress.append(alive))
+        assert bulk_kill.get_alive() == []
+
+    # All of them were waited for at the same time
+    assert time.time() - t0 < 5
+    for sleeper in sleepers:
+        assert sleeper.wait(timeout=5) == -signal.SIGTERM
+
+    # Counting down, but never below one
+    assert progress == sorted(progress, reverse=True)
+    assert 0 not in progress
+
+
+def test_kill_many_without_pidfds(monkeypatch):
+    monkeypatch.setattr(px_bulkkill, "_pidfd_open", lambda pid: None)
+
+    sleepers = start_sleepers(5)
+    processes = [get_process(sleeper.pid) for sleeper in sleepers]
+
+    with px_bulkkill.BulkKill(processes) as bulk_kill:
+        assert bulk_kill.send_signal(signal.SIGKILL) == []
+        bulk_kill.wait(5)
+        assert bulk_kill.get_alive() == []
+
+
+def test_wait_timeout():
+    sleepers = start_sleepers(1)
+    process = get_process(sleepers[0].pid)
+
+    try:
+        with px_bulkkill.BulkKill([process]) as bulk_kill:
+            # No signal, so it should still be alive after we give up
+            bulk_kill.wait(0.3)
+            assert bulk_kill.get_alive() == [process]
+    finally:
+        sleepers[0].kill()
+
+
+def test_gone():
+    gone = subprocess.Popen(["true"])
+    gone.wait()
+
+    processes = [
+        testutils.create_process(pid=gone.pid),
+        testutils.create_process(pid=0),
+    ]
+    with px_bulkkill.BulkKill(processes) as bulk_kill:
+        assert bulk_kill.send_signal(signal.SIGTERM) == []
+
+        # Gone processes are gone, and the kernel never gets signalled
+        assert bulk_kill.get_alive() == []
+
+
+def test_not_allowed(monkeypatch):
+    def kill(pid, signo):
+        raise PermissionError(errno.EPERM, "Operation not permitted")
+
+    monkeypatch.setattr(px_bulkkill, "_pidfd_open", lambda pid: None)
+    monkeypatch.setattr(px_bulkkill.os, "kill", kill)
+
+    process = get_process(1)
+    with px_bulkkill.BulkKill([process]) as bulk_kill:
+        assert bulk_kill.send_signal(signal.SIGTERM) == [process]
+
+        # Not waiting for processes we couldn't signal
+        assert bulk_kill.get_alive() == []
+
+
+def test_reused_pid(monkeypatch):
+    sleepers = start_sleepers(1)
+    try:
+        # Same PID, but started at some other time, so not the same process
+        stale = testutils.create_process(pid=sleepers[0].pid)
+        with px_bulkkill.BulkKill([stale]) as bulk_kill:
+            assert bulk_kill.get_alive() == []
+            assert bulk_kill.send_signal(signal.SIGTERM) == []
+
+        # Same thing without pidfds
+        monkeypatch.setattr(px_bulkkill, "_pidfd_open", lambda pid: None)
+        with px_bulkkill.BulkKill([stale]) as bulk_kill:
+            assert bulk_kill.send_signal(signal.SIGTERM) == []
+            assert bulk_kill.get_alive() == []
+
+        assert sleepers[0].poll() is None
+    finally:
+        sleepers[0].kill()
@@ -1,6 +1,8 @@
 from px import px_category_bar
 from px import px_terminal
 
+from . import testutils
+
 
 def test_render_bar_happy_path():
     names_and_numbers = [("apa", 1000.0), ("bepa", 300.0), ("cepa", 50.0)] + [
@@ -24,3 +26,76 @@ def test_render_bar_happy_path_unicode():
         + px_terminal.blue(" ")
         + px_terminal.inverse_video(" ")
     )
+
+
+def test_category_aggregates():
+    px_terminal._enable_color = True
+    processes = [
+        testutils.create_process(pid=1, uid=0, rss_kb=1000, commandline="apa"),
+        testutils.create_process(pid=2, uid=0, rss_kb=3000, commandline="bepa"),
+        testutils.create_process(
+            pid=3, uid=0, rss_kb=500, cputime="0:05.00", commandline="apa"
+        ),
+    ]
+
+    aggregates = px_category_bar.CategoryAggregates(processes)
+    for length in (10, 40):
+        assert aggregates.ram_by_program(length) == px_category_bar.ram_by_program(
+            length, processes
+        )
+        assert aggregates.ram_by_user(length) == px_category_bar.ram_by_user(
+            length, processes
+        )
+        assert aggregates.cpu_by_program(length) == px_category_bar.cpu_by_program(
+            length, processes
+        )
+        assert aggregates.cpu_by_user(length) == px_category_bar.cpu_by_user(
+            length, processes
+        )
+
+    # Same length again should come from the cache
+    assert aggregates.ram_by_program(40) is aggregates.ram_by_program(40)
+
+
+def test_category_aggregates_io():
+    px_terminal._enable_color = True
+    processes = [
+        testutils.create_process(pid=1, uid=0, commandline="apa"),
+        testutils.create_process(pid=2, uid=0, commandline="bepa"),
+        testutils.create_process(pid=3, uid=0, commandline="apa"),
+    ]
+    processes[0].set_io_bytes_per_second(1000.0)
+    processes[1].set_io_bytes_per_second(3000.0)
+    processes[2].set_io_bytes_per_second(500.0)
+
+    aggregates = px_category_bar.CategoryAggregates(processes)
+    assert aggregates.io_by_program(10) == px_category_bar.render_bar(
+        10, [("bepa", 3000.0), ("apa", 1500.0)]
+    )
+    assert aggregates.io_by_user(10) == px_category_bar.render_bar(
+        10, [("root", 4500.0)]
+    )
+
+
+def test_category_aggregates_pss():
+    px_terminal._enable_color = True
+    processes = [
+        testutils.create_process(pid=1, uid=0, commandline="apa"),
+        testutils.create_process(pid=2, uid=0, commandline="bepa"),
+        testutils.create_process(pid=3, uid=0, commandline="apa"),
+    ]
+    processes[0].set_memory_details(1000, 500, 0)
+    processes[1].set_memory_details(3000, 500, 0)
+
+    aggregates = px_category_bar.CategoryAggregates(processes)
+    assert aggregates.pss_by_program(10) == px_category_bar.render_bar(
+        10, [("bepa", 3000.0), ("apa", 1000.0)]
+    )
+
+
+def test_category_aggregates_empty():
+    aggregates = px_category_bar.CategoryAggregates([])
+    assert aggregates.ram_by_program(20) == ""
+    assert aggregates.cpu_by_user(20) == ""
+    assert aggregates.io_by_program(20) == ""
+    assert aggregates.ram_by_cgroup(20) == ""
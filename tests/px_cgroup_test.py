@@ -0,0 +1,180 @@
+import os
+
+from px import px_cgroup
+from px import px_poller
+from px import px_sort_order
+
+from . import testutils
+
+
+def _write_file(path: str, contents: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(contents)
+
+
+def _write_process_cgroup(proc_root: str, pid: int, cgroup: str) -> None:
+    _write_file(
+        os.path.join(proc_root, str(pid), "cgroup"),
+        "4:memory:/user.slice\n" + f"0::{cgroup}\n",
+    )
+
+
+def _write_cgroup(
+    cgroup_root: str,
+    cgroup: str,
+    memory_bytes: int,
+    usage_usec: int,
+    memory_some_avg10: float = 0.0,
+) -> None:
+    directory = cgroup_root + cgroup
+    _write_file(os.path.join(directory, "memory.current"), f"{memory_bytes}\n")
+    _write_file(
+        os.path.join(directory, "cpu.stat"),
+        f"usage_usec {usage_usec}\n"
+        + "user_usec 0\n"
+        + "system_usec 0\n"
+        + "nr_periods 0\n",
+    )
+    _write_file(
+        os.path.join(directory, "memory.pressure"),
+        f"some avg10={memory_some_avg10:.2f} avg60=0.00 avg300=0.00 total=0\n"
+        + "full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n",
+    )
+
+
+def test_parse_proc_pid_cgroup():
+    assert (
+        px_cgroup.parse_proc_pid_cgroup(
+            "4:memory:/user.slice\n0::/system.slice/docker.service\n"
+        )
+        == "/system.slice/docker.service"
+    )
+
+    # cgroup v1 only
+    assert px_cgroup.parse_proc_pid_cgroup("4:memory:/user.slice\n") is None
+
+
+def test_parse_cpu_stat_usage():
+    assert px_cgroup.parse_cpu_stat_usage("usage_usec 1234\nuser_usec 1000\n") == 1234
+    assert px_cgroup.parse_cpu_stat_usage("") is None
+
+
+def test_cgroup_display_string(tmp_path):
+    cgroup_root = str(tmp_path)
+    _write_cgroup(cgroup_root, "/quiet.service", 100, 0)
+    _write_cgroup(cgroup_root, "/stalled.service", 100, 0, memory_some_avg10=12.3)
+
+    quiet = px_cgroup.Cgroup("/quiet.service")
+    quiet.read_stats(cgroup_root)
+    assert quiet.get_display_string() == "/quiet.service"
+
+    stalled = px_cgroup.Cgroup("/stalled.service")
+    stalled.read_stats(cgroup_root)
+    assert stalled.get_display_string() == "/stalled.service [memory 12%]"
+
+
+def test_cgroup_tracker(tmp_path):
+    proc_root = str(tmp_path / "proc")
+    cgroup_root = str(tmp_path / "cgroup")
+
+    _write_process_cgroup(proc_root, 1, "/init.scope")
+    _write_process_cgroup(proc_root, 2, "/system.slice/busy.service")
+    _write_process_cgroup(proc_root, 3, "/system.slice/busy.service")
+    _write_cgroup(cgroup_root, "/init.scope", 1000, 0)
+    _write_cgroup(cgroup_root, "/system.slice/busy.service", 500, 0)
+
+    # No cgroup file for this one, it's gone
+    vanished = testutils.create_process(pid=4, commandline="vanished")
+
+    processes = [
+        testutils.create_process(pid=1, commandline="init"),
+        testutils.create_process(pid=2, commandline="worker"),
+        testutils.create_process(pid=3, commandline="worker"),
+        vanished,
+    ]
+
+    tracker = px_cgroup.CgroupTracker(cgroup_root, proc_root)
+    tracker.update(processes, now=100.0)
+
+    assert processes[0].cgroup == "/init.scope"
+    assert processes[1].cgroup_s == "/system.slice/busy.service"
+    assert vanished.cgroup is None
+    assert vanished.cgroup_s == "--"
+
+    assert tracker.get_ram_by_cgroup() == [
+        ("init.scope", 1000.0),
+        ("busy.service", 500.0),
+    ]
+
+    # Need two samples for CPU usage
+    assert tracker.get_cpu_by_cgroup() == []
+
+    _write_cgroup(cgroup_root, "/system.slice/busy.service", 500, 1_500_000)
+    tracker.update(processes, now=101.0)
+    assert tracker.get_cpu_by_cgroup() == [
+        ("busy.service", 150.0),
+        ("init.scope", 0.0),
+    ]
+    assert tracker.get_cgroup_ranks() == {
+        "/system.slice/busy.service": 0,
+        "/init.scope": 1,
+    }
+
+    toplists = px_poller.Toplists(processes, tracker.get_cgroup_ranks())
+    grouped = toplists.get(px_sort_order.SortOrder.CGROUP)
+    assert set(p.pid for p in grouped[:2]) == {2, 3}
+    assert grouped[2].pid == 1
+    assert grouped[3] is vanished
+
+
+def test_cgroup_tracker_caches_process_cgroups(tmp_path):
+    proc_root = str(tmp_path / "proc")
+    cgroup_root = str(tmp_path / "cgroup")
+    _write_process_cgroup(proc_root, 1, "/init.scope")
+    _write_cgroup(cgroup_root, "/init.scope", 1000, 0)
+
+    tracker = px_cgroup.CgroupTracker(cgroup_root, proc_root)
+    tracker.update([testutils.create_process(pid=1)], now=100.0)
+
+    # Cached per process, so this shouldn't be read again
+    os.remove(os.path.join(proc_root, "1", "cgroup"))
+    process = testutils.create_process(pid=1)
+    tracker.update([process], now=101.0)
+    assert process.cgroup == "/init.scope"
+
+
+def test_cgroup_tracker_rereads_process_cgroups(tmp_path):
+    proc_root = str(tmp_path / "proc")
+    cgroup_root = str(tmp_path / "cgroup")
+    _write_process_cgroup(proc_root, 1, "/init.scope")
+    _write_cgroup(cgroup_root, "/init.scope", 1000, 0)
+    _write_cgroup(cgroup_root, "/moved.scope", 1000, 0)
+
+    tracker = px_cgroup.CgroupTracker(cgroup_root, proc_root)
+    tracker.update([testutils.create_process(pid=1)], now=100.0)
+
+    # Same process, moved to another cgroup
+    _write_process_cgroup(proc_root, 1, "/moved.scope")
+
+    process = testutils.create_process(pid=1)
+    tracker.update([process], now=101.0)
+    assert process.cgroup == "/init.scope"
+
+    process = testutils.create_process(pid=1)
+    tracker.update([process], now=100.0 + px_cgroup.CGROUP_REREAD_SECONDS)
+    assert process.cgroup == "/moved.scope"
+
+
+def test_cgroup_tracker_without_cgroup_v2(tmp_path, monkeypatch):
+    # No cgroup.controllers file in here
+    monkeypatch.setattr(px_cgroup, "CGROUP_ROOTS", [str(tmp_path)])
+    assert px_cgroup.find_cgroup_root() is None
+
+    tracker = px_cgroup.CgroupTracker(proc_root=str(tmp_path))
+
+    process = testutils.create_process(pid=1)
+    tracker.update([process])
+    assert process.cgroup is None
+    assert tracker.get_ram_by_cgroup() == []
+    assert tracker.get_cgroup_ranks() == {}
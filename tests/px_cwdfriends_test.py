@@ -98,3 +98,39 @@ def test_friend_ordering():
     p2 = testutils.create_process(pid=2, commandline="a")
     assert _get_friend_processes_in_order(p1, p2) == [p1, p2]
     assert _get_friend_processes_in_order(p2, p1) == [p1, p2]
+
+
+def test_cwd_index():
+    app = testutils.create_process(pid=1, commandline="app")
+    web = testutils.create_process(pid=2, commandline="web")
+    worker = testutils.create_process(pid=3, commandline="worker")
+    old = testutils.create_process(pid=4, commandline="old")
+    rooted = testutils.create_process(pid=5, commandline="rooted")
+
+    cwd_index = px_cwdfriends.CwdIndex(
+        [app, web, worker, old, rooted],
+        [
+            testutils.create_file("xxx", "/srv/app", None, 1, fdtype="cwd"),
+            testutils.create_file("xxx", "/srv/app/web", None, 2, fdtype="cwd"),
+            testutils.create_file("xxx", "/srv/app/web", None, 3, fdtype="cwd"),
+            testutils.create_file("xxx", "/srv/app-old", None, 4, fdtype="cwd"),
+            testutils.create_file("xxx", "/", None, 5, fdtype="cwd"),
+        ],
+    )
+
+    assert cwd_index.get_cwd(2) == "/srv/app/web"
+    assert cwd_index.get_cwd(5) == "/"
+    assert cwd_index.get_cwd(6) is None
+
+    # Many targets, one index
+    assert cwd_index.get_friends(web) == [worker]
+    assert cwd_index.get_friends(worker) == [web]
+    assert cwd_index.get_friends(app) == []
+    assert cwd_index.get_friends(rooted) == []
+
+    assert cwd_index.get_processes_under("/srv/app") == [app, web, worker]
+    assert cwd_index.get_processes_under("/srv/app/") == [app, web, worker]
+    assert cwd_index.get_processes_under("/srv/app/web") == [web, worker]
+    assert cwd_index.get_processes_under("/srv") == [app, old, web, worker]
+    assert cwd_index.get_processes_under("/srv/ap") == []
+    assert cwd_index.get_processes_under("/") == [app, old, web, worker]
@@ -1,5 +1,9 @@
+import time
+import threading
 import subprocess
 
+import pytest
+
 from px import px_exec_util
 
 
@@ -18,3 +22,70 @@ def test_exec_false_with_check():
     except subprocess.CalledProcessError:
         # This is the exception we want, done!
         pass
+
+
+def test_exec_cancel():
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+
+    t0 = time.time()
+    with pytest.raises(px_exec_util.CancelledError):
+        px_exec_util.run(["sleep", "30"], cancel=cancel)
+    assert time.time() - t0 < 10
+
+
+def test_exec_not_cancelled():
+    assert px_exec_util.run(["echo", "hej"], cancel=threading.Event()) == "hej\n"
+
+
+def test_streaming_lines():
+    execution = px_exec_util.StreamingRun(["printf", "one\ntwo\nthree"])
+    assert list(execution) == ["one", "two", "three"]
+    assert execution.complete
+    assert execution.returncode == 0
+
+
+def test_streaming_waits_for_exit():
+    # Closing stdout early shouldn't get the command killed
+    execution = px_exec_util.StreamingRun(["sh", "-c", "echo one; exec >&-; sleep 0.2"])
+    assert list(execution) == ["one"]
+    assert execution.complete
+    assert execution.returncode == 0
+
+
+def test_streaming_nul_records():
+    execution = px_exec_util.StreamingRun(["printf", "a\\0b\\0"], separator="\0")
+    assert list(execution) == ["a", "b"]
+
+
+def test_streaming_timeout():
+    execution = px_exec_util.StreamingRun(
+        ["sh", "-c", "echo one; echo two; sleep 30"], timeout_seconds=0.5
+    )
+
+    t0 = time.time()
+    assert list(execution) == ["one", "two"]
+    assert time.time() - t0 < 10
+    assert execution.timed_out
+    assert not execution.complete
+
+
+def test_streaming_size_limit():
+    execution = px_exec_util.StreamingRun(["yes"], max_output_bytes=10)
+    assert list(execution) == ["y"] * 5
+    assert execution.truncated
+    assert not execution.timed_out
+
+
+def test_streaming_cancel():
+    cancel = threading.Event()
+    execution = px_exec_util.StreamingRun(
+        ["sh", "-c", "echo one; sleep 30"], cancel=cancel
+    )
+
+    records = []
+    with pytest.raises(px_exec_util.CancelledError):
+        for record in execution:
+            records.append(record)
+            cancel.set()
+    assert records == ["one"]
@@ -0,0 +1,96 @@
+from px import px_filter
+
+from . import testutils
+
+
+def test_plain_filter_matches_like_before():
+    p = testutils.create_process(uid=0, commandline="/usr/libexec/AirPlayXPCHelper")
+
+    assert px_filter.create_matcher(None)(p)
+    assert px_filter.create_matcher("")(p)
+
+    assert px_filter.create_matcher("root")(p)
+    assert not px_filter.create_matcher("roo")(p)
+    assert px_filter.create_matcher("roo", require_exact_user=False)(p)
+
+    assert px_filter.create_matcher("play")(p)
+    assert px_filter.create_matcher("4753")(p)
+    assert not px_filter.create_matcher("7536")(p)
+
+
+def test_plain_filter_with_spaces():
+    p = testutils.create_process(commandline="/usr/bin/google chrome --incognito")
+
+    # No structured terms, so this should be a substring match and not two terms
+    assert px_filter.create_matcher("google chrome")(p)
+    assert not px_filter.create_matcher("chrome google")(p)
+
+
+def test_user_and_cmd():
+    p = testutils.create_process(uid=0, commandline="postgres: worker-17 idle")
+
+    assert px_filter.create_matcher("user:root")(p)
+    assert not px_filter.create_matcher("user:ro")(p)
+    assert px_filter.create_matcher("user:ro", require_exact_user=False)(p)
+    assert px_filter.create_matcher("user:/^r..t$/")(p)
+
+    assert px_filter.create_matcher("cmd:worker")(p)
+    assert px_filter.create_matcher("cmd:WORKER")(p)
+    assert px_filter.create_matcher(r"cmd:/worker-\d+/")(p)
+    assert not px_filter.create_matcher(r"cmd:/worker-\d+x/")(p)
+
+    assert px_filter.create_matcher(r"user:root cmd:/worker-\d+/")(p)
+    assert not px_filter.create_matcher(r"user:nobody cmd:/worker-\d+/")(p)
+
+    # Plain terms mixed with structured ones must match as well
+    assert px_filter.create_matcher("user:root idle")(p)
+    assert not px_filter.create_matcher("user:root busy")(p)
+
+
+def test_pid():
+    p = testutils.create_process(pid=47536)
+
+    assert px_filter.create_matcher("pid:4753")(p)
+    assert not px_filter.create_matcher("pid:7536")(p)
+
+
+def test_comparisons():
+    p = testutils.create_process(
+        rss_kb=2 * 1024 * 1024, cpuusage="60.0", mempercent="12.5"
+    )
+
+    assert px_filter.create_matcher("rss>1G")(p)
+    assert px_filter.create_matcher("rss>1.5G")(p)
+    assert not px_filter.create_matcher("rss>2G")(p)
+    assert px_filter.create_matcher("rss>=2G")(p)
+    assert px_filter.create_matcher("rss<3000M")(p)
+    assert px_filter.create_matcher("rss>1000000")(p)
+
+    assert px_filter.create_matcher("cpu>50%")(p)
+    assert px_filter.create_matcher("cpu>50")(p)
+    assert not px_filter.create_matcher("cpu<50%")(p)
+
+    assert px_filter.create_matcher("mem>10%")(p)
+    assert not px_filter.create_matcher("mem>20%")(p)
+
+    assert px_filter.create_matcher("rss>1G cpu>50% mem>10%")(p)
+    assert not px_filter.create_matcher("rss>1G cpu>70%")(p)
+
+
+def test_numeric_before_string():
+    """Cheap numeric predicates should short circuit more expensive ones"""
+    p = testutils.create_process(cpuusage="10.0", commandline="cupsd")
+
+    predicates = px_filter._create_predicates("cmd:/.*/ cpu>50%", True)
+    assert len(predicates) == 2
+    assert not predicates[0](p)
+    assert predicates[1](p)
+
+
+def test_unparsable_falls_back_to_plain():
+    p = testutils.create_process(commandline="/bin/rss>x")
+
+    # Half typed ptop searches should not crash, and should match substrings
+    assert px_filter.create_matcher("rss>x")(p)
+    assert not px_filter.create_matcher("cmd:/[/")(p)
+    assert not px_filter.create_matcher("user:")(p)
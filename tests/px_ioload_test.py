@@ -1,6 +1,7 @@
 from . import testutils
 
 from px import px_ioload
+from px import px_terminal
 
 
 def test_parse_netstat_ib_output():
@@ -49,7 +50,7 @@ def test_parse_proc_diskstats():
     proc_diskstats_contents = testutils.load("proc-diskstats.txt")
 
     # No data expected for the all-zero disks ram*, loop* and nbd*. Get stats
-    # per partition (name ends in a number), not per drive.
+    # per partition, not per drive.
     expected = [
         px_ioload.Sample("vda1 read", 804910 * 512),
         px_ioload.Sample("vda1 write", 1852480 * 512),
@@ -64,3 +65,170 @@ def test_system_state():
 
     # We should get *something*
     assert system_state.samples
+
+
+def test_parse_proc_net_dev_no_space_after_colon():
+    # With large enough byte counts there's no space after the colon
+    proc_net_dev_contents = (
+        "eth1:1234567890123 19890 0 0 0 0 0 0 364327 6584 0 0 0 0 0 0\n"
+    )
+    assert px_ioload.parse_proc_net_dev(proc_net_dev_contents) == [
+        px_ioload.Sample("eth1 incoming", 1234567890123),
+        px_ioload.Sample("eth1 outgoing", 364327),
+    ]
+
+
+def test_is_partition_by_name(tmp_path):
+    # Nothing in sysfs, go by name
+    sys_class_block = str(tmp_path)
+
+    assert px_ioload._is_partition("sda1", sys_class_block)
+    assert px_ioload._is_partition("vda12", sys_class_block)
+    assert px_ioload._is_partition("xvda1", sys_class_block)
+    assert px_ioload._is_partition("nvme0n1p1", sys_class_block)
+    assert px_ioload._is_partition("mmcblk0p1", sys_class_block)
+    assert not px_ioload._is_partition("sda", sys_class_block)
+    assert not px_ioload._is_partition("nvme0n1", sys_class_block)
+    assert not px_ioload._is_partition("mmcblk0", sys_class_block)
+    assert not px_ioload._is_partition("loop0", sys_class_block)
+    assert not px_ioload._is_partition("dm-0", sys_class_block)
+    assert not px_ioload._is_partition("123", sys_class_block)
+
+
+def test_is_partition_by_sysfs(tmp_path):
+    (tmp_path / "weird7").mkdir()
+    (tmp_path / "weird7" / "partition").write_text("7\n")
+    (tmp_path / "sdb1").mkdir()
+
+    # sysfs knows best
+    assert px_ioload._is_partition("weird7", str(tmp_path))
+    assert not px_ioload._is_partition("sdb1", str(tmp_path))
+
+
+def test_is_partition_cached(tmp_path, monkeypatch):
+    (tmp_path / "weird7").mkdir()
+    (tmp_path / "weird7" / "partition").write_text("7\n")
+    assert px_ioload._is_partition("weird7", str(tmp_path))
+
+    # Already known, sysfs shouldn't be asked again
+    def isdir(path):
+        raise AssertionError(f"Unexpected sysfs lookup: {path}")
+
+    monkeypatch.setattr(px_ioload.os.path, "isdir", isdir)
+    assert px_ioload._is_partition("weird7", str(tmp_path))
+
+
+# Used devices with partitions, in /proc/diskstats format
+PROC_DISKSTATS_NVME_MMC_LOOP = """\
+ 259       0 nvme0n1 100 0 8000 50 200 0 16000 150 0 120 200 0 0 0 0 0 0
+ 259       1 nvme0n1p1 90 0 7000 45 190 0 15000 140 0 110 185 0 0 0 0 0 0
+ 179       0 mmcblk0 10 0 800 5 20 0 1600 15 0 12 20 0 0 0 0 0 0
+ 179       1 mmcblk0p1 9 0 700 4 19 0 1500 14 0 11 18 0 0 0 0 0 0
+   7       0 loop0 30 0 2400 3 0 0 0 0 0 3 3 0 0 0 0 0 0
+"""
+
+
+def test_parse_proc_diskstats_nvme_mmc_loop(tmp_path):
+    samples, disk_stats = px_ioload.parse_proc_diskstats_all(
+        PROC_DISKSTATS_NVME_MMC_LOOP, str(tmp_path)
+    )
+
+    # Throughput per partition
+    assert samples == [
+        px_ioload.Sample("nvme0n1p1 read", 7000 * 512),
+        px_ioload.Sample("nvme0n1p1 write", 15000 * 512),
+        px_ioload.Sample("mmcblk0p1 read", 700 * 512),
+        px_ioload.Sample("mmcblk0p1 write", 1500 * 512),
+    ]
+
+    # Utilization per drive, loop devices are drives
+    assert [disk_stat.name for disk_stat in disk_stats] == [
+        "nvme0n1",
+        "mmcblk0",
+        "loop0",
+    ]
+
+
+def test_throughput_history():
+    history = px_ioload.ThroughputHistory()
+    assert history.get_values() == []
+    assert history.get_graph(100.0) == ""
+
+    history.add(0.0)
+    history.add(100.0)
+    assert history.get_values() == [0.0, 100.0]
+    assert history.get_graph(100.0) == "⣸"
+
+    for i in range(px_ioload.HISTORY_LENGTH + 5):
+        history.add(float(i))
+    values = history.get_values()
+    assert len(values) == px_ioload.HISTORY_LENGTH
+    assert values[0] == 5.0
+    assert values[-1] == float(px_ioload.HISTORY_LENGTH + 4)
+
+
+def test_load_string_has_history():
+    ioload = px_ioload.PxIoLoad()
+    ioload.update()
+
+    load_string = ioload.get_load_string()
+    if load_string:
+        assert "history: " in load_string
+
+
+def test_parse_proc_diskstats_utilization():
+    proc_diskstats_contents = testutils.load("proc-diskstats.txt")
+
+    # Only the one drive that has been used, partitions skipped
+    assert px_ioload.parse_proc_diskstats_utilization(proc_diskstats_contents) == [
+        px_ioload.DiskStat(
+            "vda",
+            requests=7619 + 12961,
+            request_ms=5009 + 25230,
+            in_flight=0,
+            io_ms=14697,
+            weighted_io_ms=34336,
+        )
+    ]
+
+
+def test_compute_disk_utilizations():
+    previous = [
+        px_ioload.DiskStat("sda", 100, 1000, 0, 5000, 8000),
+        px_ioload.DiskStat("sdb", 100, 1000, 0, 5000, 8000),
+    ]
+    current = [
+        px_ioload.DiskStat("sda", 150, 1500, 3, 5500, 9000),
+        px_ioload.DiskStat("sdb", 100, 1000, 0, 5000, 8000),
+        px_ioload.DiskStat("sdc", 100, 1000, 0, 5000, 8000),
+    ]
+
+    sda, sdb = px_ioload.compute_disk_utilizations(previous, current, 2.0)
+
+    assert sda.name == "sda"
+    assert sda.utilization_percent == 25.0
+    assert sda.average_wait_ms == 10.0
+    assert sda.average_queue_length == 0.5
+    assert sda.in_flight == 3
+
+    # No requests, no average wait. And sdc has no previous sample, so it should
+    # not show up at all.
+    assert sdb.name == "sdb"
+    assert sdb.utilization_percent == 0.0
+    assert sdb.average_wait_ms is None
+
+
+def test_get_disk_string():
+    ioload = px_ioload.PxIoLoad()
+
+    ioload.disk_utilizations = []
+    assert ioload.get_disk_string() == ""
+
+    ioload.disk_utilizations = [
+        px_ioload.DiskUtilization("sda", 25.0, 10.0, 0.5, 3),
+        px_ioload.DiskUtilization("sdb", 87.0, None, 2.0, 4),
+    ]
+    disk_string = px_terminal.get_string_of_length(ioload.get_disk_string(), 100)
+    assert "87% busy" in disk_string
+    assert "| - avg wait | 4 in flight] " in disk_string
+    assert "sdb" in disk_string
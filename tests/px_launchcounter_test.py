@@ -1,8 +1,14 @@
+import datetime
+
 from px import px_terminal
+from px import px_procevents
 from px import px_launchcounter
 
 from . import testutils
 
+from typing import Dict
+from typing import Tuple
+
 
 def test_list_new_launches():
     process = testutils.create_process(pid=100, timestring="Mon Apr  7 09:33:11 2010")
@@ -110,30 +116,233 @@ def test_ignore_surrounding_parentheses():
     }
 
 
-def test_to_tuple_list():
-    assert px_launchcounter._to_tuple_list(("a", "b", "c"), 5) == [
-        ("a", 0),
-        ("b", 0),
-        ("c", 5),
+def test_branches_get_rows_of_their_own():
+    px_terminal._enable_color = True
+    launchcounter = px_launchcounter.Launchcounter()
+    launchcounter._register_launches(
+        [
+            testutils.fake_callchain("init", "make"),
+            testutils.fake_callchain("init", "make", "cc"),
+            testutils.fake_callchain("init", "make", "cc"),
+            testutils.fake_callchain("init", "make", "cc"),
+            testutils.fake_callchain("init", "make", "ld"),
+            testutils.fake_callchain("init", "cron", "sh"),
+            testutils.fake_callchain("init", "cron", "sh"),
+        ]
+    )
+
+    # Highest counts first, and shared binaries only counted on the first row
+    assert launchcounter.get_screen_lines() == [
+        "init -> "
+        + px_terminal.bold("make")
+        + "(1) -> "
+        + px_terminal.bold("cc")
+        + "(3)",
+        "init -> cron -> " + px_terminal.bold("sh") + "(2)",
+        "init -> make -> " + px_terminal.bold("ld") + "(1)",
+    ]
+
+    # Rows are computed best first, so asking for fewer is cheaper
+    assert launchcounter.get_screen_lines(max_lines=1) == [
+        "init -> "
+        + px_terminal.bold("make")
+        + "(1) -> "
+        + px_terminal.bold("cc")
+        + "(3)",
+    ]
+
+
+def test_prune_least_recently_used():
+    px_terminal._enable_color = True
+    launchcounter = px_launchcounter.Launchcounter(max_nodes=10)
+
+    # Old and popular
+    for _ in range(5):
+        launchcounter._register_launches([testutils.fake_callchain("init", "old")])
+
+    # Push the node count above the limit
+    for i in range(10):
+        launchcounter._register_launches(
+            [testutils.fake_callchain("init", "new" + str(i))]
+        )
+
+    assert launchcounter._node_count <= 10
+
+    lines = launchcounter.get_screen_lines()
+    assert len(lines) == launchcounter._node_count - 1  # -1 for "init"
+    assert "init -> " + px_terminal.bold("old") + "(5)" not in lines
+    assert "init -> " + px_terminal.bold("new9") + "(1)" in lines
+
+    # Max scores should have been updated after the "old" branch went away
+    assert launchcounter._root.max_score == 1
+
+
+def test_callchain_cache():
+    cache: Dict[Tuple[int, datetime.datetime], px_launchcounter.CachedCallchain] = {}
+
+    child = testutils.fake_callchain("init", "(make)", "cc")
+    assert px_launchcounter._callchain(child, cache) == ("init", "make", "cc")
+    assert len(cache) == 3
+
+    # A sibling should reuse the parent's cached chain
+    assert child.parent is not None
+    sibling = testutils.create_process(pid=child.pid + 1, commandline="ld")
+    sibling.parent = child.parent
+    assert px_launchcounter._callchain(sibling, cache) == ("init", "make", "ld")
+    assert len(cache) == 4
+
+    # Same PID and start time but a new command means the process has exec()ed
+    # something else
+    execed = testutils.create_process(pid=child.pid, commandline="as")
+    execed.parent = child.parent
+    assert px_launchcounter._callchain(execed, cache) == ("init", "make", "as")
+
+    # No cache should give the same results
+    assert px_launchcounter._callchain(sibling) == ("init", "make", "ld")
+
+
+def test_callchain_cache_forgets_dead_processes():
+    init = testutils.create_process(pid=1, commandline="init")
+    launchcounter = px_launchcounter.Launchcounter()
+    launchcounter.update([init])
+
+    child = testutils.create_process(pid=2, commandline="child")
+    child.parent = init
+    launchcounter.update([init, child])
+    assert len(launchcounter._callchain_cache) == 2
+
+    launchcounter.update([init])
+    assert len(launchcounter._callchain_cache) == 1
+
+
+def test_launch_rate():
+    rate = px_launchcounter.LaunchRate()
+    rate.add(1000.5)
+    rate.add(1000.7)
+    rate.add(1005.0)
+
+    assert rate.get_count(1005.0, 10) == 3
+    assert rate.get_count(1005.0, 1) == 1
+    assert rate.get_count(1012.0, 10) == 1
+    assert rate.get_count(1059.0, 60) == 3
+    assert rate.get_count(1060.0, 60) == 1
+    assert rate.get_count(1065.0, 60) == 0
+
+    # Buckets should be cleared when we wrap around
+    rate.add(1100.0)
+    assert rate.get_count(1100.0, 60) == 1
+
+    # Launches older than the window shouldn't count
+    rate.add(1000.0)
+    assert rate.get_count(1100.0, 60) == 1
+
+
+def test_get_rate_lines():
+    launchcounter = px_launchcounter.Launchcounter()
+
+    for i in range(20):
+        launchcounter._register_launches(
+            [testutils.fake_callchain("init", "cron", "backup")], now=1000 + i
+        )
+    for i in range(5):
+        launchcounter._register_launches(
+            [testutils.fake_callchain("init", "systemd", "crashy")], now=1015 + i
+        )
+
+    bold_backup = px_terminal.bold("backup")
+    bold_crashy = px_terminal.bold("crashy")
+
+    # Both are launching once per second right now, but backup has been doing
+    # it for longer
+    assert launchcounter.get_rate_lines(now=1019) == [
+        f"  1.0/s   0.3/s  init -> cron -> {bold_backup}",
+        f"  0.5/s   0.1/s  init -> systemd -> {bold_crashy}",
     ]
 
-    assert px_launchcounter._to_tuple_list(("a",), 5) == [("a", 5)]
+    # Backup stopped launching, crashy keeps going
+    launchcounter._register_launches(
+        [testutils.fake_callchain("init", "systemd", "crashy")], now=1025
+    )
+    assert launchcounter.get_rate_lines(now=1025) == [
+        f"  0.5/s   0.1/s  init -> systemd -> {bold_crashy}",
+        f"  0.4/s   0.3/s  init -> cron -> {bold_backup}",
+    ]
 
+    assert launchcounter.get_rate_lines(now=1025, max_lines=1) == [
+        f"  0.5/s   0.1/s  init -> systemd -> {bold_crashy}",
+    ]
 
-def test_merge_tuple_lists():
-    l1 = [("a", 0), ("b", 2), ("c", 5)]
-    l2 = [("a", 0), ("b", 4)]
-    l3 = [("a", 0), ("e", 4)]
+    # Nothing launched during the last minute
+    assert launchcounter.get_rate_lines(now=1200) == []
+    assert launchcounter._recently_launched == {}
 
-    assert px_launchcounter._merge_tuple_lists(l1, l2) == [("a", 0), ("b", 6), ("c", 5)]
 
-    assert px_launchcounter._merge_tuple_lists(l1, l3) is None
+def test_register_events():
+    init = testutils.create_process(pid=1, commandline="init")
+    make = testutils.create_process(pid=2, commandline="make")
+    make.parent = init
 
+    launchcounter = px_launchcounter.Launchcounter()
+    launchcounter.update([init, make], now=1000)
+
+    launchcounter.register_events(
+        [
+            # A short lived child of make, launching a child of its own
+            px_procevents.ExecEvent(3, 2, "/bin/sh -c cc", 1000.2),
+            px_procevents.ExecEvent(4, 3, "cc", 1000.3),
+            px_procevents.ExitEvent(4, 1000.4),
+            px_procevents.ExitEvent(3, 1000.5),
+            # A long lived one that will show up in the next poll
+            px_procevents.ExecEvent(5, 2, "ld", 1000.6),
+        ]
+    )
+
+    ld = testutils.create_process(pid=5, commandline="ld")
+    ld.parent = make
+    launchcounter.update([init, make, ld], now=1001)
+
+    # ld should be counted only once, even though we got it from both the
+    # event and the poll
+    assert launchcounter.get_screen_lines() == [
+        "init -> make -> " + px_terminal.bold("ld") + "(1)",
+        "init -> make -> "
+        + px_terminal.bold("sh")
+        + "(1) -> "
+        + px_terminal.bold("cc")
+        + "(1)",
+    ]
+
+    # The short lived processes could still show up in a poll, so we
+    # remember them for a while
+    assert set(launchcounter._event_launches.keys()) == {3, 4}
+    assert launchcounter._event_callchains == {}
+
+    launchcounter.update([init, make, ld], now=1020)
+    assert launchcounter._event_launches == {}
 
-def test_sort_launchers_lists():
-    l1 = [("a", 3), ("b", 4)]
-    l2 = [("a", 5), ("e", 0)]
 
-    # List with highest individual number should come first
-    assert px_launchcounter.sort_launchers_list([l1, l2]) == [l2, l1]
-    assert px_launchcounter.sort_launchers_list([l2, l1]) == [l2, l1]
+def test_register_events_exec_again():
+    init = testutils.create_process(pid=1, commandline="init")
+    make = testutils.create_process(pid=2, commandline="make")
+    make.parent = init
+
+    launchcounter = px_launchcounter.Launchcounter()
+    launchcounter.update([init, make], now=1000)
+
+    launchcounter.register_events(
+        [
+            # sh exec()s cc without forking, that's still only one process
+            px_procevents.ExecEvent(3, 2, "/bin/sh -c 'exec cc'", 1000.2),
+            px_procevents.ExecEvent(3, 2, "cc", 1000.3),
+            # Make exec()s again, still the same process
+            px_procevents.ExecEvent(2, 1, "make -j8", 1000.4),
+            # A new process with a reused PID is a new launch though
+            px_procevents.ExitEvent(3, 1000.5),
+            px_procevents.ExecEvent(3, 2, "ld", 1000.6),
+        ]
+    )
+
+    assert launchcounter.get_screen_lines() == [
+        "init -> make -> " + px_terminal.bold("ld") + "(1)",
+        "init -> make -> " + px_terminal.bold("sh") + "(1)",
+    ]
@@ -45,3 +45,137 @@ def test_get_load_string():
     assert "3.0" + CSI in px_load.get_load_string((3.0, 0.2, 0.1))
     assert "1.1" + CSI in px_load.get_load_string((1.135135, 0.2, 0.1))
     assert "2.0" + CSI in px_load.get_load_string((2.0, 3.0, 4.0))
+
+
+def test_parse_procs_running():
+    assert (
+        px_load.parse_procs_running(
+            "cpu  2255 34 2290 22625563 6290 127 456 0 0 0\n"
+            + "ctxt 1990473\n"
+            + "procs_running 3\n"
+            + "procs_blocked 0\n"
+        )
+        == 3
+    )
+    assert px_load.parse_procs_running("") is None
+
+
+def test_load_history():
+    history = px_load.LoadHistory()
+    assert history.get_values() == []
+
+    history.add(1, now=100.0)
+    history.add(2, now=102.5)
+    assert history.get_values() == [1.0, 2.0]
+    assert history.get_timestamps() == [100.0, 102.5]
+
+    for i in range(px_load.HISTORY_LENGTH + 3):
+        history.add(i, now=float(i))
+    values = history.get_values()
+    assert len(values) == px_load.HISTORY_LENGTH
+    assert values[0] == 3.0
+    assert values[-1] == float(px_load.HISTORY_LENGTH + 2)
+    assert history.get_timestamps() == values
+
+
+def test_history_to_graph():
+    px_terminal._enable_color = False
+
+    assert px_load.history_to_graph([], 8) == ""
+    assert px_load.history_to_graph([1.0, 2.0], 0) == ""
+
+    # Only the most recent values should be shown
+    assert px_load.history_to_graph([0.0] * 100 + [0.0, 1.0, 2.0, 3.0], 2) == "⣠⣾"
+    assert len(px_load.history_to_graph([1.0] * 100, 10)) == 10
+
+    # Scale to min_peak if nothing is higher
+    assert px_load.history_to_graph([0.0, 1.0, 2.0, 3.0], 2, 6.0) == "⣀⣴"
+
+
+def test_get_load_string_with_history():
+    px_terminal._enable_color = False
+
+    # Graphs are scaled to at least the number of cores
+    cores = float(px_load.physical)
+
+    load_string = px_load.get_load_string((0.3, 0.2, 0.1), [cores] * 100, 10)
+    assert load_string.endswith("[last 20 samples: " + "⣿" * 10 + "]")
+
+    load_string = px_load.get_load_string((0.3, 0.2, 0.1), [cores] * 5, 10)
+    assert load_string.endswith("[last 5 samples: " + "⢸⣿⣿]")
+
+    load_string = px_load.get_load_string((0.3, 0.2, 0.1), [0.0] * 4, 10)
+    assert load_string.endswith("[last 4 samples: " + "⣀⣀]")
+
+
+def test_get_load_string_with_history_timestamps():
+    px_terminal._enable_color = False
+
+    # Sampled every other second, only the most recent 20 samples are shown
+    timestamps = [2.0 * i for i in range(100)]
+    load_string = px_load.get_load_string((0.3, 0.2, 0.1), [0.0] * 100, 10, timestamps)
+    assert "[38s history: " in load_string
+
+    load_string = px_load.get_load_string((0.3, 0.2, 0.1), [0.0], 10, [5.0])
+    assert "[0s history: " in load_string
+
+
+def test_core_usage():
+    core_usage = px_load.CoreUsage()
+
+    core_usage.update(
+        "cpu  300 0 100 1600 0 0 0 0 0 0\n"
+        + "cpu0 100 0 0 900 0 0 0 0 0 0\n"
+        + "cpu1 200 0 100 700 0 0 0 0 0 0\n"
+        + "procs_running 3\n"
+    )
+    assert core_usage.usages.tolist() == [0.0, 0.0]
+
+    # cpu0 busy for 50 of 100 jiffies, including time stolen by the hypervisor.
+    # cpu1 idle, waiting for IO, all the time.
+    core_usage.update(
+        "cpu  300 0 100 1600 0 0 0 0 0 0\n"
+        + "cpu0 130 10 0 950 0 0 0 10 0 0\n"
+        + "cpu1 200 0 100 700 100 0 0 0 0 0\n"
+    )
+    assert core_usage.usages.tolist() == [0.5, 0.0]
+
+    # A core went away
+    core_usage.update("cpu0 230 10 0 950 0 0 0 10 0 0\n")
+    assert core_usage.usages.tolist() == [1.0]
+
+
+def test_core_usage_offline_core():
+    core_usage = px_load.CoreUsage()
+    core_usage.update(
+        "cpu0 100 0 0 900 0 0 0 0 0 0\n"
+        + "cpu1 0 0 0 1000000 0 0 0 0 0 0\n"
+        + "cpu2 500 0 0 500 0 0 0 0 0 0\n"
+    )
+
+    # cpu1 went offline, cpu2 must not be compared to cpu1's counters
+    core_usage.update(
+        "cpu0 150 0 0 950 0 0 0 0 0 0\n" + "cpu2 600 0 0 600 0 0 0 0 0 0\n"
+    )
+    assert core_usage.usages.tolist() == [0.5, 0.5]
+
+    # cpu1 is back, but we have nothing recent to compare it to
+    core_usage.update(
+        "cpu0 250 0 0 950 0 0 0 0 0 0\n"
+        + "cpu1 0 0 0 1000100 0 0 0 0 0 0\n"
+        + "cpu2 600 0 0 700 0 0 0 0 0 0\n"
+    )
+    assert core_usage.usages.tolist() == [1.0, 0.0, 0.0]
+
+
+def test_render_heat_strip():
+    assert px_load.render_heat_strip([], 10, 2) == []
+    assert px_load.render_heat_strip([0.5], 10, 0) == []
+
+    assert px_load.render_heat_strip([0.0, 0.5, 1.0], 10, 2) == ["▁▅█"]
+
+    # Two rows, evenly split
+    assert px_load.render_heat_strip([0.0] * 12, 10, 2) == ["▁" * 6, "▁" * 6]
+
+    # Too many cores for two rows, two cores per character
+    assert px_load.render_heat_strip([0.0, 1.0] * 20, 10, 2) == ["▅" * 10, "▅" * 10]
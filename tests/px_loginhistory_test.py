@@ -380,3 +380,130 @@ def test_realworld_debian(check_output):
     )
 
     assert {"norbert from mosh"} == get_users_at(lastline, now, testtime)
+
+
+def _utmp_record(ut_type: int, line: str, user: str, host: str, tv_sec: int) -> bytes:
+    return px_loginhistory.UTMP_RECORD.pack(
+        ut_type,
+        1234,
+        line.encode(),
+        b"",
+        user.encode(),
+        host.encode(),
+        0,
+        0,
+        0,
+        tv_sec,
+        0,
+        b"",
+        b"",
+    )
+
+
+def _write_wtmp(path: str) -> None:
+    with open(path, "wb") as wtmp:
+        wtmp.write(_utmp_record(px_loginhistory.UTMP_BOOT_TIME, "~", "reboot", "", 50))
+        wtmp.write(
+            _utmp_record(px_loginhistory.UTMP_USER_PROCESS, "tty1", "local", "", 100)
+        )
+        wtmp.write(
+            _utmp_record(
+                px_loginhistory.UTMP_USER_PROCESS, "pts/0", "remote", "10.1.6.120", 200
+            )
+        )
+        wtmp.write(
+            _utmp_record(px_loginhistory.UTMP_DEAD_PROCESS, "pts/0", "", "", 300)
+        )
+
+        # Crash, nobody logged out but everybody is gone after this
+        wtmp.write(_utmp_record(px_loginhistory.UTMP_BOOT_TIME, "~", "reboot", "", 400))
+
+        wtmp.write(
+            _utmp_record(px_loginhistory.UTMP_USER_PROCESS, "pts/1", "ongoing", "", 500)
+        )
+
+
+def test_parse_wtmp(tmp_path):
+    wtmp_path = str(tmp_path / "wtmp")
+    _write_wtmp(wtmp_path)
+
+    sessions = px_loginhistory.read_wtmp(wtmp_path)
+    assert sessions is not None
+    assert [(s.username, s.start, s.end) for s in sessions] == [
+        ("local", 100, 400),
+        ("remote from 10.1.6.120", 200, 300),
+        ("ongoing", 500, px_loginhistory.STILL_LOGGED_IN),
+    ]
+
+
+def test_session_index(tmp_path):
+    wtmp_path = str(tmp_path / "wtmp")
+    _write_wtmp(wtmp_path)
+
+    session_index = px_loginhistory.get_session_index(wtmp_path)
+    assert session_index is not None
+    assert len(session_index) == 3
+
+    assert session_index.get_users_at(99) == set()
+    assert session_index.get_users_at(100) == {"local"}
+    assert session_index.get_users_at(250) == {"local", "remote from 10.1.6.120"}
+    assert session_index.get_users_at(350) == {"local"}
+    assert session_index.get_users_at(450) == set()
+    assert session_index.get_users_at(10**10) == {"ongoing"}
+
+    # Unchanged file, same index
+    assert px_loginhistory.get_session_index(wtmp_path) is session_index
+
+
+def test_session_index_many():
+    sessions = [
+        px_loginhistory.Session(f"user{i}", float(i), float(i + 10)) for i in range(100)
+    ]
+    session_index = px_loginhistory.SessionIndex(sessions)
+
+    assert session_index.get_users_at(50.5) == {f"user{i}" for i in range(41, 51)}
+    assert session_index.get_users_at(-1) == set()
+
+
+def test_get_session_index_no_wtmp(tmp_path):
+    assert px_loginhistory.get_session_index(str(tmp_path / "wtmp")) is None
+
+    empty = tmp_path / "empty"
+    empty.write_bytes(b"")
+    session_index = px_loginhistory.get_session_index(str(empty))
+    assert session_index is not None
+    assert session_index.get_users_at(100) == set()
+
+
+def test_session_index_many_timestamps():
+    sessions = [
+        px_loginhistory.Session(f"user{i}", float(i), float(i + 10)) for i in range(100)
+    ]
+    sessions.append(
+        px_loginhistory.Session("ongoing", 20.0, px_loginhistory.STILL_LOGGED_IN)
+    )
+    session_index = px_loginhistory.SessionIndex(sessions)
+
+    # Unsorted and with duplicates on purpose
+    timestamps = [50.5, -1.0, 1000.0, 15.0, 50.5, 20.0]
+    assert session_index.get_users_at_many(timestamps) == [
+        session_index.get_users_at(timestamp) for timestamp in timestamps
+    ]
+    assert session_index.get_users_at_many([1000.0]) == [{"ongoing"}]
+
+
+def test_get_users_at_many(check_output):
+    now = datetime.datetime(2016, 4, 3, 12, 8, tzinfo=TIMEZONE)
+    last_output = "\n".join(
+        [
+            "johan1    ttys000                   Thu Mar 31 14:39 - 11:08  (20:29)",
+            "johan2    ttys001                   Sat Apr  2 09:00   still logged in",
+        ]
+    )
+
+    before = datetime.datetime(2016, 3, 31, 12, 0, tzinfo=TIMEZONE)
+    during = datetime.datetime(2016, 3, 31, 15, 0, tzinfo=TIMEZONE)
+    later = datetime.datetime(2016, 4, 3, 12, 0, tzinfo=TIMEZONE)
+    assert px_loginhistory.get_users_at_many(
+        [later, before, during], last_output=last_output, now=now
+    ) == [{"johan2"}, set(), {"johan1"}]
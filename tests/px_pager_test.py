@@ -0,0 +1,51 @@
+import os
+import time
+import threading
+
+from px import px_pager
+from px import px_process
+from px import px_exec_util
+
+from . import testutils
+
+
+def _get_sleeping_children():
+    return [
+        p
+        for p in px_process.get_all()
+        if p.ppid == os.getpid() and p.command == "sleep"
+    ]
+
+
+def test_pump_info_to_closed_pager(monkeypatch):
+    # Make lsof hang so that we have something to kill
+    class SlowStreamingRun(px_exec_util.StreamingRun):
+        def __init__(self, command, **kwargs):
+            if command[0] == "lsof":
+                command = ["sleep", "60"]
+            super().__init__(command, **kwargs)
+
+    monkeypatch.setattr(px_exec_util, "StreamingRun", SlowStreamingRun)
+
+    process = testutils.create_process(pid=1234, commandline="/usr/bin/fluff")
+    process.children = []
+
+    read_fd, write_fd = os.pipe()
+    pager_stdin = os.fdopen(write_fd, "wb")
+
+    t0 = time.time()
+    pump = threading.Thread(
+        target=px_pager._pump_info_to_fd, args=(pager_stdin, process, [process])
+    )
+    pump.start()
+
+    # Read a bit, then quit like a user exiting the pager would
+    os.read(read_fd, 10)
+    time.sleep(0.5)
+    os.close(read_fd)
+
+    pump.join(timeout=30)
+    assert not pump.is_alive()
+    assert time.time() - t0 < 30
+
+    assert not _get_sleeping_children()
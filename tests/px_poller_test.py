@@ -0,0 +1,79 @@
+from px import px_poller
+from px import px_process
+from px import px_sort_order
+
+from . import testutils
+
+
+def test_adjust_cpu_times():
+    now = testutils.local_now()
+
+    current = [
+        px_process.create_kernel_process(now),
+        testutils.create_process(
+            pid=100, cputime="0:10.00", commandline="only in current"
+        ),
+        testutils.create_process(
+            pid=200,
+            cputime="0:20.00",
+            commandline="re-used PID baseline",
+            timestring="Mon May  7 09:33:11 2010",
+        ),
+        testutils.create_process(
+            pid=300, cputime="0:30.00", commandline="relevant baseline"
+        ),
+    ]
+    baseline = {
+        0: (current[0].start_time, 0),
+        200: (current[2].start_time, 2.0),
+        300: (current[3].start_time, 3.0),
+        400: (now, 3.0),
+    }
+
+    actual = px_process.order_best_last(px_poller.adjust_cpu_times(baseline, current))
+    expected = px_process.order_best_last(
+        [
+            px_process.create_kernel_process(now),
+            testutils.create_process(
+                pid=100, cputime="0:10.00", commandline="only in current"
+            ),
+            testutils.create_process(
+                pid=200,
+                cputime="0:18.00",
+                commandline="re-used PID baseline",
+                timestring="Mon May  7 09:33:11 2010",
+            ),
+            testutils.create_process(
+                pid=300, cputime="0:27.00", commandline="relevant baseline"
+            ),
+        ]
+    )
+
+    assert actual == expected
+
+
+def test_poller_adjusts_cpu_times():
+    poller = px_poller.PxPoller()
+
+    # The first poll is the baseline, so CPU times should start out at zero
+    for process in poller.get_all_processes():
+        assert not process.cpu_time_seconds
+
+
+def test_toplists():
+    poller = px_poller.PxPoller()
+
+    all_processes = poller.get_all_processes()
+    assert list(poller.get_snapshot()) == all_processes
+    for sort_order in px_sort_order.SortOrder:
+        toplist = poller.get_toplist(sort_order)
+        assert set(toplist) == set(all_processes)
+        for process in toplist:
+            assert process.aggregated_cpu_time_seconds is not None
+            assert process.aggregated_cpu_time_s != "--"
+
+
+def test_toplists_empty():
+    toplists = px_poller.Toplists([])
+    for sort_order in px_sort_order.SortOrder:
+        assert toplists.get(sort_order) == ()
@@ -0,0 +1,63 @@
+from px import px_pressure
+from px import px_terminal
+
+
+def test_parse_pressure():
+    assert px_pressure.parse_pressure(
+        "some avg10=3.10 avg60=3.45 avg300=3.27 total=39183129\n"
+        + "full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n"
+    ) == {"some": (3.10, 39183129), "full": (0.0, 0)}
+
+    assert px_pressure.parse_pressure("") == {}
+    assert px_pressure.parse_pressure("some garbage\n") == {}
+
+
+def test_resource_pressure():
+    pressure = px_pressure.ResourcePressure("io")
+
+    # First sample, use the kernel's averages
+    pressure.update({"some": (3.5, 1_000_000), "full": (1.5, 500_000)}, 100.0)
+    assert pressure.percentages == {"some": 3.5, "full": 1.5}
+
+    # Two seconds later, stalled for half a second and a tenth of a second
+    pressure.update({"some": (0.0, 1_500_000), "full": (0.0, 600_000)}, 102.0)
+    assert pressure.percentages == {"some": 25.0, "full": 5.0}
+
+    assert list(pressure.some_history) == [3.5, 25.0]
+    assert len(pressure.get_graph()) == 1
+
+    for i in range(px_pressure.HISTORY_LENGTH * 2):
+        pressure.update({"some": (0.0, 1_500_000)}, 103.0 + i)
+    assert len(pressure.some_history) == px_pressure.HISTORY_LENGTH
+    assert len(pressure.get_graph()) == px_pressure.HISTORY_LENGTH // 2
+
+
+def test_get_pressure_string():
+    px_terminal._enable_color = False
+
+    pressure = px_pressure.PxPressure()
+    cpu, memory, io = pressure._resources
+    cpu.update({"some": (3.1, 0), "full": (0.0, 0)}, 100.0)
+    memory.update({"some": (0.0, 0), "full": (0.0, 0)}, 100.0)
+    io.update({"some": (12.0, 0), "full": (2.5, 0)}, 100.0)
+
+    pressure_string = pressure.get_pressure_string()
+    assert pressure_string.startswith("CPU [3.1% ")
+    assert "  Memory [0.0% / 0.0% " in pressure_string
+    assert "  IO [12% / 2.5% " in pressure_string
+
+
+def test_unavailable():
+    pressure = px_pressure.PxPressure()
+    pressure._available = False
+    pressure.update()
+    assert pressure.get_pressure_string() == ""
+
+
+def test_update():
+    # Pressure stall information may or may not be available on this system,
+    # either way this should not crash
+    pressure = px_pressure.PxPressure()
+    pressure.update()
+    pressure.update()
+    pressure.get_pressure_string()
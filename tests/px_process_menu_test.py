@@ -0,0 +1,33 @@
+import os
+
+from px import px_process
+from px import px_process_menu
+from . import testutils
+
+
+def test_get_protected_pids():
+    protected = px_process_menu.get_protected_pids(px_process.get_snapshot())
+    assert {0, 1, os.getpid(), os.getppid()} <= protected
+
+
+def test_bulk_kills_exclude_protected():
+    init = testutils.create_process(pid=1, ppid=0, commandline="init")
+    shell = testutils.create_process(pid=os.getppid(), ppid=1, commandline="bash")
+    other = testutils.create_process(pid=999999, ppid=os.getppid(), commandline="bash")
+    snapshot = px_process.ProcessSnapshot([init, shell, other])
+
+    menu = px_process_menu.PxProcessMenu(init, snapshot, search="bash")
+    texts = [text for text, _ in menu.menu_entries]
+    assert (
+        "Kill process and its 2 descendants (excluding init, ptop and its parents)"
+        in texts
+    )
+    assert (
+        'Kill all 1 processes matching "bash" (excluding init, ptop and its parents)'
+        in texts
+    )
+
+    # Nothing to exclude
+    menu = px_process_menu.PxProcessMenu(other, snapshot, search="999999")
+    texts = [text for text, _ in menu.menu_entries]
+    assert 'Kill all 1 processes matching "999999"' in texts
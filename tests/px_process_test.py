@@ -2,12 +2,15 @@ import getpass
 import datetime
 
 import os
+import random
+import subprocess
 import pytest
 
 from px import px_process
 from . import testutils
 
 from typing import MutableSet
+from typing import List
 
 
 def test_create_process():
@@ -376,3 +379,168 @@ def test_resolve_links_multiple_roots():
             root = root.parent
 
         assert root is root0
+
+
+def _get_closest_starts_by_sorting(
+    process: px_process.PxProcess, all_processes: List[px_process.PxProcess]
+) -> List[px_process.PxProcess]:
+    # The straightforward way, sort everything by distance from process
+    by_temporal_vicinity = sorted(
+        all_processes, key=lambda p: abs(p.age_seconds - process.age_seconds)
+    )
+    closest: List[px_process.PxProcess] = []
+    for close in by_temporal_vicinity:
+        if close is process:
+            continue
+        if abs(close.age_seconds - process.age_seconds) > 1 and len(closest) >= 5:
+            break
+        closest.append(close)
+    return closest
+
+
+def test_start_time_index_get_closest_starts():
+    rng = random.Random(1234)
+
+    processes = []
+    for pid in range(1, 200):
+        process = testutils.create_process(pid=pid, commandline=f"command{pid % 7}")
+
+        # Clusters of processes started at about the same time, with some
+        # stragglers in between
+        process.age_seconds = rng.choice([100, 500, 3000]) + rng.random() * 3
+        if pid % 10 == 0:
+            process.age_seconds = rng.random() * 5000
+        processes.append(process)
+
+    start_time_index = px_process.StartTimeIndex(processes)
+    for process in processes:
+        closest = start_time_index.get_closest_starts(process)
+
+        assert process not in closest
+        assert set(closest) == set(_get_closest_starts_by_sorting(process, processes))
+
+        # Oldest first
+        ages = [p.age_seconds for p in closest]
+        assert ages == sorted(ages, reverse=True)
+
+
+def test_start_time_index_picks_closest_neighbors():
+    processes = []
+    for pid, age_seconds in [(1, 10), (2, 20), (3, 100), (4, 103), (5, 200)]:
+        process = testutils.create_process(pid=pid)
+        process.age_seconds = age_seconds
+        processes.append(process)
+
+    base = testutils.create_process(pid=6)
+    base.age_seconds = 101
+
+    start_time_index = px_process.StartTimeIndex(processes + [base])
+    assert [p.pid for p in start_time_index.get_closest_starts(base)] == [
+        5,
+        4,
+        3,
+        2,
+        1,
+    ]
+
+    # Fewer than five other processes
+    start_time_index = px_process.StartTimeIndex(processes[2:4] + [base])
+    assert [p.pid for p in start_time_index.get_closest_starts(base)] == [4, 3]
+
+
+def test_process_snapshot():
+    parent = testutils.create_process(pid=10, ppid=1)
+    child1 = testutils.create_process(pid=11, ppid=10)
+    child2 = testutils.create_process(pid=12, ppid=10)
+    processes = [parent, child1, child2]
+
+    snapshot = px_process.ProcessSnapshot(processes)
+    assert list(snapshot) == processes
+    assert len(snapshot) == 3
+
+    assert snapshot.get_by_pid(11) is child1
+    assert snapshot.get_by_pid(13) is None
+
+    assert snapshot.get_by_key((11, child1.start_time)) is child1
+    other_start_time = child1.start_time + datetime.timedelta(seconds=1)
+    assert snapshot.get_by_key((11, other_start_time)) is None
+
+    assert snapshot.get_children(10) == [child1, child2]
+    assert snapshot.get_children(11) == []
+
+    assert snapshot.get_start_time_index() is snapshot.get_start_time_index()
+
+    assert px_process.to_snapshot(snapshot) is snapshot
+    assert px_process.to_snapshot(processes).get_by_pid(10) is parent
+
+
+def test_get_one():
+    process = px_process.get_one(os.getpid())
+    assert process is not None
+    assert process.pid == os.getpid()
+    assert process.ppid == os.getppid()
+
+    # Find a PID that isn't in use
+    exited = subprocess.Popen(["true"])
+    exited.wait()
+    assert px_process.get_one(exited.pid) is None
+
+
+def test_process_snapshot_refreshed():
+    me = px_process.get_one(os.getpid())
+    assert me is not None
+    me.set_io_bytes_per_second(1234)
+    me.set_cgroup("/user.slice", "/user.slice [cpu 5%]")
+    me.set_memory_details(1, 2, 3)
+    me.set_logins({"johan"})
+    parent = testutils.create_process(pid=os.getppid())
+    parent.children = [me]
+    me.parent = parent
+    child = testutils.create_process(pid=os.getpid() + 1, ppid=os.getpid())
+    child.parent = me
+    me.children = [child]
+    snapshot = px_process.ProcessSnapshot([parent, me, child])
+
+    refreshed = snapshot.refreshed(os.getpid())
+    assert refreshed is not None
+    fresh = refreshed.get_by_pid(os.getpid())
+    assert fresh is not None
+    assert fresh is not me
+    assert fresh.children == [child]
+    assert list(refreshed) == [parent, fresh, child]
+
+    # The tree links point to the fresh process
+    assert fresh.parent is parent
+    assert parent.children[0] is fresh
+    assert child.parent is fresh
+
+    # Details not from ps are kept
+    assert fresh.io_bytes_per_second == 1234
+    assert fresh.cgroup_s == "/user.slice [cpu 5%]"
+    assert (fresh.pss_kb, fresh.uss_kb, fresh.swap_kb) == (1, 2, 3)
+    assert fresh.logins == {"johan"}
+
+    # The original snapshot still has the old process
+    assert snapshot.get_by_pid(os.getpid()) is me
+
+    # Same PID, but started at some other time, so not the same process
+    stale = testutils.create_process(pid=os.getpid())
+    assert px_process.ProcessSnapshot([stale]).refreshed(os.getpid()) is None
+
+
+def test_process_snapshot_get_descendants():
+    root = testutils.create_process(pid=10, ppid=1)
+    child = testutils.create_process(pid=11, ppid=10)
+    grandchild = testutils.create_process(pid=12, ppid=11)
+    other = testutils.create_process(pid=13, ppid=1)
+    snapshot = px_process.ProcessSnapshot([grandchild, other, child, root])
+
+    assert snapshot.get_descendants(10) == [child, grandchild]
+    assert snapshot.get_descendants(12) == []
+
+
+def test_get_many():
+    processes = px_process.get_many([os.getpid(), os.getppid()])
+    assert sorted(p.pid for p in processes) == sorted([os.getpid(), os.getppid()])
+
+    assert px_process.get_many([]) == []
@@ -1,11 +1,15 @@
+from px import px_file
 from px import px_process
 from px import px_ipc_map
 from px import px_terminal
 from px import px_processinfo
+from px import px_loginhistory
 
 from . import testutils
 
 import sys
+import threading
+import concurrent.futures
 
 from typing import List, Tuple
 
@@ -167,3 +171,77 @@ def test_to_ipc_lines():
         px_terminal.bold("bar(47536)") + ": [PIPE] ->0xAda",
         px_terminal.bold("foo(47536)") + ": [PIPE] ->0xAda",
     ]
+
+
+def test_print_process_info_concurrent_sources(tmp_path, monkeypatch):
+    # Both slow sources have to be running at the same time to get past this
+    barrier = threading.Barrier(2, timeout=5)
+
+    def get_users_at(timestamp, cancel=None):
+        barrier.wait()
+        return {"johan"}
+
+    def get_all_files(cancel=None):
+        barrier.wait()
+        return (set(), None)
+
+    monkeypatch.setattr(px_loginhistory, "get_users_at", get_users_at)
+    monkeypatch.setattr(px_file, "get_all_with_warning", get_all_files)
+
+    process = testutils.create_process(pid=1234, commandline="/usr/bin/fluff")
+    process.children = []
+    output_path = tmp_path / "output"
+    with open(output_path, "w") as output:
+        px_processinfo.print_process_info(output.fileno(), process, [process])
+
+    output_text = output_path.read_text()
+    assert "  johan\n" in output_text
+    assert output_text.index("Users logged in when") < output_text.index(
+        "File descriptors:"
+    )
+    assert "file list is incomplete" not in output_text
+
+
+def test_print_process_info_old_executor(tmp_path, monkeypatch):
+    class OldThreadPoolExecutor(concurrent.futures.ThreadPoolExecutor):
+        """
+        Like on Python 3.6-3.8, shutdown() has no cancel_futures parameter.
+        """
+
+        def shutdown(self, wait=True):
+            super().shutdown(wait=wait)
+
+    monkeypatch.setattr(
+        px_processinfo.concurrent.futures, "ThreadPoolExecutor", OldThreadPoolExecutor
+    )
+    monkeypatch.setattr(
+        px_loginhistory, "get_users_at", lambda timestamp, cancel=None: {"johan"}
+    )
+    monkeypatch.setattr(
+        px_file, "get_all_with_warning", lambda cancel=None: (set(), None)
+    )
+
+    process = testutils.create_process(pid=1234, commandline="/usr/bin/fluff")
+    process.children = []
+    output_path = tmp_path / "output"
+    with open(output_path, "w") as output:
+        px_processinfo.print_process_info(output.fileno(), process, [process])
+
+    assert "File descriptors:" in output_path.read_text()
+
+
+def test_print_fds_incomplete(tmp_path, monkeypatch):
+    def get_all_files(cancel=None):
+        return (set(), "lsof timed out after 30s, file list is incomplete")
+
+    monkeypatch.setattr(px_file, "get_all_with_warning", get_all_files)
+
+    process = testutils.create_process(pid=1234, commandline="/usr/bin/fluff")
+    process.children = []
+    output_path = tmp_path / "output"
+    with open(output_path, "w") as output:
+        px_processinfo.print_fds(output.fileno(), process, [process])
+
+    assert "lsof timed out after 30s, file list is incomplete" in (
+        output_path.read_text()
+    )
@@ -0,0 +1,72 @@
+import os
+
+from px import px_processio
+
+from . import testutils
+
+
+def _write_io(proc_root: str, pid: int, read_bytes: int, write_bytes: int) -> None:
+    directory = os.path.join(proc_root, str(pid))
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "io"), "w") as f:
+        f.write(
+            "rchar: 323934931\n"
+            + "wchar: 323929600\n"
+            + "syscr: 632687\n"
+            + "syscw: 632675\n"
+            + f"read_bytes: {read_bytes}\n"
+            + f"write_bytes: {write_bytes}\n"
+            + "cancelled_write_bytes: 0\n"
+        )
+
+
+def test_parse_proc_pid_io():
+    assert px_processio.parse_proc_pid_io("read_bytes: 5\nwrite_bytes: 7\n") == 12
+    assert px_processio.parse_proc_pid_io("read_bytes: 5\n") is None
+    assert px_processio.parse_proc_pid_io("") is None
+
+
+def test_read_process_io(tmp_path):
+    proc_root = str(tmp_path)
+    _write_io(proc_root, 1234, 1000, 24)
+
+    assert px_processio.read_process_io(1234, proc_root) == 1024
+    assert px_processio.read_process_io(1235, proc_root) is None
+
+
+def test_process_io(tmp_path):
+    proc_root = str(tmp_path)
+    _write_io(proc_root, 1, 0, 0)
+    _write_io(proc_root, 2, 1000, 0)
+
+    init = testutils.create_process(pid=1)
+    busy = testutils.create_process(pid=2)
+    secret = testutils.create_process(pid=3)
+    processes = [init, busy, secret]
+
+    process_io = px_processio.ProcessIo(interval_seconds=5, proc_root=proc_root)
+    process_io.update(processes, now=100)
+    process_io.apply(processes)
+
+    # Need two samples to make a metric
+    assert busy.io_bytes_per_second is None
+    assert busy.io_s == "--"
+
+    _write_io(proc_root, 2, 3000, 8000)
+
+    # Too soon, should not sample again
+    process_io.update(processes, now=102)
+    process_io.apply(processes)
+    assert busy.io_bytes_per_second is None
+
+    process_io.update(processes, now=110)
+    process_io.apply(processes)
+    assert init.io_bytes_per_second == 0
+    assert busy.io_bytes_per_second == 1000
+    assert busy.io_s == "1000B/s"
+    assert secret.io_bytes_per_second is None
+
+    # New process with a reused PID
+    reused = testutils.create_process(pid=2, timestring="Mon Apr  7 09:33:11 2010")
+    process_io.apply([reused])
+    assert reused.io_bytes_per_second is None
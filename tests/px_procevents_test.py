@@ -0,0 +1,87 @@
+import os
+import time
+
+from px import px_procevents
+
+from typing import List
+
+
+def _create_proc_entry(proc_root: str, pid: int, stat: str, cmdline: bytes) -> None:
+    os.makedirs(os.path.join(proc_root, str(pid)))
+    with open(os.path.join(proc_root, str(pid), "stat"), "w") as f:
+        f.write(stat)
+    with open(os.path.join(proc_root, str(pid), "cmdline"), "wb") as f:
+        f.write(cmdline)
+
+
+def _netlink_message(what: int, pid: int, tgid: int) -> bytes:
+    event = px_procevents.PROC_EVENT_HEADER.pack(what, 0, 0)
+    event += px_procevents.PROC_EVENT_PIDS.pack(pid, tgid)
+    cn_msg = px_procevents.CN_MSG.pack(1, 1, 0, 0, len(event), 0)
+    length = px_procevents.NLMSGHDR.size + len(cn_msg) + len(event)
+    return px_procevents.NLMSGHDR.pack(length, 3, 0, 0, 0) + cn_msg + event
+
+
+def test_read_exec_event(tmp_path):
+    proc_root = str(tmp_path)
+    _create_proc_entry(
+        proc_root, 1234, "1234 (my (cmd)) S 42 1234 1234 0 -1", b"/bin/ls\0-l\0/tmp\0"
+    )
+
+    event = px_procevents.read_exec_event(1234, 5.0, proc_root)
+    assert event is not None
+    assert event.pid == 1234
+    assert event.ppid == 42
+    assert event.cmdline == "/bin/ls -l /tmp"
+    assert event.command == "ls"
+    assert event.timestamp == 5.0
+
+    # Already gone
+    assert px_procevents.read_exec_event(1235, 5.0, proc_root) is None
+
+
+def test_parse_netlink_message(tmp_path):
+    proc_root = str(tmp_path)
+    _create_proc_entry(proc_root, 100, "100 (sleep) S 1 100 100", b"sleep\x001\0")
+
+    data = _netlink_message(px_procevents.PROC_EVENT_EXEC, 100, 100)
+    data += _netlink_message(px_procevents.PROC_EVENT_EXEC, 101, 100)  # Thread
+    data += _netlink_message(px_procevents.PROC_EVENT_EXEC, 102, 102)  # Gone
+    data += _netlink_message(1, 103, 103)  # Fork
+    data += _netlink_message(px_procevents.PROC_EVENT_EXIT, 100, 100)
+
+    events = px_procevents.parse_netlink_message(data, 7.0, proc_root)
+    assert len(events) == 2
+
+    exec_event = events[0]
+    assert isinstance(exec_event, px_procevents.ExecEvent)
+    assert exec_event.pid == 100
+    assert exec_event.ppid == 1
+    assert exec_event.cmdline == "sleep 1"
+
+    exit_event = events[1]
+    assert isinstance(exit_event, px_procevents.ExitEvent)
+    assert exit_event.pid == 100
+
+
+def test_listener():
+    fake_events: List[px_procevents.ProcEvent] = [
+        px_procevents.ExecEvent(100, 1, "make", 1.0),
+        px_procevents.ExitEvent(100, 2.0),
+    ]
+    listener = px_procevents.ProcEventListener(fake_events)
+    listener.thread.join(timeout=5)
+
+    events = listener.get_events()
+    assert events == fake_events
+
+    # Events are only returned once
+    assert listener.get_events() == []
+
+
+def test_create_listener():
+    # Depending on platform and privileges, this will return either None or a
+    # listener. Either way it should not crash, and not block.
+    t0 = time.time()
+    px_procevents.create_listener()
+    assert time.time() - t0 < 5
@@ -0,0 +1,15 @@
+from px import px_procfs
+
+
+def test_read_proc_file(tmp_path):
+    path = str(tmp_path / "stats")
+    with open(path, "w") as f:
+        f.write("first")
+    assert px_procfs.read_proc_file(path) == "first"
+
+    # The file should be reread from the start on every call
+    with open(path, "w") as f:
+        f.write("second")
+    assert px_procfs.read_proc_file(path) == "second"
+
+    assert px_procfs.read_proc_file(str(tmp_path / "does-not-exist")) is None
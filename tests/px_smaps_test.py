@@ -0,0 +1,80 @@
+import os
+
+from px import px_smaps
+
+from . import testutils
+
+
+def _write_smaps_rollup(
+    proc_root: str, pid: int, pss_kb: int, private_kb: int, swap_kb: int
+) -> None:
+    directory = os.path.join(proc_root, str(pid))
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "smaps_rollup"), "w") as f:
+        f.write(
+            "55d1c3a4b000-7ffd5a1f2000 ---p 00000000 00:00 0    [rollup]\n"
+            + "Rss:                3924 kB\n"
+            + f"Pss:                {pss_kb} kB\n"
+            + "Shared_Clean:       2924 kB\n"
+            + "Shared_Dirty:          0 kB\n"
+            + "Private_Clean:         0 kB\n"
+            + f"Private_Dirty:      {private_kb} kB\n"
+            + f"Swap:               {swap_kb} kB\n"
+        )
+
+
+def test_parse_smaps_rollup():
+    assert px_smaps.parse_smaps_rollup(
+        "Rss: 3924 kB\n"
+        + "Pss: 1021 kB\n"
+        + "Private_Clean: 116 kB\n"
+        + "Private_Dirty: 884 kB\n"
+        + "Swap: 12 kB\n"
+    ) == px_smaps.MemoryDetails(pss_kb=1021, uss_kb=1000, swap_kb=12)
+
+    assert px_smaps.parse_smaps_rollup("Rss: 3924 kB\n") is None
+    assert px_smaps.parse_smaps_rollup("") is None
+
+
+def test_read_smaps_rollup(tmp_path):
+    proc_root = str(tmp_path)
+    _write_smaps_rollup(proc_root, 1234, 1021, 884, 12)
+
+    assert px_smaps.read_smaps_rollup(1234, proc_root) == px_smaps.MemoryDetails(
+        pss_kb=1021, uss_kb=884, swap_kb=12
+    )
+    assert px_smaps.read_smaps_rollup(1235, proc_root) is None
+
+
+def test_process_memory(tmp_path):
+    proc_root = str(tmp_path)
+    _write_smaps_rollup(proc_root, 1, 1000, 500, 0)
+    _write_smaps_rollup(proc_root, 2, 2000, 1500, 100)
+
+    processes = [
+        testutils.create_process(pid=1),
+        testutils.create_process(pid=2),
+        testutils.create_process(pid=3),
+    ]
+
+    process_memory = px_smaps.ProcessMemory(interval_seconds=10, proc_root=proc_root)
+    process_memory.update(processes, now=100.0)
+    process_memory.apply(processes)
+
+    assert processes[0].pss_kb == 1000
+    assert processes[1].uss_kb == 1500
+    assert processes[1].swap_s == "100KB"
+
+    # No smaps_rollup for this one
+    assert processes[2].pss_kb is None
+    assert processes[2].pss_s == "--"
+
+    # Too early for a new sample, the cached values should be used
+    _write_smaps_rollup(proc_root, 1, 3000, 500, 0)
+    process_memory.update(processes, now=105.0)
+    process_memory.apply(processes)
+    assert processes[0].pss_kb == 1000
+
+    process_memory.update(processes, now=110.0)
+    process_memory.apply(processes)
+    assert processes[0].pss_kb == 3000
@@ -1,6 +1,7 @@
 import os
 
 from px import px_terminal
+from px import px_sort_order
 
 from . import testutils
 
@@ -24,6 +25,70 @@ def test_to_screen_lines_unbounded():
     ]
 
 
+def test_to_screen_lines_io():
+    px_terminal._enable_color = False
+    quiet = testutils.create_process(commandline="/usr/bin/fluff 1234")
+    busy = testutils.create_process(commandline="/usr/bin/writer")
+    busy.set_io_bytes_per_second(2048)
+
+    converted = px_terminal.to_screen_lines(
+        [busy, quiet], None, px_sort_order.SortOrder.IO
+    )
+    assert converted == [
+        r"  PID COMMAND USERNAME CPU CPUTIME RAM      IO COMMANDLINE",
+        r"47536 writer  root      0%   0.03s  0% 2048B/s /usr/bin/writer",
+        r"47536 fluff   root      0%   0.03s  0%      -- /usr/bin/fluff 1234",
+    ]
+
+
+def test_to_screen_lines_cgroup():
+    px_terminal._enable_color = False
+    grouped = testutils.create_process(commandline="/usr/bin/dockerd")
+    grouped.set_cgroup("/system.slice/docker.service", "/system.slice/docker.service")
+    ungrouped = testutils.create_process(commandline="/usr/bin/fluff 1234")
+
+    converted = px_terminal.to_screen_lines(
+        [grouped, ungrouped], None, px_sort_order.SortOrder.CGROUP
+    )
+    assert converted == [
+        r"  PID COMMAND USERNAME CPU CPUTIME RAM CGROUP                       COMMANDLINE",
+        r"47536 dockerd root      0%   0.03s  0% /system.slice/docker.service /usr/bin/dockerd",
+        r"47536 fluff   root      0%   0.03s  0% --                           /usr/bin/fluff 1234",
+    ]
+
+
+def test_to_screen_lines_logins():
+    px_terminal._enable_color = False
+    logged_in = testutils.create_process(commandline="/usr/bin/vim")
+    logged_in.set_logins({"johan", "root from 10.1.6.120"})
+    nobody = testutils.create_process(commandline="/usr/bin/fluff 1234")
+
+    converted = px_terminal.to_screen_lines(
+        [logged_in, nobody], None, None, with_logins=True
+    )
+    assert converted == [
+        r"  PID COMMAND USERNAME CPU CPUTIME RAM LOGINS                      COMMANDLINE",
+        r"47536 vim     root      0%   0.03s  0% johan, root from 10.1.6.120 /usr/bin/vim",
+        r"47536 fluff   root      0%   0.03s  0% --                          /usr/bin/fluff 1234",
+    ]
+
+
+def test_to_screen_lines_pss():
+    px_terminal._enable_color = False
+    worker = testutils.create_process(commandline="/usr/bin/worker")
+    worker.set_memory_details(2048, 1024, 0)
+    unknown = testutils.create_process(commandline="/usr/bin/fluff 1234")
+
+    converted = px_terminal.to_screen_lines(
+        [worker, unknown], None, px_sort_order.SortOrder.PSS
+    )
+    assert converted == [
+        r"  PID COMMAND USERNAME CPU CPUTIME RAM    PSS    USS SWAP COMMANDLINE",
+        r"47536 worker  root      0%   0.03s  0% 2048KB 1024KB   0B /usr/bin/worker",
+        r"47536 fluff   root      0%   0.03s  0%     --     --   -- /usr/bin/fluff 1234",
+    ]
+
+
 def test_to_screen_lines_unicode():
     px_terminal._enable_color = False
     procs = [testutils.create_process(commandline="/usr/bin/😀")]
@@ -9,62 +9,6 @@ from px import px_launchcounter
 from . import testutils
 
 
-def test_adjust_cpu_times():
-    now = testutils.local_now()
-
-    current = [
-        px_process.create_kernel_process(now),
-        testutils.create_process(
-            pid=100, cputime="0:10.00", commandline="only in current"
-        ),
-        testutils.create_process(
-            pid=200,
-            cputime="0:20.00",
-            commandline="re-used PID baseline",
-            timestring="Mon May  7 09:33:11 2010",
-        ),
-        testutils.create_process(
-            pid=300, cputime="0:30.00", commandline="relevant baseline"
-        ),
-    ]
-    baseline = {
-        0: (current[0].start_time, 0),
-        200: (current[2].start_time, 2.0),
-        300: (current[3].start_time, 3.0),
-        400: (now, 3.0),
-    }
-
-    actual = px_process.order_best_last(px_top.adjust_cpu_times(baseline, current))
-    expected = px_process.order_best_last(
-        [
-            px_process.create_kernel_process(now),
-            testutils.create_process(
-                pid=100, cputime="0:10.00", commandline="only in current"
-            ),
-            testutils.create_process(
-                pid=200,
-                cputime="0:18.00",
-                commandline="re-used PID baseline",
-                timestring="Mon May  7 09:33:11 2010",
-            ),
-            testutils.create_process(
-                pid=300, cputime="0:27.00", commandline="relevant baseline"
-            ),
-        ]
-    )
-
-    assert actual == expected
-
-
-def test_get_toplist():
-    current = px_process.get_all()
-    baseline = {p.pid: (p.start_time, p.cpu_time_seconds or 0.0) for p in current}
-    toplist = px_top.get_toplist(baseline, px_process.get_all())
-    for process in toplist:
-        assert process.aggregated_cpu_time_seconds is not None
-        assert process.aggregated_cpu_time_s != "--"
-
-
 def test_get_command():
     pipe = os.pipe()
     read, write = pipe
@@ -1,5 +1,6 @@
 import re
 import os
+import itertools
 import random
 import datetime
 
@@ -118,10 +119,15 @@ def create_ipc_map(
     return px_ipc_map.IpcMap(process, all_files, processes, is_root)
 
 
+# PIDs for fake_callchain(), unique so that Launchcounter's call chain cache
+# can tell the processes apart
+_fake_pids = itertools.count(100000)
+
+
 def fake_callchain(*args: str) -> px_process.PxProcess:
     procs = []
     for arg in args:
-        procs.append(create_process(commandline=arg))
+        procs.append(create_process(pid=next(_fake_pids), commandline=arg))
 
     parent = None
     last_proc = None